@@ -2,19 +2,104 @@
 import os
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit
 import argparse
+import asyncio
 import html
 import json
-from PIL import Image
+import io
+import itertools
+import re
+import queue
+import cProfile
+import pstats
+import struct
+import sys
+import gzip
+import time
+import shutil
+import subprocess
+import tempfile
+import hashlib
+import heapq
+import threading
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from html.parser import HTMLParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler, SimpleHTTPRequestHandler
+from PIL import Image, ImageChops, features
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # Optional, .br variants are skipped without it
+
+try:
+    import markdown
+except ImportError:
+    markdown = None  # Optional, the site renders descriptions in the browser without it
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None  # Optional, --watch polls modification times without it
 
 args = argparse.ArgumentParser(description="Builds the keira app and mod files")
 args.add_argument("--build", help="Build json files for mods and apps", action='store_true', default=False)
 args.add_argument("--shortjson", help="Build short json files for mods and apps", action='store_true', default=False)
+args.add_argument("--no-cache", help="Ignore the incremental build cache and rebuild every app and mod", action='store_true', default=False)
+args.add_argument("--icon-sizes", help="Comma separated sizes of the RGB565 device icons, e.g. 32,64,128", default="64")
+args.add_argument("--screen-previews", help="Encoding of the 280x240 RGB565 screenshot previews for the device, or none",
+                  choices=("rle", "palette", "raw", "none"), default="rle")
+args.add_argument("--decode-preview", help="Decode a screenshot preview .bin to a PNG next to it and exit", metavar="PATH", default=None)
+args.add_argument("--http-concurrency", help="Maximum number of HTTP requests in flight at once", type=int, default=16)
+args.add_argument("--dump-catalog", help="Print the items of a binary catalog.bin as JSON and exit", metavar="PATH", default=None)
+args.add_argument("--trace", help="Also write the build spans to build/trace.json in Chrome trace format", action='store_true', default=False)
+args.add_argument("--profile", help="Run the build under cProfile and print the hottest functions (main thread only)", action='store_true', default=False)
+args.add_argument("--page-size", help="Items per page of the site's index pages", type=int, default=12)
+args.add_argument("--device-page-size", help="Items per page of the index pages Keira OS reads", type=int, default=12)
+args.add_argument("--jobs", help="Number of apps/mods to process in parallel (network on threads, images on processes)", type=int, default=1)
+args.add_argument("--watch", help="After building, watch apps/, mods/ and site/ and rebuild what changes (implies --build)", action='store_true', default=False)
+args.add_argument("--serve", help="After building, serve build/ on http://localhost:PORT (implies --build)", action='store_true', default=False)
+args.add_argument("--port", help="Port of the --serve preview server", type=int, default=8000)
+args.add_argument("--offline", help="Validate without network access, using the cached status of remote URLs", action='store_true', default=False)
+args.add_argument("--pretty", help="Indent the JSON output for reading, it is minified by default", action='store_true', default=False)
+args.add_argument("--stream", help="Stream items through the build without keeping them in memory, for very large catalogs", action='store_true', default=False)
+args.add_argument("--dry-run", help="Print which outputs a --build would rebuild and why, without writing anything", action='store_true', default=False)
+args.add_argument("--async", help="Run the build on the asyncio engine, with an item's requests sent before it is processed", dest="async_engine", action='store_true', default=False)
+args.add_argument("--record", help="Save every HEAD/GET response to a fixture directory for --replay (implies --no-cache)", metavar="DIR", default=None)
+args.add_argument("--replay", help="Answer every HEAD/GET from a --record fixture directory on a local server, without network", metavar="DIR", default=None)
+args.add_argument("--replay-latency", help="Delay of every replayed response in ms", type=float, default=0.0)
+args.add_argument("--replay-bandwidth", help="Bandwidth of every replayed response in KB/s, 0 for unlimited", type=float, default=0.0)
 args = args.parse_args()
+if args.dry_run and (args.watch or args.serve or args.stream):
+    sys.exit("error: --dry-run only plans a build, it can't be combined with --watch, --serve or --stream")
+if args.async_engine and (args.stream or not (args.build or args.watch or args.serve or args.dry_run)):
+    sys.exit("error: --async runs the build graph, it needs --build and can't be combined with --stream")
+if args.watch or args.serve or args.dry_run:
+    args.build = True
+if args.record and args.replay:
+    sys.exit("error: --record and --replay can't be combined")
+if args.record:
+    # Cached URL statuses and downloads would skip requests the fixtures then lack
+    args.no_cache = True
+if args.offline and args.build:
+    sys.exit("error: --offline only validates, it can't be combined with --build, --watch or --serve")
+if args.stream and (args.watch or args.trace):
+    sys.exit("error: --stream keeps no built items or spans in memory, it can't be combined with --watch or --trace")
 
 # Global warnings tracker
 build_warnings = []
 
+# Per-thread item context: the item being processed, for metrics, and in parallel
+# workers its warnings, which are merged back into build_warnings in folder order
+_item_context = threading.local()
+
 def add_warning(name, warning_type, message, item_type=None):
     """Add a warning to the global warnings list"""
     warning = {
@@ -24,265 +109,2113 @@ def add_warning(name, warning_type, message, item_type=None):
     }
     if item_type:
         warning["item_type"] = item_type
-    build_warnings.append(warning)
+    getattr(_item_context, 'warnings', build_warnings).append(warning)
     print(f"WARNING [{name}]: {message}")
 
+# With --stream warnings aren't kept in memory, the warnings of every processed
+# item are appended to build/warnings.jsonl and warnings.json is made from it
+WARNINGS_LOG_PATH = "./build/warnings.jsonl"
+_warnings_log = None
+warnings_logged = 0
+
+def record_warnings(warnings) -> None:
+    """Keep the warnings of a processed item for warnings.json, with --stream
+    append them to build/warnings.jsonl right away instead"""
+    global _warnings_log, warnings_logged
+    if not args.stream:
+        build_warnings.extend(warnings)
+        return
+    if _warnings_log is None:
+        os.makedirs("./build", exist_ok=True)
+        _warnings_log = open(WARNINGS_LOG_PATH, 'w', encoding='utf-8')
+    for warning in warnings:
+        _warnings_log.write(json.dumps(warning, ensure_ascii=False) + "\n")
+    _warnings_log.flush()
+    warnings_logged += len(warnings)
+
+# Build stages in report order, and the wall time accumulated in each of them.
+# Every timed block is also kept as a span for build/metrics.json and --trace,
+# spans of other names (e.g. "head" requests) are details nested in a stage.
+BUILD_STAGES = ("parse", "validate", "cache", "download", "image", "write", "index", "output")
+stage_timings = {}
+build_spans = []
+# With --stream only the stage totals of the items in flight are kept, and
+# the SLOWEST_ITEMS slowest finished items
+SLOWEST_ITEMS = 10
+_item_durations = {}
+_slowest_items = []
+_stage_timings_lock = threading.Lock()
+_build_start = time.perf_counter()
+
+@contextmanager
+def timed_stage(stage, **attrs):
+    """Accumulate the time spent inside the block into stage_timings[stage] and
+    record it as a span of the current item. The block can add attributes such
+    as bytes_in, bytes_out or status to the dict it gets."""
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        elapsed = time.perf_counter() - start
+        span = {
+            "stage": stage,
+            "item": getattr(_item_context, 'item', None),
+            "start": round(start - _build_start, 6),
+            "duration": round(elapsed, 6),
+            "thread": threading.current_thread().name,
+        }
+        span.update(attrs)
+        with _stage_timings_lock:
+            stage_timings[stage] = stage_timings.get(stage, 0.0) + elapsed
+            if not args.stream:
+                build_spans.append(span)
+            elif span["item"] and stage in BUILD_STAGES:
+                _item_durations[span["item"]] = _item_durations.get(span["item"], 0.0) + elapsed
+
+def finish_item_timings(key) -> None:
+    """--stream: an item is done, keep its total only if it is one of the slowest"""
+    with _stage_timings_lock:
+        duration = _item_durations.pop(key, None)
+        if duration is not None:
+            heapq.heappush(_slowest_items, (duration, key))
+            if len(_slowest_items) > SLOWEST_ITEMS:
+                heapq.heappop(_slowest_items)
+
+# Process pool for CPU-bound work, images and parsing manifests, only set up by
+# main() when --jobs > 1
+image_pool = None
+
+def process_pool_workers() -> int:
+    return min(max(1, args.jobs), os.cpu_count() or 1)
+
+def run_image_task(func, *func_args):
+    """Run an image function on the process pool if there is one, inline otherwise.
+    The first argument is the source image, the function returns a dict with the
+    bytes written."""
+    with timed_stage("image", file=os.path.basename(func_args[0])) as span:
+        span["bytes_in"] = os.path.getsize(func_args[0])
+        if image_pool is None:
+            result = func(*func_args)
+        else:
+            result = image_pool.submit(func, *func_args).result()
+        span["bytes_out"] = result["bytes"] if result else 0
+        return result
+
+# Shared HTTP client: one pooled keep-alive session with timeouts and retries,
+# and a global limit on the number of requests in flight
+HTTP_TIMEOUT = (5, 30)  # Connect and read timeouts in seconds
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5  # Retries wait 0.5s, 1s, 2s...
+HTTP_POOL_SIZE = 8  # Keep-alive connections kept per host
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_http_semaphore = threading.BoundedSemaphore(max(1, args.http_concurrency))
+# HEAD responses are memoized for the run, validation, the build cache and
+# downloads all ask about the same URLs. With --stream only the most recent
+# ones, an item asks about its URLs while it is being processed.
+HEAD_CACHE_STREAM_SIZE = 1024
+_head_cache = {}
+_head_cache_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            retry = Retry(total=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF,
+                          status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset({"HEAD", "GET"}), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=HTTP_POOL_SIZE, pool_block=True, max_retries=retry)
+            _http_session = requests.Session()
+            _http_session.mount("http://", adapter)
+            _http_session.mount("https://", adapter)
+        return _http_session
+
+def http_request(method, url, **kwargs) -> requests.Response:
+    """Send a request through the shared session, respecting --http-concurrency.
+    With --record the response is saved as a fixture, with --replay it comes
+    from the local fixture server."""
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    if args.record:
+        # Fixtures hold complete responses, the replay server answers conditional and Range requests itself
+        kwargs["headers"] = {name: value for name, value in (kwargs.get("headers") or {}).items()
+                             if name.lower() not in FIXTURE_UNCONDITIONAL_HEADERS}
+    request_url = replay_url(url) if _replay_origin else url
+    with _http_semaphore:
+        response = get_http_session().request(method, request_url, **kwargs)
+    if args.record:
+        record_fixture(method, url, response)
+    return response
+
+def http_head(url) -> requests.Response:
+    """HEAD a URL following redirects, each URL is only requested once per run"""
+    with _head_cache_lock:
+        if url in _head_cache:
+            return _head_cache[url]
+    with timed_stage("head", url=url) as span:
+        response = http_request("HEAD", url, allow_redirects=True)
+        span["status"] = response.status_code
+    with _head_cache_lock:
+        _head_cache[url] = response
+        if args.stream and len(_head_cache) > HEAD_CACHE_STREAM_SIZE:
+            del _head_cache[next(iter(_head_cache))]
+    record_url_status(url, response.status_code)
+    return response
+
+def url_statuses(urls) -> dict:
+    """Status codes of many URLs, from the URL status cache where possible and
+    with concurrent HEAD requests otherwise. Maps each URL to its status code,
+    the exception raised while requesting it, or with --offline to None when
+    it was never checked."""
+    statuses = {url: cached_url_status(url) for url in urls}
+    unchecked = [url for url, status in statuses.items() if status is None]
+    if args.offline or not unchecked:
+        return statuses
+
+    item = getattr(_item_context, 'item', None)
+
+    def head(url):
+        _item_context.item = item
+        try:
+            return http_head(url).status_code
+        except Exception as e:
+            return e
+
+    if len(unchecked) == 1:
+        statuses.update({url: head(url) for url in unchecked})
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(unchecked), max(1, args.http_concurrency))) as pool:
+            statuses.update(zip(unchecked, pool.map(head, unchecked)))
+    return statuses
+
+# Recorded HTTP fixtures: --record saves the final response of every HEAD/GET
+# to <DIR>/index.json, keyed by "<METHOD> <URL>", with the bodies stored by
+# sha256 in <DIR>/bodies/. --replay serves them from a local stand-in for the
+# remote servers, with ETag/Last-Modified conditional GETs and Range requests
+# answered like GitHub does, so builds can be timed without network.
+FIXTURES_VERSION = 1
+FIXTURE_UNCONDITIONAL_HEADERS = ("if-none-match", "if-modified-since", "range", "if-range")
+# The recorded body is decoded and complete, the replay server sends its own framing
+FIXTURE_DROPPED_HEADERS = ("connection", "keep-alive", "transfer-encoding", "content-encoding", "content-length",
+                           "date", "server", "set-cookie")
+FIXTURE_CHUNK_SIZE = 16 * 1024
+
+fixtures = {"version": FIXTURES_VERSION, "responses": {}}
+_fixtures_lock = threading.Lock()
+_fixture_stats = {"recorded": 0, "replayed": 0, "missing": 0}
+_replay_origin = None
+
+def fixture_body_path(directory, sha256) -> str:
+    return os.path.join(directory, "bodies", sha256)
+
+def load_fixtures(directory) -> None:
+    """Load the fixture index of directory, to replay it or to add to it"""
+    global fixtures
+    path = os.path.join(directory, "index.json")
+    if not os.path.exists(path):
+        if args.replay:
+            sys.exit(f"error: {path} not found, record fixtures with --record {directory} first")
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get("version") != FIXTURES_VERSION:
+        sys.exit(f"error: {path} was recorded by an incompatible build.py, record it again")
+    fixtures = index
+
+def save_fixtures() -> None:
+    if not args.record:
+        return
+    os.makedirs(args.record, exist_ok=True)
+    with _fixtures_lock:
+        write_json(os.path.join(args.record, "index.json"), fixtures)
+        print(f"Recorded {_fixture_stats['recorded']} responses to {args.record}, "
+              f"{len(fixtures['responses'])} in total")
+
+def record_fixture(method, url, response) -> None:
+    """Save response, already read to the end for a GET, as the fixture of method and url"""
+    headers = {name: value for name, value in response.headers.items() if name.lower() not in FIXTURE_DROPPED_HEADERS}
+    entry = {"status": response.status_code, "headers": headers, "body": None}
+    if method == "GET":
+        body = response.content
+        entry["body"] = hashlib.sha256(body).hexdigest()
+        body_path = fixture_body_path(args.record, entry["body"])
+        if not os.path.exists(body_path):
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            write_bytes(body_path, body)
+    elif "Content-Encoding" not in response.headers and "Content-Length" in response.headers:
+        entry["size"] = int(response.headers["Content-Length"])
+    with _fixtures_lock:
+        fixtures["responses"][f"{method} {url}"] = entry
+        _fixture_stats["recorded"] += 1
+
+def replay_url(url) -> str:
+    """URL of url on the fixture server: <origin>/<scheme>/<host><path>"""
+    parts = urlsplit(url)
+    return f"{_replay_origin}/{parts.scheme}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+class FixtureRequestHandler(BaseHTTPRequestHandler):
+    """Answers HEAD/GET requests rewritten by replay_url from the recorded
+    fixtures, delayed by --replay-latency and throttled to --replay-bandwidth"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *log_args):
+        pass
+
+    def respond(self, method):
+        scheme, _, rest = self.path.lstrip("/").partition("/")
+        url = f"{scheme}://{rest}"
+        with _fixtures_lock:
+            entry = fixtures["responses"].get(f"{method} {url}")
+            if entry is None and method == "HEAD":
+                entry = fixtures["responses"].get(f"GET {url}")
+            _fixture_stats["replayed" if entry else "missing"] += 1
+        if args.replay_latency:
+            time.sleep(args.replay_latency / 1000)
+        if entry is None:
+            print(f"Replay: no fixture for {method} {url}, answering 404")
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        status, headers = entry["status"], entry["headers"]
+        body, size = b"", entry.get("size", 0)
+        if entry["body"] is not None:
+            body_path = fixture_body_path(args.replay, entry["body"])
+            size = os.path.getsize(body_path)
+            if method == "GET":
+                with open(body_path, 'rb') as f:
+                    body = f.read()
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        if status == 200:
+            if etag and self.headers.get("If-None-Match") == etag or \
+                    last_modified and self.headers.get("If-Modified-Since") == last_modified:
+                status, body, size = 304, b"", 0
+            elif self.headers.get("Range", "").startswith("bytes=") and \
+                    self.headers.get("If-Range") in (None, etag, last_modified):
+                start = int(self.headers["Range"][len("bytes="):].split("-")[0] or 0)
+                if start < size:
+                    headers = {**headers, "Content-Range": f"bytes {start}-{size - 1}/{size}"}
+                    status, body, size = 206, body[start:], size - start
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        if method == "GET":
+            self.send_body(body)
+
+    def send_body(self, body):
+        bytes_per_second = args.replay_bandwidth * 1024
+        for start in range(0, len(body), FIXTURE_CHUNK_SIZE):
+            chunk = body[start:start + FIXTURE_CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if bytes_per_second:
+                time.sleep(len(chunk) / bytes_per_second)
+
+    def do_HEAD(self):
+        self.respond("HEAD")
+
+    def do_GET(self):
+        self.respond("GET")
+
+def start_replay_server() -> ThreadingHTTPServer:
+    """Serve the fixtures of --replay on a free local port and send every request there"""
+    global _replay_origin
+    load_fixtures(args.replay)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _replay_origin = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Replaying {len(fixtures['responses'])} recorded responses from {args.replay} on {_replay_origin}")
+    return server
+
+# Incremental build cache, maps "<type>s/<path>" to the fingerprint of the
+# inputs the item was last built from
+CACHE_DIR = "./build/.cache"
+BUILD_STATE_PATH = os.path.join(CACHE_DIR, "state.json")
+BUILD_CACHE_VERSION = 4  # Bump when the output format changes to force a rebuild
+
+previous_build_state = {}
+# "nodes" has the inputs of every build graph node, see BuildGraph
+build_state = {"version": BUILD_CACHE_VERSION, "build_script": None, "options": {}, "nodes": {}, "downloads": {}, "images": {}}
+_build_state_lock = threading.Lock()
+
+def hash_file(path):
+    """SHA-256 of a file's content"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def load_build_state():
+    """Load the state of the previous build, unless it is unusable or --no-cache is set"""
+    global previous_build_state
+    build_state["build_script"] = hash_file(__file__)
+    build_state["options"] = {"icon_sizes": ICON_SIZES, "pretty": args.pretty, "screen_previews": args.screen_previews,
+                              "markdown": markdown.__version__ if markdown is not None else None}
+    if args.no_cache or not os.path.exists(BUILD_STATE_PATH):
+        return
+    try:
+        with open(BUILD_STATE_PATH, 'r') as f:
+            state = json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not read build cache, rebuilding everything: {e}")
+        return
+    if state.get("version") != BUILD_CACHE_VERSION:
+        return
+    # Downloaded files only depend on the remote server, keep their validators
+    build_state["downloads"] = dict(state.get("downloads", {}))
+    # Any change to build.py itself or to its output options may change the output, so start over
+    if all(state.get(key) == build_state[key] for key in ("version", "build_script", "options")):
+        previous_build_state = state
+        build_state["images"] = dict(state.get("images", {}))
+
+def save_build_state():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with _build_state_lock:
+        build_state["images"] = {outputs: image for outputs, image in build_state["images"].items()
+                                 if all(os.path.exists(path) for path in outputs.split("|"))}
+        # json.dumps encodes in C, json.dump to a file and indent don't
+        with open(BUILD_STATE_PATH, 'w') as f:
+            f.write(json.dumps(build_state, sort_keys=True, separators=(',', ':')))
+
+# Persistent status of the URLs validation checks, shared between runs so that
+# existing URLs are not requested again until their entry expires
+URL_CACHE_PATH = os.path.join(CACHE_DIR, "urls.json")
+URL_CACHE_VERSION = 1
+URL_OK_TTL = 24 * 3600  # seconds
+URL_NOT_FOUND_TTL = 3600
+URL_CACHED_STATUSES = (404, 410)  # Besides success, other errors may be temporary
+
+url_cache = {"version": URL_CACHE_VERSION, "urls": {}}
+_url_cache_lock = threading.Lock()
+
+def load_url_cache():
+    global url_cache
+    if args.no_cache or not os.path.exists(URL_CACHE_PATH):
+        return
+    try:
+        with open(URL_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not read URL status cache: {e}")
+        return
+    if cache.get("version") == URL_CACHE_VERSION:
+        url_cache = cache
+
+def save_url_cache():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with _url_cache_lock:
+        with open(URL_CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(url_cache, f, indent=2, sort_keys=True)
+
+def record_url_status(url, status) -> None:
+    if status < 400 or status in URL_CACHED_STATUSES:
+        with _url_cache_lock:
+            url_cache["urls"][url] = {"status": status, "checked": int(time.time())}
+
+def cached_url_status(url):
+    """Status code of url from the URL status cache, None if it is not there or
+    expired. With --offline entries never expire."""
+    with _url_cache_lock:
+        entry = url_cache["urls"].get(url)
+    if entry is None:
+        return None
+    ttl = URL_OK_TTL if entry["status"] < 400 else URL_NOT_FOUND_TTL
+    if args.offline or time.time() - entry["checked"] < ttl:
+        return entry["status"]
+    return None
+
+# Manifest loading: libyaml when it is installed, and a cache of parsed manifests
+# keyed by mtime and size, so unchanged manifest.yml files skip YAML entirely.
+# The cache holds every manifest, --stream doesn't use it.
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+MANIFEST_CACHE_PATH = os.path.join(CACHE_DIR, "manifests.json")
+MANIFEST_CACHE_VERSION = 1
+
+manifest_cache = {"version": MANIFEST_CACHE_VERSION, "manifests": {}}
+_manifest_cache_lock = threading.Lock()
+
+def load_manifest_cache():
+    global manifest_cache
+    if args.no_cache or args.stream or not os.path.exists(MANIFEST_CACHE_PATH):
+        return
+    try:
+        with open(MANIFEST_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not read manifest cache: {e}")
+        return
+    if cache.get("version") == MANIFEST_CACHE_VERSION:
+        manifest_cache = cache
+
+def save_manifest_cache():
+    if args.stream:
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with _manifest_cache_lock:
+        # Forget manifests that no longer exist
+        manifest_cache["manifests"] = {path: entry for path, entry in manifest_cache["manifests"].items()
+                                       if os.path.exists(path)}
+        with open(MANIFEST_CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(manifest_cache, f, ensure_ascii=False, separators=(',', ':'))
+
+def parse_manifest_file(manifest_path):
+    """Parsed content of a manifest.yml, from the manifest cache if the file is unchanged"""
+    stat = os.stat(manifest_path)
+    with _manifest_cache_lock:
+        entry = manifest_cache["manifests"].get(manifest_path)
+    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        # Stored as JSON text, so every caller gets its own copy to modify
+        return json.loads(entry["json"])
+
+    data, entry = load_manifest_file(manifest_path)
+    cache_manifest(manifest_path, entry)
+    return data
+
+def load_manifest_file(manifest_path) -> tuple:
+    """Parse a manifest.yml, returns its content and its manifest cache entry,
+    None if it can't be cached"""
+    stat = os.stat(manifest_path)
+    with open(manifest_path, 'rb') as file:
+        data = yaml.load(file, Loader=YAML_LOADER)
+
+    # Only cache manifests that survive a round trip through JSON (no dates, no non-string keys)
+    try:
+        text = json.dumps(data, ensure_ascii=False)
+        cacheable = json.loads(text) == data
+    except (TypeError, ValueError):
+        cacheable = False
+    return data, {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "json": text} if cacheable else None
+
+def cache_manifest(manifest_path, entry) -> None:
+    if entry is not None and not args.stream:
+        with _manifest_cache_lock:
+            manifest_cache["manifests"][manifest_path] = entry
+
+MANIFEST_FIELDS = ("name", "keira_version", "description", "short_description", "changelog", "author",
+                   "icon", "sources", "screenshots", "executionfile", "modfiles",
+                   "path", "icon_min", "icon_min_sizes", "blobs", "images")
+# Text fields that may be given as "@FILE.md", relative to the item folder
+MANIFEST_FILE_FIELDS = ("description", "short_description", "changelog")
+
+def _file_field(field):
+    """Property for a text field that reads its @file reference on first access"""
+    def get(self):
+        if field in self._pending:
+            self._pending.discard(field)
+            try:
+                with open(os.path.join(self.folder, self.references[field]), 'r', encoding='utf-8') as file:
+                    setattr(self, "_" + field, file.read())
+            except Exception as e:
+                add_warning(self.src, "file_read_error", f"Failed to read {field} file: {str(e)}", self.type)
+                setattr(self, "_" + field, "")
+        return getattr(self, "_" + field)
+
+    def set(self, value):
+        self._pending.discard(field)
+        setattr(self, "_" + field, value)
+    return property(get, set)
+
+class Manifest:
+    """A parsed manifest.yml. Known fields are attributes (None when absent),
+    any other key is kept in extra. Also supports the dict operations the build
+    uses (get, [], in, setdefault), absent fields behave like missing keys."""
+    __slots__ = tuple(field for field in MANIFEST_FIELDS if field not in MANIFEST_FILE_FIELDS) + \
+        tuple("_" + field for field in MANIFEST_FILE_FIELDS) + ("extra", "folder", "src", "type", "references", "_pending")
+
+    description = _file_field("description")
+    short_description = _file_field("short_description")
+    changelog = _file_field("changelog")
+
+    def __init__(self, data, folder, src, type):
+        self.folder = folder
+        self.src = src
+        self.type = type
+        self.extra = {}
+        # @file references by field, and the ones that were not read yet
+        self.references = {}
+        self._pending = set()
+        for field in MANIFEST_FIELDS:
+            setattr(self, field, None)
+        for key, value in data.items():
+            if key in MANIFEST_FILE_FIELDS and isinstance(value, str) and value.startswith('@'):
+                self.references[key] = value[1:]
+                self._pending.add(key)
+            elif key in MANIFEST_FIELDS:
+                setattr(self, key, value)
+            else:
+                self.extra[key] = value
+
+    def __getitem__(self, key):
+        value = getattr(self, key) if key in MANIFEST_FIELDS else self.extra[key]
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in MANIFEST_FIELDS:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        if key in MANIFEST_FIELDS:
+            return key in self._pending or getattr(self, key) is not None
+        return key in self.extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def to_dict(self, resolve=True) -> dict:
+        """The manifest as a plain dict. Unless resolve is set, unread @file
+        references are kept as they were written."""
+        data = dict(self.extra)
+        for field in MANIFEST_FIELDS:
+            if not resolve and field in self._pending:
+                data[field] = "@" + self.references[field]
+            elif field in self:
+                data[field] = getattr(self, field)
+        return data
+
+def is_remote(path) -> bool:
+    return path.startswith('http://') or path.startswith('https://')
+
+def item_remote_urls(manifest, type) -> list[str]:
+    """All remote files that end up in the item's static folder"""
+    urls = []
+    if type == "app" and manifest.get('executionfile'):
+        location = manifest['executionfile']['location']
+        urls.append(location['origin'] if isinstance(location, dict) else location)
+    elif type == "mod" and manifest.get('modfiles'):
+        for file in manifest['modfiles']:
+            location = file['location']
+            urls.append(location['origin'] if isinstance(location, dict) else location)
+    urls += [screenshot for screenshot in manifest.get('screenshots', []) if is_remote(screenshot)]
+    if manifest.get('icon') and is_remote(manifest['icon']):
+        urls.append(manifest['icon'])
+    return urls
+
+def remote_validator(url):
+    """ETag or Last-Modified of a remote file, None if the server sends neither"""
+    response = http_head(url)
+    if response.status_code >= 400:
+        return None
+    return response.headers.get('ETag') or response.headers.get('Last-Modified')
+
+def item_inputs(manifest, type) -> dict:
+    """Everything an item's build output depends on, as the inputs of its build
+    graph node: a hash of the parsed manifest, of the files it references with
+    @file and of the local icon and screenshots, and the validators of its remote
+    files, None when the server sends neither ETag nor Last-Modified."""
+    inputs = {"manifest.yml": hashlib.sha256(json.dumps(manifest.to_dict(resolve=False), sort_keys=True,
+                                                        default=str).encode('utf-8')).hexdigest()}
+
+    path_to_modapp = os.path.join(type+"s", manifest['path'])
+    local_files = list(manifest.references.values())
+    local_files += [s for s in manifest.get('screenshots', []) if not is_remote(s)]
+    if manifest.get('icon') and not is_remote(manifest['icon']):
+        local_files.append(manifest['icon'])
+    for local_file in local_files:
+        local_path = os.path.join(path_to_modapp, local_file)
+        inputs[local_file] = hash_file(local_path) if os.path.exists(local_path) else "-"
+
+    for url in item_remote_urls(manifest, type):
+        try:
+            inputs[url] = remote_validator(url)
+        except Exception:
+            inputs[url] = None
+    return inputs
+
+def node_stale_reason(name, inputs, outputs=()):
+    """Why a build graph node has to run, None if the outputs of its previous
+    run can be reused: its inputs are compared with the ones it was built from"""
+    with _build_state_lock:
+        previous = build_state["nodes"].get(name, previous_build_state.get("nodes", {}).get(name))
+    if previous is None:
+        return "no record of its last build" if previous_build_state else "no usable build cache"
+    unknown = sorted(key for key, value in inputs.items() if value is None)
+    if unknown:
+        return f"no ETag or Last-Modified to compare for {unknown[0]}"
+    changed = sorted(key for key in inputs.keys() | previous.keys() if inputs.get(key) != previous.get(key))
+    if changed:
+        return "changed: " + ", ".join(changed[:3]) + (f" and {len(changed) - 3} more" if len(changed) > 3 else "")
+    missing = next((path for path in outputs if not os.path.exists(path)), None)
+    if missing is not None:
+        return f"missing {os.path.relpath(missing)}"
+    return None
+
+def record_node(name, inputs) -> None:
+    """Remember the inputs a node was built from, for the next build"""
+    if any(value is None for value in inputs.values()):
+        return
+    with _build_state_lock:
+        build_state["nodes"][name] = inputs
+
+def forget_nodes(names) -> None:
+    """Make the next build run nodes whose outputs were rewritten outside the
+    build graph, e.g. by --watch"""
+    with _build_state_lock:
+        for name in names:
+            build_state["nodes"][name] = None
+
+# Folders of build/apps and build/mods that belong to the indexes, not to an item
+INDEX_OUTPUT_DIRS = ("pages", "search")
+
+def stale_item_outputs(kept) -> list[str]:
+    """The item folders of build/, as type+"s/"+item, that are not in kept: left
+    from items that were deleted or no longer pass validation"""
+    stale = []
+    for type in ("app", "mod"):
+        output_dir = os.path.join("./build", type+"s")
+        if not os.path.isdir(output_dir):
+            continue
+        for name in sorted(os.listdir(output_dir)):
+            key = type+"s/"+name
+            if key not in kept and name not in INDEX_OUTPUT_DIRS and os.path.isdir(os.path.join(output_dir, name)):
+                stale.append(key)
+    return stale
+
+def remove_item_outputs(keys) -> None:
+    """Remove the output folders of items that are no longer built, so they
+    drop out of assets.json and are not published anymore"""
+    for key in keys:
+        if os.path.isdir(os.path.join("./build", key)):
+            print(f"Removing build/{key}: the item is no longer built")
+            shutil.rmtree(os.path.join("./build", key), ignore_errors=True)
+
+def item_outputs(key, type) -> list[str]:
+    output_dir = os.path.join("./build", key)
+    return [os.path.join(output_dir, 'index.json')] + \
+        ([os.path.join(output_dir, 'index_short.json')] if type == "app" else [])
+
+def load_item_output(key) -> dict:
+    """The index.json data of an item's previous output, None if it can't be
+    reused because a blob it refers to is no longer in the blob store"""
+    try:
+        with open(os.path.join("./build", key, 'index.json'), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception:
+        return None
+    if not all(os.path.exists(os.path.join(BLOBS_DIR, blob)) for blob in data.get("blobs", {}).values()):
+        return None
+    return data
+
 # Maximum dimensions for images (width, height)
 MAX_IMAGE_WIDTH = 1920
 MAX_IMAGE_HEIGHT = 1080
 MAX_ICON_SIZE = 512
 MIN_ICON_SIZE = 64  # For ESP32-S3 display
+ICON_SIZES = sorted({int(size) for size in args.icon_sizes.split(',') if size.strip()})
 JPEG_QUALITY = 85
 
-def generate_min_icon(icon_path, output_path):
-    """Generate 64x64 minimized icon for ESP32-S3 in RGB565 binary format"""
-    try:
-        with Image.open(icon_path) as img:
-            # Convert to RGB if needed
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                if img.mode in ('RGBA', 'LA'):
-                    background.paste(img, mask=img.split()[-1])
-                else:
-                    background.paste(img)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize to 64x64
-            img_resized = img.resize((MIN_ICON_SIZE, MIN_ICON_SIZE), Image.Resampling.LANCZOS)
-            
-            # Convert to RGB565 binary format
-            pixels = img_resized.load()
-            rgb565_data = bytearray()
-            
-            for y in range(MIN_ICON_SIZE):
-                for x in range(MIN_ICON_SIZE):
-                    r, g, b = pixels[x, y]
-                    # Convert RGB888 to RGB565
-                    r5 = (r >> 3) & 0x1F
-                    g6 = (g >> 2) & 0x3F
-                    b5 = (b >> 3) & 0x1F
-                    rgb565 = (r5 << 11) | (g6 << 5) | b5
-                    # Write as little-endian 16-bit value
-                    rgb565_data.append(rgb565 & 0xFF)
-                    rgb565_data.append((rgb565 >> 8) & 0xFF)
-            
-            # Save binary file
-            with open(output_path, 'wb') as f:
-                f.write(rgb565_data)
-            
-            print(f"  Generated min icon: {output_path} (64x64 RGB565, {len(rgb565_data)} bytes)")
-    except Exception as e:
-        print(f"  Warning: Could not generate min icon: {e}")
+# Responsive variants for the site's srcset: screenshots and icons are also
+# written at these widths (never upscaled) in every modern format this Pillow
+# can encode, the web image written as before stays the fallback
+SCREENSHOT_VARIANT_WIDTHS = (320, 960, 1920)
+ICON_VARIANT_WIDTHS = (160, 320, 512)
+IMAGE_VARIANT_FORMATS = [(extension, mime_type, options) for extension, mime_type, options in (
+    ("avif", "image/avif", {"quality": 55, "speed": 10}),
+    ("webp", "image/webp", {"quality": 80, "method": 4}),
+) if features.check(extension)]
+
+def flatten_to_rgb(img):
+    """Convert an image to RGB, compositing any transparency onto white"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        if img.mode in ('RGBA', 'LA'):
+            background.paste(img, mask=img.split()[-1])
+        else:
+            background.paste(img)
+        return background
+    elif img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+def rgb_to_rgb565(img) -> bytes:
+    """Encode an RGB image as little-endian RGB565 (RRRRRGGG GGGBBBBB, low byte first)"""
+    r, g, b = img.split()
+    # The bit fields of each byte don't overlap, so adding them is a bitwise or
+    low = ImageChops.add(g.point(lambda v: (v << 3) & 0xE0), b.point(lambda v: v >> 3))
+    high = ImageChops.add(r.point(lambda v: v & 0xF8), g.point(lambda v: v >> 5))
+    return Image.merge('LA', (low, high)).tobytes()
+
+def encode_min_icons(images, size=MIN_ICON_SIZE) -> list[bytes]:
+    """Resize many icons to size x size and encode them to RGB565 in one pass.
+    Accepts PIL images or paths, returns the raw bytes of each icon in order."""
+    if not images:
+        return []
+    # Stack the icons into one tall strip so the conversion runs once for the batch
+    strip = Image.new('RGB', (size, size * len(images)))
+    for i, image in enumerate(images):
+        if isinstance(image, Image.Image):
+            icon = flatten_to_rgb(image).resize((size, size), Image.Resampling.LANCZOS)
+        else:
+            with Image.open(image) as img:
+                icon = flatten_to_rgb(img).resize((size, size), Image.Resampling.LANCZOS)
+        strip.paste(icon, (0, size * i))
+    data = rgb_to_rgb565(strip)
+    icon_bytes = size * size * 2
+    return [data[i * icon_bytes:(i + 1) * icon_bytes] for i in range(len(images))]
+
+def min_icon_name(icon, size=MIN_ICON_SIZE) -> str:
+    """File name of the RGB565 icon, the default size keeps the historical name"""
+    icon_name = os.path.splitext(icon)[0]
+    if size == MIN_ICON_SIZE:
+        return f"{icon_name}_min.bin"
+    return f"{icon_name}_min_{size}.bin"
+
+# Screenshot previews for the Lilka display: each screenshot fitted into the
+# screen, letterboxed in black, as RGB565. All integers are little-endian.
+#
+#   header   magic "LKS1", u16 width, u16 height, u8 encoding, u8 reserved,
+#            u16 palette colors, u32 payload size
+#   raw      width*height RGB565 pixels
+#   rle      runs of pixels: a control byte n < 128 is followed by n+1 literal
+#            RGB565 pixels, n >= 128 by one RGB565 pixel repeated n-126 times
+#   palette  palette colors RGB565 values, then one u8 palette index per pixel
+SCREEN_WIDTH = 280
+SCREEN_HEIGHT = 240
+SCREEN_PREVIEW_MAGIC = b"LKS1"
+SCREEN_PREVIEW_HEADER = struct.Struct("<4sHHBBHI")
+SCREEN_PREVIEW_ENCODINGS = {"raw": 0, "rle": 1, "palette": 2}
+SCREEN_PREVIEW_ENCODING = None if args.screen_previews == "none" else args.screen_previews
+# Key order of what index.json records about a preview, see IMAGE_VARIANT_KEYS
+SCREEN_PREVIEW_KEYS = ("width", "height", "encoding", "bytes", "decoded_bytes")
+
+def screen_preview_name(screenshot) -> str:
+    return f"{os.path.splitext(screenshot)[0]}_screen.bin"
+
+def rgb565_to_rgb(data, width, height):
+    """Decode little-endian RGB565 pixels to an RGB image, the inverse of rgb_to_rgb565
+    with the low bits of each channel filled from its high bits"""
+    low, high = Image.frombytes('LA', (width, height), bytes(data)).split()
+    r = high.point(lambda v: (v & 0xF8) | (v >> 5))
+    g6 = ImageChops.add(high.point(lambda v: (v & 0x07) << 3), low.point(lambda v: v >> 5))
+    g = g6.point(lambda v: (v << 2) | (v >> 4))
+    b = low.point(lambda v: ((v & 0x1F) << 3) | ((v & 0x1F) >> 2))
+    return Image.merge('RGB', (r, g, b))
+
+def rle_encode_rgb565(data) -> bytes:
+    """Run-length encode RGB565 pixels, see the format above. Repeating a pixel
+    pays off from 2 pixels on, the worst case adds 1 byte per 128 pixels."""
+    pixels = struct.unpack(f"<{len(data) // 2}H", data)
+    output = bytearray()
+    literal = []
+
+    def flush_literal():
+        for start in range(0, len(literal), 128):
+            chunk = literal[start:start + 128]
+            output.append(len(chunk) - 1)
+            output.extend(struct.pack(f"<{len(chunk)}H", *chunk))
+        literal.clear()
+
+    for value, run in itertools.groupby(pixels):
+        count = sum(1 for _ in run)
+        if count == 1:
+            literal.append(value)
+            continue
+        flush_literal()
+        while count >= 2:
+            repeat = min(count, 129)
+            output.append(repeat + 126)
+            output.extend(struct.pack("<H", value))
+            count -= repeat
+        if count:
+            literal.append(value)
+    flush_literal()
+    return bytes(output)
+
+def rle_decode_rgb565(payload) -> bytes:
+    output = bytearray()
+    i = 0
+    while i < len(payload):
+        control = payload[i]
+        if control < 128:
+            output += payload[i + 1:i + 1 + 2 * (control + 1)]
+            i += 1 + 2 * (control + 1)
+        else:
+            output += payload[i + 1:i + 3] * (control - 126)
+            i += 3
+    return bytes(output)
+
+def palettize_rgb565(img):
+    """Palette of up to 256 RGB565 colors and one index per pixel. Exact when the
+    image has no more colors than that in RGB565, quantized otherwise."""
+    screen = rgb565_to_rgb(rgb_to_rgb565(img), *img.size)
+    colors = screen.getcolors(256)
+    if colors is not None:
+        palette_image = Image.new('P', (1, 1))
+        palette_image.putpalette([channel for _, color in colors for channel in color])
+        indexed = screen.quantize(palette=palette_image, dither=Image.Dither.NONE)
+        palette = [color for _, color in colors]
+    else:
+        indexed = screen.quantize(256, dither=Image.Dither.NONE)
+        flat = indexed.getpalette()[:3 * 256]
+        palette = [tuple(flat[i:i + 3]) for i in range(0, len(flat), 3)]
+    rgb565 = [((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3) for r, g, b in palette]
+    return rgb565, indexed.tobytes()
+
+def encode_screen_preview(img, encoding) -> bytes:
+    """Fit an image into the screen and encode it as a screenshot preview file"""
+    screen = Image.new('RGB', (SCREEN_WIDTH, SCREEN_HEIGHT))
+    fitted = flatten_to_rgb(img)
+    if fitted.size != screen.size:
+        fitted = fitted.copy()
+        fitted.thumbnail(screen.size, Image.Resampling.LANCZOS)
+    screen.paste(fitted, ((SCREEN_WIDTH - fitted.width) // 2, (SCREEN_HEIGHT - fitted.height) // 2))
+
+    colors = 0
+    if encoding == "palette":
+        palette, indexes = palettize_rgb565(screen)
+        colors = len(palette)
+        payload = struct.pack(f"<{colors}H", *palette) + indexes
+    elif encoding == "rle":
+        payload = rle_encode_rgb565(rgb_to_rgb565(screen))
+    else:
+        payload = rgb_to_rgb565(screen)
+    return SCREEN_PREVIEW_HEADER.pack(SCREEN_PREVIEW_MAGIC, SCREEN_WIDTH, SCREEN_HEIGHT,
+                                      SCREEN_PREVIEW_ENCODINGS[encoding], 0, colors, len(payload)) + payload
+
+def write_screen_preview(img, output_path, encoding) -> dict:
+    """Write the screenshot preview of an image, returns what index.json records about it"""
+    data = encode_screen_preview(img, encoding)
+    write_bytes(output_path, data)
+    raw_size = SCREEN_WIDTH * SCREEN_HEIGHT * 2
+    print(f"  Generated screen preview: {output_path} ({SCREEN_WIDTH}x{SCREEN_HEIGHT} RGB565 {encoding}, "
+          f"{len(data)} bytes, {raw_size} bytes raw)")
+    return {"width": SCREEN_WIDTH, "height": SCREEN_HEIGHT, "encoding": encoding,
+            "bytes": len(data), "decoded_bytes": raw_size}
+
+def read_screen_preview(path) -> tuple:
+    """Reference decoder for screenshot previews, returns (width, height, RGB565 pixels)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, width, height, encoding, _, colors, size = SCREEN_PREVIEW_HEADER.unpack_from(data, 0)
+    if magic != SCREEN_PREVIEW_MAGIC:
+        raise ValueError(f"Not a screenshot preview: {path}")
+    payload = data[SCREEN_PREVIEW_HEADER.size:SCREEN_PREVIEW_HEADER.size + size]
+    if len(payload) != size:
+        raise ValueError(f"Truncated screenshot preview: {path}")
+
+    if encoding == SCREEN_PREVIEW_ENCODINGS["raw"]:
+        pixels = payload
+    elif encoding == SCREEN_PREVIEW_ENCODINGS["rle"]:
+        pixels = rle_decode_rgb565(payload)
+    elif encoding == SCREEN_PREVIEW_ENCODINGS["palette"]:
+        palette = payload[:2 * colors]
+        pixels = b"".join(palette[2 * index:2 * index + 2] for index in payload[2 * colors:])
+    else:
+        raise ValueError(f"Unknown encoding {encoding} of screenshot preview: {path}")
+    if len(pixels) != width * height * 2:
+        raise ValueError(f"Screenshot preview decodes to {len(pixels)} bytes, not {width}x{height} RGB565: {path}")
+    return width, height, pixels
+
+def build_image(source_path, dest_path, max_width, max_height, quality=JPEG_QUALITY, min_icons=(),
+                variant_base=None, variant_widths=(), screen_preview=None) -> dict:
+    """process_image, skipped when its outputs were already made from the same
+    source file with the same options, e.g. when only the manifest changed.
+    Returns the metadata of the responsive variants and of the screenshot preview."""
+    targets = [path for path in [dest_path, variant_base] if path is not None] + [path for _, path in min_icons]
+    if screen_preview is not None:
+        targets.append(screen_preview[0])
+    if not targets:
+        return {"variants": [], "preview": None}
+    key = "|".join(targets)
+    stat = os.stat(source_path)
+    image = {"source": [stat.st_mtime_ns, stat.st_size],
+             "options": [max_width, max_height, quality, [size for size, _ in min_icons], list(variant_widths),
+                         [extension for extension, _, _ in IMAGE_VARIANT_FORMATS],
+                         screen_preview[1] if screen_preview else None]}
+    with _build_state_lock:
+        previous = build_state["images"].get(key)
+    if previous and all(previous[field] == image[field] for field in image) and \
+            all(os.path.exists(path) for path in previous["outputs"]):
+        variants = [{field: variant[field] for field in IMAGE_VARIANT_KEYS} for variant in previous["variants"]]
+        preview = previous.get("preview")
+        if preview is not None:
+            preview = {field: preview[field] for field in SCREEN_PREVIEW_KEYS}
+        return {"variants": variants, "preview": preview}
+
+    result = run_image_task(process_image, source_path, dest_path, max_width, max_height, quality,
+                            list(min_icons), variant_base, list(variant_widths), screen_preview)
+    if not result:
+        return {"variants": [], "preview": None}
+    image.update(outputs=result["outputs"], variants=result["variants"], preview=result["preview"])
+    with _build_state_lock:
+        build_state["images"][key] = image
+    return {"variants": result["variants"], "preview": result["preview"]}
+
+# Key order of the variants write_image_variants returns. Those reused from
+# build/.cache/state.json, which is written with sorted keys, are put back in
+# it, so index.json doesn't depend on whether the image cache was hit.
+IMAGE_VARIANT_KEYS = ("file", "type", "width", "height", "bytes")
+
+def write_image_variants(img, base_path, widths) -> list:
+    """Write img at each of widths, but not wider than itself, in every format of
+    IMAGE_VARIANT_FORMATS as <base_path>.<width>w.<extension>. Returns a dict per
+    written file with its name, type, dimensions and size."""
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('LA', 'P', 'PA') else 'RGB')
+    sizes = sorted({min(width, img.width) for width in widths})
+    variants = []
+    for width in sizes:
+        height = max(1, round(img.height * width / img.width))
+        resized = img if width == img.width else img.resize((width, height), Image.Resampling.LANCZOS)
+        for extension, mime_type, options in IMAGE_VARIANT_FORMATS:
+            output_path = f"{base_path}.{width}w.{extension}"
+            tmp_path = temp_path_for(output_path)
+            resized.save(tmp_path, extension.upper(), **options)
+            os.replace(tmp_path, output_path)
+            variants.append({"file": os.path.basename(output_path), "type": mime_type,
+                             "width": width, "height": resized.height, "bytes": os.path.getsize(output_path)})
+    return variants
 
-def compress_image(image_path, max_width=MAX_IMAGE_WIDTH, max_height=MAX_IMAGE_HEIGHT, quality=JPEG_QUALITY):
-    """Compress and resize image if it's too large"""
+def temp_path_for(path) -> str:
+    """Temporary file next to path that keeps its extension"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".tmp-{os.getpid()}-{threading.get_ident()}-{name}")
+
+def copy_file(source_path, dest_path) -> None:
+    """Copy a file by replacing dest_path rather than writing into it, files in
+    static/ may be hard links into the blob store that must never change"""
+    tmp_path = temp_path_for(dest_path)
+    shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, dest_path)
+
+def write_bytes(path, data) -> None:
+    """Write a file by replacing it, see copy_file"""
+    tmp_path = temp_path_for(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def json_text(data) -> str:
+    """JSON output as machines read it: minified, or indented with --pretty"""
+    if args.pretty:
+        return json.dumps(data, indent=2, ensure_ascii=False)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def write_json(path, data) -> int:
+    """Write a JSON output file by replacing it, returns its size in bytes"""
+    text = json_text(data).encode('utf-8')
+    write_bytes(path, text)
+    return len(text)
+
+def save_web_image(img, image_path, quality=JPEG_QUALITY):
+    """Save an image for the web, as optimized PNG or JPEG depending on the extension"""
+    if image_path.lower().endswith('.png'):
+        img.save(image_path, 'PNG', optimize=True)
+    else:
+        # Convert to RGB if needed (for JPEG)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = flatten_to_rgb(img)
+        img.save(image_path, 'JPEG', quality=quality, optimize=True)
+
+def process_image(source_path, dest_path, max_width=MAX_IMAGE_WIDTH, max_height=MAX_IMAGE_HEIGHT,
+                  quality=JPEG_QUALITY, min_icons=(), variant_base=None, variant_widths=(), screen_preview=None):
+    """Decode source_path once and write every variant from that single decode:
+    the web-sized image at dest_path (None to skip it), the RGB565 device icons
+    in min_icons, given as (size, output_path) pairs, the responsive variants
+    at variant_widths next to variant_base and the screenshot preview given as
+    (output_path, encoding). Returns the bytes and files written and the
+    metadata of the variants and preview, or None on failure."""
     try:
-        with Image.open(image_path) as img:
-            # Get original size
-            original_size = os.path.getsize(image_path)
+        with Image.open(source_path) as img:
+            original_size = os.path.getsize(source_path)
             width, height = img.size
-            
-            # Check if image needs resizing
-            if width > max_width or height > max_height:
-                print(f"  Resizing image from {width}x{height} to fit {max_width}x{max_height}")
-                # Calculate new dimensions maintaining aspect ratio
-                img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-                
-                # Save compressed image
-                if image_path.lower().endswith('.png'):
-                    img.save(image_path, 'PNG', optimize=True)
-                else:
-                    # Convert to RGB if needed (for JPEG)
-                    if img.mode in ('RGBA', 'LA', 'P'):
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode == 'P':
-                            img = img.convert('RGBA')
-                        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                        img = background
-                    img.save(image_path, 'JPEG', quality=quality, optimize=True)
-                
-                new_size = os.path.getsize(image_path)
-                print(f"  Compressed: {original_size} bytes -> {new_size} bytes ({100 - int(new_size/original_size*100)}% reduction)")
-            elif original_size > 500 * 1024:  # If larger than 500KB, optimize anyway
-                print(f"  Optimizing large image ({original_size} bytes)")
-                if image_path.lower().endswith('.png'):
-                    img.save(image_path, 'PNG', optimize=True)
-                else:
-                    if img.mode in ('RGBA', 'LA', 'P'):
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode == 'P':
-                            img = img.convert('RGBA')
-                        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                        img = background
-                    img.save(image_path, 'JPEG', quality=quality, optimize=True)
-                
-                new_size = os.path.getsize(image_path)
-                print(f"  Compressed: {original_size} bytes -> {new_size} bytes ({100 - int(new_size/original_size*100)}% reduction)")
+            needs_resize = width > max_width or height > max_height
+            needs_optimize = original_size > 500 * 1024  # If larger than 500KB, optimize anyway
+
+            if dest_path is not None and not (needs_resize or needs_optimize or min_icons or variant_widths or screen_preview):
+                # Nothing to re-encode, don't even decode the pixels
+                if os.path.abspath(source_path) != os.path.abspath(dest_path):
+                    copy_file(source_path, dest_path)
+                return {"bytes": original_size, "outputs": [dest_path], "variants": [], "preview": None}
+
+            # Let JPEG decode at a reduced scale so big photos never sit in memory at full size
+            if needs_resize:
+                img.draft(img.mode, (max_width, max_height))
+            img.load()
+
+            if dest_path is not None:
+                if needs_resize:
+                    print(f"  Resizing image from {width}x{height} to fit {max_width}x{max_height}")
+                    # Calculate new dimensions maintaining aspect ratio
+                    img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+                elif needs_optimize:
+                    print(f"  Optimizing large image ({original_size} bytes)")
+
+                if needs_resize or needs_optimize:
+                    tmp_path = temp_path_for(dest_path)
+                    save_web_image(img, tmp_path, quality)
+                    os.replace(tmp_path, dest_path)
+                    new_size = os.path.getsize(dest_path)
+                    print(f"  Compressed: {original_size} bytes -> {new_size} bytes ({100 - int(new_size/original_size*100)}% reduction)")
+                elif os.path.abspath(source_path) != os.path.abspath(dest_path):
+                    copy_file(source_path, dest_path)
+
+            # Device icons are encoded from the same (web-sized) pixels
+            for size, output_path in min_icons:
+                rgb565_data = encode_min_icons([img], size)[0]
+                write_bytes(output_path, rgb565_data)
+                print(f"  Generated min icon: {output_path} ({size}x{size} RGB565, {len(rgb565_data)} bytes)")
+
+            variants = []
+            if variant_base is not None and variant_widths:
+                variants = write_image_variants(img, variant_base, variant_widths)
+                print(f"  Generated {len(variants)} responsive variants: {sum(v['bytes'] for v in variants)} bytes")
+
+            preview = None
+            if screen_preview is not None:
+                preview = write_screen_preview(img, *screen_preview)
+
+        written = [dest_path] if dest_path is not None else []
+        written += [output_path for _, output_path in min_icons]
+        written += [os.path.join(os.path.dirname(variant_base), variant["file"]) for variant in variants]
+        if screen_preview is not None:
+            written.append(screen_preview[0])
+        written = [path for path in written if os.path.exists(path)]
+        return {"bytes": sum(os.path.getsize(path) for path in written), "outputs": written,
+                "variants": variants, "preview": preview}
     except Exception as e:
-        print(f"  Warning: Could not compress image {image_path}: {e}")
+        print(f"  Warning: Could not process image {source_path}: {e}")
+        return None
 
-def download_file(path, output_dir) -> str:
-    url = path['origin'] if isinstance(path, dict) else path
-    response = requests.head(url)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
-    filename = url.split('/')[-1]
+def stream_download(url, output_path, span=None) -> dict:
+    """Download url to output_path in chunks, hashing the data on the way.
+
+    The data goes to "<output_path>.part" and is renamed into place once complete.
+    An interrupted download is resumed with a Range request if the server still
+    has the same version of the file, and an unchanged file already at output_path
+    is kept after a conditional GET answered with 304 Not Modified.
+    Returns the sha256, size and validators of the file. The HTTP status and
+    bytes received are added to span when given."""
+    span = {} if span is None else span
+    part_path = output_path + ".part"
+    part_info_path = part_path + ".json"
+    cached = build_state["downloads"].get(url)
+
+    headers = {}
+    if cached and os.path.exists(output_path) and os.path.getsize(output_path) == cached.get("size"):
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    # Resume a previous partial download of the same URL
+    sha256 = hashlib.sha256()
+    resume_from = 0
+    if os.path.exists(part_path) and os.path.exists(part_info_path):
+        try:
+            with open(part_info_path, 'r') as f:
+                part_info = json.load(f)
+        except Exception:
+            part_info = {}
+        validator = part_info.get("etag") or part_info.get("last_modified")
+        if part_info.get("url") == url and validator:
+            resume_from = os.path.getsize(part_path)
+            headers["Range"] = f"bytes={resume_from}-"
+            headers["If-Range"] = validator
+
+    with http_request("GET", url, headers=headers, stream=True) as response:
+        span["status"] = response.status_code
+        span["bytes_in"] = 0
+        if response.status_code == 416 and resume_from:
+            # The partial download already has the whole file, or more than the server has now
+            print(f"  Can't resume at {resume_from} bytes, downloading again")
+            response.close()
+            os.remove(part_path)
+            os.remove(part_info_path)
+            return stream_download(url, output_path, span)
+        if response.status_code == 304:
+            print(f"  Not modified, keeping {output_path}")
+            return dict(cached)
+        if response.status_code == 404:
+            raise FileNotFoundError(f"File not found: {url}")
+        response.raise_for_status()
+
+        info = {"etag": response.headers.get('ETag'), "last_modified": response.headers.get('Last-Modified')}
+        if response.status_code == 206 and resume_from:
+            print(f"  Resuming download at {resume_from} bytes")
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+            mode = 'ab'
+        else:
+            resume_from = 0
+            mode = 'wb'
+
+        with open(part_info_path, 'w') as f:
+            json.dump({"url": url, **info}, f)
+        size = resume_from
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+        span["bytes_in"] = size - resume_from
+
+    os.replace(part_path, output_path)
+    os.remove(part_info_path)
+    info.update({"sha256": sha256.hexdigest(), "size": size})
+    return info
+
+def download_file(path, output_dir, filename=None) -> dict:
+    """Download a remote file into output_dir. Returns its file name as "location"
+    together with the "sha256" and "size" the device can verify it against."""
+    url = path['origin'] if isinstance(path, dict) else path
+    filename = filename or url.split('/')[-1]
     output_path = os.path.join(output_dir, filename)
 
-    if response.status_code == 404:
-        raise FileNotFoundError(f"File not found: {url}")
-    if(args.build):
+    with timed_stage("download", url=url) as span:
         print(f"Downloading {url} to {output_path}")
-        os.system(f"wget '{url}' -O '{output_path}'")
+        info = stream_download(url, output_path, span)
+        span["bytes_out"] = info["size"]
+
+    with _build_state_lock:
+        build_state["downloads"][url] = info
 
+    return {"location": filename, "sha256": info["sha256"], "size": info["size"]}
+
+# Content-addressed store shared by all items. Every file in a static/ folder is
+# also linked as blobs/<sha256><ext>, an extra copy under a name that never
+# changes. static/ is still published, Keira OS builds its URLs from it
+BLOBS_DIR = "./build/blobs"
+
+def blob_name(sha256, filename) -> str:
+    return sha256 + os.path.splitext(filename)[1].lower()
+
+def store_blob(path, sha256=None) -> str:
+    """Add a file to the blob store and return its blob name"""
+    if sha256 is None:
+        sha256 = hash_file(path)
+    name = blob_name(sha256, path)
+    blob_path = os.path.join(BLOBS_DIR, name)
+    if not os.path.exists(blob_path):
+        os.makedirs(BLOBS_DIR, exist_ok=True)
+        tmp_path = temp_path_for(blob_path)
+        try:
+            os.link(path, tmp_path)
+        except OSError:
+            shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, blob_path)
+    return name
+
+def static_filename(url, used_names) -> str:
+    """Name of a downloaded file in static/. The URL basename, prefixed with a
+    hash of the URL when another URL of the same item already uses that name."""
+    filename = url.split('/')[-1]
+    if used_names.get(filename, url) != url:
+        filename = hashlib.sha256(url.encode('utf-8')).hexdigest()[:8] + "-" + filename
+    used_names[filename] = url
     return filename
 
-def gen_static_folder(manifest, type, output_dir) -> dict:
+def gen_static_folder(manifest, type, output_dir) -> Manifest:
     static_files_path = output_dir+"/static"
 
     os.makedirs(static_files_path, exist_ok=True)
 
+    path_to_modapp = type+"s/"+manifest['path']
+
+    # Files in static/ by the name index.json refers to them with, mapped to
+    # their path and sha256 (None when it still has to be computed)
+    static_files = {}
+    # Local files keep their names, downloads must not overwrite them
+    used_names = {name: None for name in manifest['screenshots'] + [manifest.get('icon') or ''] if name and not is_remote(name)}
+
+    def download(path):
+        url = path['origin'] if isinstance(path, dict) else path
+        info = download_file(path, static_files_path, static_filename(url, used_names))
+        static_files[info['location']] = (os.path.join(static_files_path, info['location']), info['sha256'])
+        return info
+
+    def add_variants(name, local_name, variants):
+        """Record the responsive variants of the image index.json calls name,
+        stored next to static/<local_name>"""
+        directory = os.path.dirname(local_name)
+        images = manifest.setdefault('images', {}).setdefault(name, [])
+        for variant in variants:
+            variant = dict(variant, file=f"{directory}/{variant['file']}" if directory else variant['file'])
+            static_files[variant['file']] = (os.path.join(static_files_path, variant['file']), None)
+            # When the icon is also a screenshot, its variants replace the screenshot's on disk
+            images[:] = [image for image in images if image['file'] != variant['file']] + [variant]
+        images.sort(key=lambda variant: (variant['width'], variant['type']))
+
+    def preview_for(local_name):
+        """build_image's screen_preview argument for the screenshot static/<local_name>"""
+        if SCREEN_PREVIEW_ENCODING is None:
+            return None
+        return (os.path.join(static_files_path, screen_preview_name(local_name)), SCREEN_PREVIEW_ENCODING)
+
+    def add_preview(name, local_name, preview):
+        """Record the device preview of the screenshot index.json calls name"""
+        if preview:
+            file = screen_preview_name(local_name)
+            static_files[file] = (os.path.join(static_files_path, file), None)
+            manifest.setdefault('screenshot_previews', {})[name] = {"file": file, **preview}
+
     if type == "app" and manifest.get('executionfile'):
-        manifest['executionfile']['location'] = download_file(manifest['executionfile']['location'], static_files_path)
+        manifest['executionfile'].update(download(manifest['executionfile']['location']))
     elif type == "mod" and manifest.get('modfiles'):
         for file in manifest['modfiles']:
-            file['location'] = download_file(file['location'], static_files_path)
+            file.update(download(file['location']))
     else:
         pass
 
-    path_to_modapp = type+"s/"+manifest['path']
-
     # Copy and compress screenshots
     for screenshot in manifest['screenshots']:
         try:
-            if screenshot.startswith('https://') or screenshot.startswith('http://'):
-                download_file(screenshot, static_files_path)
+            if is_remote(screenshot):
+                info = download(screenshot)
+                static_files[screenshot] = static_files.pop(info['location'])
+                local_path = os.path.join(static_files_path, info['location'])
+                image = build_image(local_path, None, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT, variant_base=local_path,
+                                    variant_widths=SCREENSHOT_VARIANT_WIDTHS, screen_preview=preview_for(info['location']))
+                add_variants(screenshot, info['location'], image["variants"])
+                add_preview(screenshot, info['location'], image["preview"])
             else:
                 source_path = os.path.join(path_to_modapp, screenshot)
                 dest_path = os.path.join(static_files_path, screenshot)
                 if os.path.exists(source_path):
-                    os.system(f"cp '{source_path}' '{dest_path}'")
-                    # Compress the screenshot
-                    if os.path.exists(dest_path):
-                        compress_image(dest_path, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT)
+                    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                    image = build_image(source_path, dest_path, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT, variant_base=dest_path,
+                                        variant_widths=SCREENSHOT_VARIANT_WIDTHS, screen_preview=preview_for(screenshot))
+                    static_files[screenshot] = (dest_path, None)
+                    add_variants(screenshot, screenshot, image["variants"])
+                    add_preview(screenshot, screenshot, image["preview"])
                 else:
                     print(f"WARNING: Screenshot not found, skipping: {screenshot}")
         except Exception as e:
             print(f"WARNING: Failed to process screenshot {screenshot}: {str(e)}")
     
-    # Copy and compress icon
+    # Copy and compress icon, then generate minimized icons for ESP32-S3 in RGB565 format
     if manifest.get('icon'):
         try:
-            if manifest['icon'].startswith('https://') or manifest['icon'].startswith('http://'):
-                download_file(manifest['icon'], static_files_path)
-                icon_dest_path = os.path.join(static_files_path, manifest['icon'].split('/')[-1])
+            icon = manifest['icon']
+            if is_remote(icon):
+                icon = download(icon)["location"]
+                static_files[manifest['icon']] = static_files.pop(icon)
+                source_path = dest_path = os.path.join(static_files_path, icon)
+            else:
+                source_path = os.path.join(path_to_modapp, icon)
+                dest_path = os.path.join(static_files_path, icon)
+
+            if os.path.exists(source_path):
+                icon_mins = {size: min_icon_name(icon, size) for size in ICON_SIZES}
+                min_icons = [(size, os.path.join(static_files_path, name)) for size, name in icon_mins.items()]
+                # Downloaded icons are used as they are, local ones get compressed (smaller size for icons)
+                web_dest_path = None if is_remote(manifest['icon']) else dest_path
+                if web_dest_path:
+                    os.makedirs(os.path.dirname(web_dest_path), exist_ok=True)
+                image = build_image(source_path, web_dest_path, MAX_ICON_SIZE, MAX_ICON_SIZE, JPEG_QUALITY, min_icons,
+                                    os.path.join(static_files_path, icon), ICON_VARIANT_WIDTHS)
+                if web_dest_path:
+                    static_files[manifest['icon']] = (web_dest_path, None)
+                add_variants(manifest['icon'], icon, image["variants"])
+
+                for size, icon_min in icon_mins.items():
+                    static_files[icon_min] = (os.path.join(static_files_path, icon_min), None)
+                    if size == MIN_ICON_SIZE:
+                        manifest['icon_min'] = icon_min
+                    else:
+                        manifest.setdefault('icon_min_sizes', {})[str(size)] = icon_min
+            else:
+                print(f"WARNING: Icon not found, skipping: {manifest['icon']}")
+        except Exception as e:
+            print(f"WARNING: Failed to process icon: {str(e)}")
+
+    # Reference every static file in the shared blob store
+    manifest['blobs'] = {}
+    for name, (path, sha256) in sorted(static_files.items()):
+        if os.path.exists(path):
+            manifest['blobs'][name] = store_blob(path, sha256)
+
+    return manifest
+
+# Descriptions and changelogs are rendered from Markdown to sanitized HTML at
+# build time into <item>/description.html, which the site fetches when an item
+# is opened instead of rendering index.json's Markdown. Renders are cached in
+# build/.cache/render by a hash of the text, shared by all items and builds.
+RENDER_CACHE_DIR = os.path.join(CACHE_DIR, "render")
+RENDER_CACHE_MAX_AGE = 30 * 24 * 3600  # seconds, renders unused for longer are removed
+RENDER_VERSION = 1  # Bump when the sanitizer changes
+MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "sane_lists"]
+MARKDOWN_LIST_ITEM = re.compile(r' {0,3}([-*+]|\d+[.)])\s')
+
+# Everything else is dropped: other tags keep only their text, these lose their content too
+SANITIZE_TAGS = {"p", "br", "hr", "h1", "h2", "h3", "h4", "h5", "h6", "strong", "em", "b", "i", "u", "s", "del",
+                 "code", "pre", "blockquote", "ul", "ol", "li", "a", "img", "table", "thead", "tbody", "tr",
+                 "th", "td", "sup", "sub", "div", "span"}
+SANITIZE_ATTRIBUTES = {"a": {"href", "title"}, "img": {"src", "alt", "title", "width", "height"},
+                       "ol": {"start"}, "code": {"class"}, "th": {"style"}, "td": {"style"}}
+SANITIZE_DROP_CONTENT = {"script", "style", "iframe", "object", "embed", "template", "noscript", "textarea", "title"}
+SANITIZE_VOID_TAGS = {"br", "hr", "img"}
+SANITIZE_URL_SCHEMES = ("http", "https", "mailto")
+
+def is_safe_url(url) -> bool:
+    """Relative URLs and the allowed schemes only, browsers ignore whitespace and
+    control characters inside "java\\tscript:" so they are ignored here too"""
+    url = re.sub(r'[\x00-\x20]', '', url).lower()
+    scheme = re.match(r'([a-z][a-z0-9+.-]*):', url)
+    return scheme is None or scheme.group(1) in SANITIZE_URL_SCHEMES
+
+def is_safe_attribute(name, value) -> bool:
+    if name in ("href", "src"):
+        return is_safe_url(value)
+    if name == "style":
+        # Table column alignment from the tables extension
+        return re.fullmatch(r'text-align:\s*(left|right|center);?', value.strip()) is not None
+    if name == "class":
+        return re.fullmatch(r'language-[\w+-]+', value) is not None
+    return True
+
+class HtmlSanitizer(HTMLParser):
+    """Keeps the allowlisted tags and attributes of an HTML fragment and escapes
+    all text, the result is well-formed: unclosed tags are closed"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.output = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SANITIZE_DROP_CONTENT:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in SANITIZE_TAGS:
+            return
+        kept = "".join(f' {name}="{html.escape(value or "")}"' for name, value in attrs
+                       if name in SANITIZE_ATTRIBUTES.get(tag, ()) and is_safe_attribute(name, value or ""))
+        if tag == "a":
+            kept += ' rel="nofollow noopener" target="_blank"'
+        self.output.append(f"<{tag}{kept}>")
+        if tag not in SANITIZE_VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in SANITIZE_VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in SANITIZE_DROP_CONTENT:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.output.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.output.append(html.escape(data, quote=False))
+
+    def handle_entityref(self, name):
+        if not self.dropping:
+            self.output.append(f"&{name};")
+
+    def handle_charref(self, name):
+        if not self.dropping:
+            self.output.append(f"&#{name};")
+
+    def sanitized(self) -> str:
+        self.close()
+        return "".join(self.output) + "".join(f"</{tag}>" for tag in reversed(self.open_tags))
+
+def sanitize_html(fragment) -> str:
+    sanitizer = HtmlSanitizer()
+    sanitizer.feed(fragment)
+    return sanitizer.sanitized()
+
+def separate_lists(text) -> str:
+    """Python-Markdown only starts a list after a blank line, GitHub and marked
+    (which the site used) also start one right after a paragraph line"""
+    lines = []
+    fenced = False
+    for line in text.split('\n'):
+        if line.lstrip().startswith(('```', '~~~')):
+            fenced = not fenced
+        elif (not fenced and lines and MARKDOWN_LIST_ITEM.match(line) and lines[-1].strip()
+              and not MARKDOWN_LIST_ITEM.match(lines[-1]) and not lines[-1].startswith((' ', '\t'))):
+            lines.append('')
+        lines.append(line)
+    return '\n'.join(lines)
+
+def render_markdown(text) -> str:
+    """Sanitized HTML of Markdown text, from the render cache if it was rendered before"""
+    key = hashlib.sha256(f"{RENDER_VERSION}\0{markdown.__version__}\0{text}".encode('utf-8')).hexdigest()
+    path = os.path.join(RENDER_CACHE_DIR, key + ".html")
+    if not args.no_cache and os.path.exists(path):
+        os.utime(path)  # Still in use, see prune_render_cache
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    rendered = sanitize_html(markdown.markdown(separate_lists(text), extensions=MARKDOWN_EXTENSIONS))
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    write_bytes(path, rendered.encode('utf-8'))
+    return rendered
+
+def write_description_html(manifest, output_dir) -> bool:
+    """Write the rendered description and changelog to output_dir/description.html,
+    one <section data-field="..."> each. Returns False if there is neither."""
+    sections = []
+    for field in ("description", "changelog"):
+        text = manifest.get(field)
+        if text and str(text).strip():
+            sections.append(f'<section data-field="{field}">{render_markdown(str(text))}</section>\n')
+
+    path = os.path.join(output_dir, "description.html")
+    if not sections:
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+    write_bytes(path, "".join(sections).encode('utf-8'))
+    return True
+
+def prune_render_cache() -> None:
+    """Remove renders no item used within RENDER_CACHE_MAX_AGE"""
+    if not os.path.isdir(RENDER_CACHE_DIR):
+        return
+    cutoff = time.time() - RENDER_CACHE_MAX_AGE
+    for name in os.listdir(RENDER_CACHE_DIR):
+        path = os.path.join(RENDER_CACHE_DIR, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+
+def process_manifest(manifest, type) -> dict:
+    """Build the item's output folder unless the previous output can be reused,
+    the way BuildGraph runs an item node. Returns the data of its index.json,
+    or None when not building."""
+    if args.build:
+        key = type+"s/"+manifest['path']
+        with timed_stage("cache"):
+            inputs = item_inputs(manifest, type)
+        reason = node_stale_reason(key, inputs, item_outputs(key, type))
+        data = load_item_output(key) if reason is None else None
+        if data is not None:
+            print(f"Up to date, reusing build output: {key}")
+        else:
+            print(f"Building {key}: {reason or 'previous output is incomplete'}")
+            data = write_item_output(manifest, type)
+        record_node(key, inputs)
+        return data
+
+def write_item_output(manifest, type) -> dict:
+    """Build the item's output folder, returns the data written to its index.json"""
+    output_dir = os.path.join("./build", type+"s", manifest['path'])
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = gen_static_folder(manifest, type, output_dir)
+
+    if type == "app":
+        short_data = {
+            "name": manifest["name"],
+            "short_description": manifest["short_description"]
+        }
+        # Only include executionfile if it exists
+        if manifest.get("executionfile"):
+            short_data["executionfile"] = manifest["executionfile"]
+        
+        with timed_stage("write", file='index_short.json') as span:
+            span["bytes_out"] = write_json(os.path.join(output_dir, 'index_short.json'), short_data)
+        
+    full_data = {
+        "name": manifest["name"],
+        "description": manifest["description"],
+        "short_description": manifest["short_description"],
+        "author": manifest["author"],
+        "sources": manifest["sources"],
+        "screenshots": manifest.get("screenshots", [])
+    }
+
+    if type == "app" and manifest.get("keira_version"):
+        full_data["keira_version"] = manifest["keira_version"]
+    
+    # Only include icon if it exists
+    if manifest.get("icon"):
+        full_data["icon"] = manifest["icon"]
+    
+    # Include minimized icon for ESP32-S3 if it exists
+    if manifest.get("icon_min"):
+        full_data["icon_min"] = manifest["icon_min"]
+    if manifest.get("icon_min_sizes"):
+        full_data["icon_min_sizes"] = manifest["icon_min_sizes"]
+
+    # Blob store names of the files in static/, keyed like index.json refers to them
+    if manifest.get("blobs"):
+        full_data["blobs"] = manifest["blobs"]
+
+    # Responsive WebP/AVIF variants of the screenshots and icon, for srcset
+    if manifest.get("images"):
+        full_data["images"] = manifest["images"]
+
+    # Screen-sized RGB565 previews of the screenshots for Keira OS
+    if manifest.get("screenshot_previews"):
+        full_data["screenshot_previews"] = manifest["screenshot_previews"]
+    
+    # Only include changelog if it exists and is not empty
+    if manifest.get("changelog"):
+        full_data["changelog"] = manifest["changelog"]
+
+    # Both rendered to HTML, the Markdown stays for Keira OS and older sites
+    if markdown is not None:
+        with timed_stage("write", file='description.html'):
+            if write_description_html(manifest, output_dir):
+                full_data["description_html"] = "description.html"
+    
+    if type == "app":
+        # Only include executionfile if it exists
+        if manifest.get("executionfile"):
+            full_data["executionfile"] = manifest["executionfile"]
+    elif type == "mod":
+        # Only include modfiles if they exist
+        if manifest.get("modfiles"):
+            full_data["modfiles"] = manifest["modfiles"]
+    
+    with timed_stage("write", file='index.json') as span:
+        span["bytes_out"] = write_json(os.path.join(output_dir, 'index.json'), full_data)
+    return full_data
+
+
+# Index page sets: every consumer gets its own page size, and every ordering
+# its own precomputed pages with the short records of the items embedded
+INDEX_PAGE_SIZES = {"web": args.page_size, "device": args.device_page_size}
+INDEX_ORDERS = {
+    "name": lambda record: (str(record["name"]).casefold(), record["path"]),
+    "updated": lambda record: (-record["updated"], str(record["name"]).casefold(), record["path"]),
+    "author": lambda record: (str(record["author"]).casefold(), str(record["name"]).casefold(), record["path"]),
+}
+
+_item_update_times = None
+_committed_items = set()
+
+def item_update_time(item, type) -> int:
+    """Unix time of the last commit that touched the item's folder, or of its
+    newest file when the folder isn't committed (or there is no git)"""
+    global _item_update_times, _committed_items
+    if _item_update_times is None:
+        # One git log for all items, newest commits first
+        _item_update_times = {}
+        try:
+            log = subprocess.run(["git", "-c", "core.quotePath=false", "log", "--format=%ct", "--name-only", "--", "apps", "mods"],
+                                 capture_output=True, text=True, check=True).stdout
+        except (OSError, subprocess.CalledProcessError):
+            log = ""
+        timestamp = None
+        for line in log.splitlines():
+            if line.isdigit():
+                timestamp = int(line)
+            elif line.count('/') >= 2:
+                _item_update_times.setdefault("/".join(line.split('/')[:2]), timestamp)
+        _committed_items = set(_item_update_times)
+
+    key = type+"s/"+item
+    if key not in _item_update_times:
+        folder = os.path.join(type+"s", item)
+        _item_update_times[key] = int(max((os.path.getmtime(os.path.join(root, name))
+                                           for root, _, names in os.walk(folder) for name in names),
+                                          default=os.path.getmtime(folder) if os.path.exists(folder) else 0))
+    return _item_update_times[key]
+
+def forget_item_update_time(item, type) -> None:
+    """Let item_update_time look at the files of an item that isn't committed
+    again, after --watch saw them change"""
+    key = type+"s/"+item
+    if _item_update_times is not None and key not in _committed_items:
+        _item_update_times.pop(key, None)
+
+def page_record(item, data, type, consumer) -> dict:
+    """Short record of an item embedded in the index pages of a consumer"""
+    record = {
+        "path": item,
+        "name": data["name"],
+        "short_description": data["short_description"],
+        "author": data["author"],
+        "updated": item_update_time(item, type),
+    }
+    if type == "app" and data.get("keira_version"):
+        record["keira_version"] = data["keira_version"]
+
+    if consumer == "web":
+        # Enough of index.json for the site to render the card's icon
+        icon = data.get("icon")
+        if icon:
+            images = data.get("images", {}).get(icon, [])
+            blobs = data.get("blobs", {})
+            record["icon"] = icon
+            record["blobs"] = {file: blobs[file] for file in [icon] + [image["file"] for image in images] if file in blobs}
+            if images:
+                record["images"] = {icon: images}
+    else:
+        if data.get("icon_min"):
+            record["icon_min"] = data["icon_min"]
+        if type == "app" and data.get("executionfile"):
+            record["executionfile"] = data["executionfile"]
+    return record
+
+def remove_stale_pages(output_dir, name, pages) -> None:
+    """Remove the pages output_dir/<name % page> left from a previous, longer build"""
+    pattern = re.compile(re.escape(name).replace('%d', r'(\d+)') + '$')
+    for existing in os.listdir(output_dir):
+        match = pattern.match(existing)
+        if match and int(match.group(1)) >= pages:
+            os.remove(os.path.join(output_dir, existing))
+
+def catalog_record(item, data, type) -> dict:
+    """Short description of an item for the aggregated catalog"""
+    record = {
+        "path": item,
+        "name": data["name"],
+        "short_description": data["short_description"],
+        "author": data["author"],
+    }
+    if data.get("icon"):
+        blob = data.get("blobs", {}).get(data["icon"])
+        record["icon"] = f"blobs/{blob}" if blob else f"{type}s/{item}/static/{data['icon']}"
+    if data.get("keira_version"):
+        record["keira_version"] = data["keira_version"]
+    return record
+
+# Apostrophes are part of Ukrainian words (м'ята), drop them so "мята" matches too
+SEARCH_APOSTROPHES = str.maketrans('', '', "'’ʼ`")
+
+def tokenize(text) -> list[str]:
+    """Split text into lower case search tokens, \\w also matches Cyrillic letters"""
+    return re.findall(r'\w+', str(text).lower().translate(SEARCH_APOSTROPHES))
+
+def search_shard_name(token) -> str:
+    """Tokens are sharded by their first character, named by its code point
+    so that Cyrillic shards get plain ASCII file names"""
+    return f"{ord(token[0]):04x}"
+
+# Binary catalog for Keira OS, so the device can seek straight to item N
+# without a JSON parser. All integers are little-endian.
+#
+#   header   magic "LKC1", u16 version, u16 flags, u32 item count, u16 icon size,
+#            u16 reserved, u32 offset of the offset table, u32 file size
+#   table    u32 absolute offset of each item record
+#   record   u16 flags (bit 0: has icon), then one u16 length + UTF-8 string for
+#            each of BINARY_CATALOG_FIELDS, then, if it has an icon, zero padding
+#            up to a 4 byte aligned file offset and icon size^2 RGB565 pixels
+BINARY_CATALOG_MAGIC = b"LKC1"
+BINARY_CATALOG_VERSION = 1
+BINARY_CATALOG_HEADER = struct.Struct("<4sHHIHHII")
+BINARY_CATALOG_FIELDS = ("path", "name", "short_description", "author", "keira_version", "executionfile", "executionfile_sha256")
+BINARY_CATALOG_HAS_ICON = 0x1
+BINARY_CATALOG_MAX_STRING = 0xFFFF  # Bytes, longer strings are cut at a character boundary
+
+class BinaryCatalogWriter:
+    """Writes a binary catalog from records (dicts with BINARY_CATALOG_FIELDS and an
+    optional "icon" of RGB565 bytes) added one at a time. The records are spilled
+    to a temporary file, close() puts the header and offset table in front of them."""
+
+    def __init__(self, path, icon_size=MIN_ICON_SIZE):
+        self.path = path
+        self.icon_size = icon_size
+        self.records = tempfile.TemporaryFile(dir=os.path.dirname(path))
+        self.offsets = []
+
+    def add(self, record) -> None:
+        offset = self.records.tell()
+        icon = record.get("icon")
+        data = bytearray(struct.pack("<H", BINARY_CATALOG_HAS_ICON if icon else 0))
+        for field in BINARY_CATALOG_FIELDS:
+            value = str(record.get(field) or "").encode('utf-8')
+            if len(value) > BINARY_CATALOG_MAX_STRING:
+                print(f"WARNING: {field} of {record.get('path')} is {len(value)} bytes long, "
+                      f"truncated to {BINARY_CATALOG_MAX_STRING} bytes in {os.path.basename(self.path)}")
+                value = value[:BINARY_CATALOG_MAX_STRING].decode('utf-8', errors='ignore').encode('utf-8')
+            data += struct.pack("<H", len(value)) + value
+        if icon:
+            if len(icon) != self.icon_size * self.icon_size * 2:
+                raise ValueError(f"Icon of {record.get('path')} is not {self.icon_size}x{self.icon_size} RGB565")
+            # The header and the offset table are a multiple of 4 bytes long
+            data += bytes(-(offset + len(data)) % 4)
+            data += icon
+        self.records.write(data)
+        self.offsets.append(offset)
+
+    def close(self) -> int:
+        """Write the catalog, returns its size in bytes"""
+        table_offset = BINARY_CATALOG_HEADER.size
+        records_offset = table_offset + 4 * len(self.offsets)
+        size = records_offset + self.records.tell()
+        with open(self.path, 'wb') as f:
+            f.write(BINARY_CATALOG_HEADER.pack(BINARY_CATALOG_MAGIC, BINARY_CATALOG_VERSION, 0,
+                                               len(self.offsets), self.icon_size, 0, table_offset, size))
+            f.write(struct.pack(f"<{len(self.offsets)}I", *(records_offset + offset for offset in self.offsets)))
+            self.records.seek(0)
+            shutil.copyfileobj(self.records, f)
+        self.records.close()
+        return size
+
+def read_binary_catalog(path) -> list[dict]:
+    """Reference reader for catalog.bin, returns the records BinaryCatalogWriter was given"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, _, count, icon_size, _, table_offset, size = BINARY_CATALOG_HEADER.unpack_from(data, 0)
+    if magic != BINARY_CATALOG_MAGIC or version != BINARY_CATALOG_VERSION:
+        raise ValueError(f"Not a version {BINARY_CATALOG_VERSION} binary catalog: {path}")
+    if size != len(data):
+        raise ValueError(f"Truncated binary catalog: {path}")
+
+    records = []
+    for offset in struct.unpack_from(f"<{count}I", data, table_offset):
+        (flags,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        record = {}
+        for field in BINARY_CATALOG_FIELDS:
+            (length,) = struct.unpack_from("<H", data, offset)
+            record[field] = data[offset + 2:offset + 2 + length].decode('utf-8')
+            offset += 2 + length
+        if flags & BINARY_CATALOG_HAS_ICON:
+            offset += -offset % 4
+            record["icon"] = data[offset:offset + icon_size * icon_size * 2]
+        records.append(record)
+    return records
+
+def binary_catalog_record(item, data, output_dir) -> dict:
+    """Record of an item in catalog.bin, with its RGB565 icon read from the build output"""
+    executionfile = data.get("executionfile") or {}
+    record = {field: data.get(field) for field in BINARY_CATALOG_FIELDS}
+    record["path"] = item
+    record["executionfile"] = executionfile.get("location") if isinstance(executionfile.get("location"), str) else ""
+    record["executionfile_sha256"] = executionfile.get("sha256")
+    if data.get("icon_min"):
+        icon_path = os.path.join(output_dir, item, "static", data["icon_min"])
+        if os.path.exists(icon_path):
+            with open(icon_path, 'rb') as f:
+                record["icon"] = f.read()
+    return record
+
+class ItemIndexWriter:
+    """Writes the index pages and catalogs that list the built items of a type,
+    from items added one at a time in folder order:
+    - the index_<page>.json name lists Keira OS reads, each as soon as it is full
+    - pages/<consumer>/<order>/<page>.json with the items' short records
+    - catalog.json with the inverted search index in search/<shard>.json
+    - catalog.bin, and how its size compares with the JSON the device reads
+    Records are spilled to temporary files as they come, only the sort keys and
+    file offsets of the items stay in memory until close() writes the rest."""
+
+    def __init__(self, type):
+        self.type = type
+        self.output_dir = os.path.join("./build", type+"s")
+        os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.count = 0
+        self.names = []
+        self.name_pages = 0
+        self.records = {consumer: tempfile.TemporaryFile(dir=CACHE_DIR) for consumer in INDEX_PAGE_SIZES}
+        self.sort_keys = []
+        self.catalog = tempfile.TemporaryFile('w+', encoding='utf-8', dir=CACHE_DIR)
+        self.shards = {}
+        self.binary = BinaryCatalogWriter(os.path.join(self.output_dir, "catalog.bin"))
+        self.json_files = 0
+        self.json_size = 0
+        self.previews = 0
+        self.preview_size = 0
+        self.preview_decoded_size = 0
+
+    def add(self, item, data) -> None:
+        """Add a built item, given its index.json data"""
+        position = self.count
+        self.count += 1
+
+        self.names.append(item)
+        if len(self.names) == INDEX_PAGE_SIZES["device"]:
+            self.write_names_page()
+
+        offsets = {}
+        for consumer, file in self.records.items():
+            record = page_record(item, data, self.type, consumer)
+            offsets[consumer] = file.tell()
+            file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n")
+        self.sort_keys.append(({key: record[key] for key in ("path", "name", "author", "updated")}, offsets))
+
+        record = catalog_record(item, data, self.type)
+        self.catalog.write(("," if position else "") + json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        text = " ".join([record["path"], record["name"], record["short_description"], record["author"]])
+        for token in sorted(set(tokenize(text))):
+            shard = search_shard_name(token)
+            if shard not in self.shards:
+                self.shards[shard] = tempfile.TemporaryFile('w+', encoding='utf-8', dir=CACHE_DIR)
+            self.shards[shard].write(f"{token}\t{position}\n")
+
+        self.binary.add(binary_catalog_record(item, data, self.output_dir))
+        # What a device downloads for the same information as JSON
+        json_files = [os.path.join(self.output_dir, item, 'index_short.json' if self.type == "app" else 'index.json')]
+        if data.get("icon_min"):
+            json_files.append(os.path.join(self.output_dir, item, "static", data["icon_min"]))
+        self.json_files += len(json_files)
+        self.json_size += sum(os.path.getsize(f) for f in json_files if os.path.exists(f))
+        for preview in data.get("screenshot_previews", {}).values():
+            self.previews += 1
+            self.preview_size += preview["bytes"]
+            self.preview_decoded_size += preview["decoded_bytes"]
+
+    def write_names_page(self) -> None:
+        """Write the names collected for the next index_<page>.json, close()
+        fills in total_pages once the number of pages is known"""
+        write_json(os.path.join(self.output_dir, f"index_{self.name_pages}.json"),
+                   {"page": self.name_pages, "total_pages": None, "manifests": self.names})
+        self.name_pages += 1
+        self.names = []
+
+    def close(self) -> None:
+        if self.names or not self.name_pages:
+            self.write_names_page()
+        for page in range(self.name_pages):
+            path = os.path.join(self.output_dir, f"index_{page}.json")
+            with open(path, 'r', encoding='utf-8') as f:
+                names_page = json.load(f)
+            names_page["total_pages"] = self.name_pages
+            write_json(path, names_page)
+            self.json_files += 1
+            self.json_size += os.path.getsize(path)
+        remove_stale_pages(self.output_dir, "index_%d.json", self.name_pages)
+
+        for order, key in INDEX_ORDERS.items():
+            ordered = sorted(self.sort_keys, key=lambda entry: key(entry[0]))
+            for consumer, page_size in INDEX_PAGE_SIZES.items():
+                file = self.records[consumer]
+                pages = max(1, -(-self.count // page_size))
+                output_dir = os.path.join(self.output_dir, "pages", consumer, order)
+                os.makedirs(output_dir, exist_ok=True)
+                for page in range(pages):
+                    records = []
+                    for _, offsets in ordered[page*page_size:(page+1)*page_size]:
+                        file.seek(offsets[consumer])
+                        records.append(json.loads(file.readline()))
+                    write_json(os.path.join(output_dir, f"{page}.json"),
+                               {"page": page, "total_pages": pages, "total": self.count, "order": order,
+                                "manifests": [record["path"] for record in records], "items": records})
+                remove_stale_pages(output_dir, "%d.json", pages)
+        for file in self.records.values():
+            file.close()
+
+        catalog_path = os.path.join(self.output_dir, "catalog.json")
+        with open(catalog_path, 'w', encoding='utf-8') as file:
+            file.write('{"total":%d,"items":[' % self.count)
+            self.catalog.seek(0)
+            shutil.copyfileobj(self.catalog, file)
+            file.write(']}')
+        self.catalog.close()
+
+        search_dir = os.path.join(self.output_dir, "search")
+        if os.path.isdir(search_dir):
+            shutil.rmtree(search_dir)
+        os.makedirs(search_dir)
+        for shard, file in self.shards.items():
+            tokens = {}
+            file.seek(0)
+            for line in file:
+                token, position = line.rstrip("\n").split("\t")
+                tokens.setdefault(token, []).append(int(position))
+            file.close()
+            write_json(os.path.join(search_dir, f"{shard}.json"), dict(sorted(tokens.items())))
+
+        binary_size = self.binary.close()
+        print(f"Binary catalog {self.type}s/catalog.bin: {binary_size} bytes, "
+              f"JSON pages + per-item JSON + icons: {self.json_size} bytes in {self.json_files} files")
+        if self.previews:
+            print(f"Screenshot previews {self.type}s: {self.previews}, {self.preview_size} bytes on the wire vs "
+                  f"{self.preview_decoded_size} bytes raw RGB565 "
+                  f"({100 * self.preview_size / self.preview_decoded_size:.0f}%)")
+
+# Structural manifest validation: every field is checked against MANIFEST_SCHEMA
+# and all errors of a manifest are reported at once, without network. main()
+# checks all manifests in one parallel pass before the build, and the network
+# checks of validate_app_files only run for items that pass. Results are cached
+# by manifest content in build/.cache/validation.json.
+#
+# A rule has the expected "type" (a type or tuple of types), "required" and
+# "recommended": the item types for which a missing value is an error that
+# skips the item or only a warning, "missing": the warning for that, and for
+# mappings the rules of their "fields", for lists the rule of their "items".
+ORIGIN_RULE = {"type": (dict, str), "required": ("app", "mod"),
+               "fields": {"origin": {"type": str, "required": ("app", "mod")}}}
+MANIFEST_SCHEMA = {
+    "name": {"type": str, "required": ("app", "mod"), "missing": "Name not found in manifest file"},
+    "keira_version": {"type": (str, int, float), "required": ("app",), "missing": "keira_version not found in manifest file"},
+    "description": {"type": str},
+    "short_description": {"type": str, "required": ("app", "mod"), "missing": "Short Description not found in manifest file"},
+    "changelog": {"type": str},
+    "author": {"type": str, "required": ("app", "mod"), "missing": "Author not found in manifest file"},
+    "icon": {"type": str, "recommended": ("app", "mod"), "missing": "Icon not found in manifest file (optional)"},
+    "screenshots": {"type": list, "items": {"type": str}},
+    "sources": {"type": dict, "required": ("app", "mod"), "missing": "sources not found in manifest file", "fields": {
+        "type": {"type": str, "required": ("app", "mod"), "missing": "sources type not found in manifest file"},
+        "location": {"type": dict, "required": ("app", "mod"), "missing": "sources location not found in manifest file",
+                     "fields": {"origin": {"type": str, "required": ("app", "mod"),
+                                           "missing": "sources origin not found in manifest file"}}},
+    }},
+    "executionfile": {"type": dict, "recommended": ("app",), "missing": "executionfile not found in manifest file (optional)",
+                      "fields": {"location": ORIGIN_RULE}},
+    "modfiles": {"type": list, "recommended": ("mod",), "missing": "modfiles not found in manifest file (optional)",
+                 "items": {"type": dict, "fields": {"location": ORIGIN_RULE}}},
+}
+TYPE_NAMES = {str: "a string", int: "a number", float: "a number", dict: "a mapping", list: "a list", bool: "a boolean"}
+
+VALIDATION_CACHE_PATH = os.path.join(CACHE_DIR, "validation.json")
+VALIDATION_CACHE_VERSION = 1  # Bump when MANIFEST_SCHEMA or its messages change
+
+validation_cache = {"version": VALIDATION_CACHE_VERSION, "manifests": {}}
+_validation_cache_lock = threading.Lock()
+_validated_keys = set()
+
+def load_validation_cache():
+    global validation_cache
+    if args.no_cache or not os.path.exists(VALIDATION_CACHE_PATH):
+        return
+    try:
+        with open(VALIDATION_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not read validation cache: {e}")
+        return
+    if cache.get("version") == VALIDATION_CACHE_VERSION:
+        validation_cache = cache
+
+def save_validation_cache():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with _validation_cache_lock:
+        # Forget manifests no item has anymore
+        validation_cache["manifests"] = {key: errors for key, errors in validation_cache["manifests"].items()
+                                         if key in _validated_keys}
+        with open(VALIDATION_CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(validation_cache, f, ensure_ascii=False, separators=(',', ':'))
+
+def schema_errors(value, rule, type, path="") -> list[tuple]:
+    """Everything wrong with value according to rule, as (warning type, message, critical)"""
+    expected = rule["type"] if isinstance(rule["type"], tuple) else (rule["type"],)
+    if not isinstance(value, expected) or isinstance(value, bool):
+        names = " or ".join(dict.fromkeys(TYPE_NAMES[t] for t in expected))
+        return [("invalid_field", f"{path} must be {names}, got {value_type_name(value)}", True)]
+    errors = []
+    if isinstance(value, dict):
+        for field, field_rule in rule.get("fields", {}).items():
+            field_path = f"{path}.{field}" if path else field
+            if value.get(field) is None:
+                missing = field_rule.get("missing", f"{field_path} not found in manifest file")
+                if type in field_rule.get("required", ()):
+                    errors.append(("missing_field", missing, True))
+                elif type in field_rule.get("recommended", ()):
+                    errors.append(("missing_field", missing, False))
             else:
-                source_path = os.path.join(path_to_modapp, manifest['icon'])
-                dest_path = os.path.join(static_files_path, manifest['icon'])
-                if os.path.exists(source_path):
-                    os.system(f"cp '{source_path}' '{dest_path}'")
-                    icon_dest_path = dest_path
-                    # Compress the icon (smaller size for icons)
-                    if os.path.exists(dest_path):
-                        compress_image(dest_path, MAX_ICON_SIZE, MAX_ICON_SIZE)
-                else:
-                    print(f"WARNING: Icon not found, skipping: {manifest['icon']}")
-                    icon_dest_path = None
-            
-            # Generate minimized 64x64 icon for ESP32-S3 in RGB565 format
-            if icon_dest_path and os.path.exists(icon_dest_path):
-                icon_name = os.path.splitext(manifest['icon'])[0]
-                min_icon_name = f"{icon_name}_min.bin"
-                min_icon_path = os.path.join(static_files_path, min_icon_name)
-                generate_min_icon(icon_dest_path, min_icon_path)
-                manifest['icon_min'] = min_icon_name
-        except Exception as e:
-            print(f"WARNING: Failed to process icon: {str(e)}")
+                errors += schema_errors(value[field], field_rule, type, field_path)
+    elif isinstance(value, list) and "items" in rule:
+        for i, element in enumerate(value):
+            errors += schema_errors(element, rule["items"], type, f"{path}[{i}]")
+    return errors
 
-    return manifest
+def value_type_name(value) -> str:
+    return "nothing" if value is None else TYPE_NAMES.get(type(value), type(value).__name__)
 
-def process_manifest(manifest, type) -> None:
-    output_dir = os.path.join("./build", type+"s", manifest['path'])
+def manifest_structure_errors(manifest_path, type, data=None) -> list[tuple]:
+    """Structural errors of a manifest.yml, from the validation cache if one with
+    the same content was checked before. data is its parsed content if the
+    caller has it. Raises like parse_manifest_file if it can't be parsed."""
+    with open(manifest_path, 'rb') as f:
+        key = f"{type}:{hashlib.sha256(f.read()).hexdigest()}"
+    with _validation_cache_lock:
+        _validated_keys.add(key)
+        cached = validation_cache["manifests"].get(key)
+    if cached is not None:
+        return [tuple(error) for error in cached]
+    if data is None:
+        data = parse_manifest_file(manifest_path)
+    if not isinstance(data, dict):
+        raise ValueError("expected a mapping of fields")
+    errors = schema_errors(data, {"type": dict, "fields": MANIFEST_SCHEMA}, type)
+    with _validation_cache_lock:
+        validation_cache["manifests"][key] = [list(error) for error in errors]
+    return errors
 
-    if args.build:
-        os.makedirs("./build", exist_ok=True)
-        os.makedirs(output_dir, exist_ok=True)
-        
-        manifest = gen_static_folder(manifest, type, output_dir)
-
-        if type == "app":
-            short_data = {
-                "name": manifest["name"],
-                "short_description": manifest["short_description"]
-            }
-            # Only include executionfile if it exists
-            if manifest.get("executionfile"):
-                short_data["executionfile"] = manifest["executionfile"]
-            
-            with open(os.path.join(output_dir, 'index_short.json'), 'w', encoding='utf-8') as file:
-                json.dump(short_data, file, indent=2, ensure_ascii=False)
-            
-        full_data = {
-            "name": manifest["name"],
-            "description": manifest["description"],
-            "short_description": manifest["short_description"],
-            "author": manifest["author"],
-            "sources": manifest["sources"],
-            "screenshots": manifest.get("screenshots", [])
-        }
-        
-        # Only include icon if it exists
-        if manifest.get("icon"):
-            full_data["icon"] = manifest["icon"]
-        
-        # Include minimized icon for ESP32-S3 if it exists
-        if manifest.get("icon_min"):
-            full_data["icon_min"] = manifest["icon_min"]
-        
-        # Only include changelog if it exists and is not empty
-        if manifest.get("changelog"):
-            full_data["changelog"] = manifest["changelog"]
-        
-        if type == "app":
-            # Only include executionfile if it exists
-            if manifest.get("executionfile"):
-                full_data["executionfile"] = manifest["executionfile"]
-        elif type == "mod":
-            # Only include modfiles if they exist
-            if manifest.get("modfiles"):
-                full_data["modfiles"] = manifest["modfiles"]
-        
-        with open(os.path.join(output_dir, 'index.json'), 'w', encoding='utf-8') as file:
-            json.dump(full_data, file, indent=2, ensure_ascii=False)
-
-
-def gen_json_index_manifests(manifests, type) -> None:
-    jsons_per_page = 12
-    page = 1
-    jsons = []
-    pages = len(manifests) // jsons_per_page
-    if len(manifests) % jsons_per_page != 0:
-        pages += 1
-    output_dir = os.path.join("./build", type+"s")
-    os.makedirs(output_dir, exist_ok=True)
-    for i in range(0, pages):
-        with open(os.path.join("./build", type+"s", f"index_{i}.json"), 'w') as file:
-            file.write('{\n')
-            file.write(f'  "page": {i},\n')
-            file.write(f'  "total_pages": {pages},\n')
-            file.write(f'  "manifests": [\n')
-            page_manifests = []
-            for j in range(0, jsons_per_page):
-                if i*jsons_per_page+j >= len(manifests):
-                    break
-                page_manifests.append(f'    "{manifests[i*jsons_per_page+j]}"')
-            file.write(',\n'.join(page_manifests) + '\n')
-            file.write('  ]\n')
-            file.write('}\n')
-        
+MANIFEST_BATCH_SIZE = 64  # Manifests parsed per process pool task
+
+def load_manifest_entries(manifest_paths) -> list:
+    """Manifest cache entries of manifests, parsed where the process pool runs
+    it. None for the ones that can't be cached or parsed, the build parses
+    those again and reports their errors."""
+    entries = []
+    for manifest_path in manifest_paths:
+        try:
+            entries.append(load_manifest_file(manifest_path)[1])
+        except Exception:
+            entries.append(None)
+    return entries
+
+def prefetch_manifests(manifest_paths) -> None:
+    """Parse the manifests that are not in the manifest cache on the process
+    pool, in batches, and add them to the cache. Parsing YAML holds the GIL,
+    threads wouldn't run it in parallel."""
+    # A single worker parses no faster than this process, after it started
+    if image_pool is None or args.stream or process_pool_workers() < 2:
+        return
+    stale = []
+    for manifest_path in manifest_paths:
+        stat = os.stat(manifest_path)
+        with _manifest_cache_lock:
+            entry = manifest_cache["manifests"].get(manifest_path)
+        if not (entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size):
+            stale.append(manifest_path)
+    # Not worth sending to the pool
+    if len(stale) < MANIFEST_BATCH_SIZE:
+        return
+    batches = [stale[start:start+MANIFEST_BATCH_SIZE] for start in range(0, len(stale), MANIFEST_BATCH_SIZE)]
+    for batch, entries in zip(batches, image_pool.map(load_manifest_entries, batches)):
+        for manifest_path, entry in zip(batch, entries):
+            cache_manifest(manifest_path, entry)
+
+def check_manifest_structures(items) -> int:
+    """Check the manifests of all items, given as (item, type), in one pass and
+    print every error of the ones that will be skipped. Manifests that are not
+    cached are parsed on the process pool first. Returns how many will be
+    skipped."""
+    def check(item, type):
+        manifest_path = os.path.join(type+"s", item, 'manifest.yml')
+        if not os.path.isfile(manifest_path):
+            return [("missing_manifest", "manifest.yml file not found", True)]
+        try:
+            return manifest_structure_errors(manifest_path, type)
+        except Exception as e:
+            return [("manifest_error", f"Failed to read manifest.yml: {str(e)}", True)]
+
+    start = time.perf_counter()
+    with timed_stage("validate", manifests=len(items)):
+        manifest_paths = [os.path.join(type+"s", item, 'manifest.yml') for item, type in items]
+        prefetch_manifests([path for path in manifest_paths if os.path.isfile(path)])
+        results = [check(item, type) for item, type in items]
+    failed = [(item, type, errors) for (item, type), errors in zip(items, results)
+              if any(critical for _, _, critical in errors)]
+    print(f"Checked {len(items)} manifests in {1000 * (time.perf_counter() - start):.0f}ms, "
+          f"{len(failed)} with errors that skip the item")
+    for item, type, errors in failed:
+        print(f"  {type}s/{item}:")
+        for _, message, critical in errors:
+            print(f"    {'error' if critical else 'warning'}: {message}")
+    return len(failed)
 
 def check_folder_sturcture(folder) -> bool:
     return os.path.isfile(os.path.join(folder, 'manifest.yml'))
@@ -307,18 +2240,16 @@ def validate_app_files(src, manifest, type) -> bool:
                 if not os.path.exists(screenshot_path):
                     add_warning(src, "missing_screenshot", f"Screenshot file not found: {screenshot}", type)
     
+    # Remote checks as (url, not found warning, failed check warning, critical),
+    # all HEAD requests of the item are sent as one concurrent batch
+    remote_checks = []
     if manifest.get('sources'):
         sources = manifest['sources']
         if isinstance(sources, dict) and sources.get('location', {}).get('origin'):
             repo_url = sources['location']['origin']
             if 'github.com' in repo_url:
-                try:
-                    response = requests.head(repo_url, timeout=5)
-                    if response.status_code == 404:
-                        add_warning(src, "repo_not_found", f"Repository not found: {repo_url}", type)
-                        is_valid = False
-                except Exception as e:
-                    add_warning(src, "repo_check_failed", f"Could not verify repository: {str(e)}", type)
+                remote_checks.append((repo_url, ("repo_not_found", f"Repository not found: {repo_url}"),
+                                      ("repo_check_failed", "Could not verify repository"), True))
     
     if type == "app" and manifest.get('executionfile'):
         exec_file = manifest['executionfile']
@@ -326,136 +2257,74 @@ def validate_app_files(src, manifest, type) -> bool:
             location = exec_file['location']
             if isinstance(location, dict) and location.get('origin'):
                 exec_url = location['origin']
-                try:
-                    response = requests.head(exec_url, timeout=5)
-                    if response.status_code == 404:
-                        add_warning(src, "exec_file_not_found", f"Execution file not found: {exec_url}", type)
-                        # Don't mark as invalid - just warn
-                except Exception as e:
-                    add_warning(src, "exec_file_check_failed", f"Could not verify execution file: {str(e)}", type)
+                # Don't mark as invalid - just warn
+                remote_checks.append((exec_url, ("exec_file_not_found", f"Execution file not found: {exec_url}"),
+                                      ("exec_file_check_failed", "Could not verify execution file"), False))
+
+    for screenshot in manifest.get('screenshots') or []:
+        if is_remote(screenshot):
+            remote_checks.append((screenshot, ("missing_screenshot", f"Screenshot file not found: {screenshot}"),
+                                  ("screenshot_check_failed", "Could not verify screenshot"), False))
+
+    statuses = url_statuses([url for url, _, _, _ in remote_checks])
+    for url, (not_found_type, not_found_message), (failed_type, failed_message), critical in remote_checks:
+        status = statuses[url]
+        if status is None:
+            print(f"  Offline, not checked before: {url}")
+        elif isinstance(status, Exception):
+            add_warning(src, failed_type, f"{failed_message}: {str(status)}", type)
+        elif status == 404:
+            add_warning(src, not_found_type, not_found_message, type)
+            if critical:
+                is_valid = False
     
     return is_valid
 
-def check_manifest(src, type) -> dict:
-    manifest_path = os.path.join(type+"s", src, 'manifest.yml')
+def check_manifest(src, type) -> Manifest:
+    folder = os.path.join(type+"s", src)
+    manifest_path = os.path.join(folder, 'manifest.yml')
     print(manifest_path)
     
     try:
-        with open(manifest_path, 'r') as file:
-            manifest = yaml.safe_load(file)
+        with timed_stage("parse", bytes_in=os.path.getsize(manifest_path)):
+            data = parse_manifest_file(manifest_path)
+        if not isinstance(data, dict):
+            raise ValueError("expected a mapping of fields")
     except Exception as e:
         add_warning(src, "manifest_error", f"Failed to read manifest.yml: {str(e)}", type)
         return None
-    
-    if 'name' in manifest:
-        print(f"Name: {manifest['name']}")
-    else:
-        add_warning(src, "missing_field", "Name not found in manifest file", type)
-        return None
-    
-    if type == "app":
-        if 'keira_version' in manifest:
-            print(f"keira_version: {manifest['keira_version']}")
-        else:
-            add_warning(src, "missing_field", "keira_version not found in manifest file", type)
-            return None
+    errors = manifest_structure_errors(manifest_path, type, data)
+    manifest = Manifest(data, folder, src, type)
+    is_valid = True
 
-    if 'description' in manifest:
-        if manifest['description'][0] == '@':
-            try:
-                manifest['description'] = open(os.path.join(type+"s", src, manifest['description'][1:]), 'r').read()
-            except Exception as e:
-                add_warning(src, "file_read_error", f"Failed to read description file: {str(e)}", type)
-                manifest['description'] = ""
-        else:
-            pass
-        print(f"Description: {manifest['description']}")
-    else:
-        manifest['description'] = ""
-        print("Description: (not provided)")
-    
-    if 'short_description' in manifest:
-        if manifest['short_description'][0] == '@':
-            try:
-                manifest['short_description'] = open(os.path.join(type+"s", src, manifest['short_description'][1:]), 'r').read()
-            except Exception as e:
-                add_warning(src, "file_read_error", f"Failed to read short_description file: {str(e)}", type)
-                return None
-        else:
-            pass
-        print(f"Short Description: {manifest['short_description']}")
-    else:
-        add_warning(src, "missing_field", "Short Description not found in manifest file", type)
-        return None
-    
-    if 'changelog' in manifest:
-        if(manifest['changelog'][0] == '@'):
-            try:
-                manifest['changelog'] = open(os.path.join(type+"s", src, manifest['changelog'][1:]), 'r').read()
-            except Exception as e:
-                add_warning(src, "file_read_error", f"Failed to read changelog file: {str(e)}", type)
-                manifest['changelog'] = ""
-        else:
-            pass
-        print(f"Changelog: {manifest['changelog']}")
-    else:
-        manifest['changelog'] = ""
-        print("Changelog: (not provided)")
+    # @file references are read when their text is first needed, only check that the files exist
+    for field in MANIFEST_FILE_FIELDS:
+        reference = manifest.references.get(field)
+        if reference is not None and not os.path.isfile(os.path.join(folder, reference)):
+            add_warning(src, "file_read_error", f"Failed to read {field} file: file not found: {reference}", type)
+            if field == 'short_description':
+                is_valid = False
+            manifest[field] = ""
 
-    if 'author' in manifest:
-        print(f"Author: {manifest['author']}")
-    else:
-        add_warning(src, "missing_field", "Author not found in manifest file", type)
-        return None
-    
-    if 'icon' in manifest:
-        print(f"Icon: {manifest['icon']}")
-    else:
-        add_warning(src, "missing_field", "Icon not found in manifest file (optional)", type)
-        # Don't return None - icon is now optional
-    
-    if 'sources' in manifest:
-        print(f"sources: {manifest['sources']}")
-        if 'type' in manifest['sources']:
-            print(f"sources type: {manifest['sources']['type']}")
-        else:
-            add_warning(src, "missing_field", "sources type not found in manifest file", type)
-            return None
-        if 'location' in manifest['sources']:
-            print(f"sources location: {manifest['sources']['location']}")
-            if 'origin' in manifest['sources']['location']:
-                print(f"sources origin: {manifest['sources']['location']['origin']}")
-            else:
-                add_warning(src, "missing_field", "sources origin not found in manifest file", type)
-                return None
-        else:
-            add_warning(src, "missing_field", "sources location not found in manifest file", type)
-            return None
-    else:
-        add_warning(src, "missing_field", "sources not found in manifest file", type)
-        return None
-    
-    if type == "app":
-        if 'executionfile' in manifest:
-            print(f"executionfile: {manifest['executionfile']}")
-        else:
-            add_warning(src, "missing_field", "executionfile not found in manifest file (optional)", type)
-            # Don't return None - executionfile is now optional
-    elif type == "mod":
-        if 'modfiles' in manifest:
-            print(f"Modfile: {manifest['modfiles']}")
-        else:
-            add_warning(src, "missing_field", "modfiles not found in manifest file (optional)", type)
-            manifest['modfiles'] = []
-    else:
-        add_warning(src, "unknown_type", f"Unknown type: {type}", type)
+    for warning_type, message, critical in errors:
+        add_warning(src, warning_type, message, type)
+        is_valid = is_valid and not critical
+    if not is_valid:
         return None
+
+    if 'description' not in manifest:
+        manifest.description = ""
+    if 'changelog' not in manifest:
+        manifest.changelog = ""
+    if type == "mod" and 'modfiles' not in manifest:
+        manifest.modfiles = []
     
     # Validate all files exist
-    if not validate_app_files(src, manifest, type):
-        return None
+    with timed_stage("validate"):
+        if not validate_app_files(src, manifest, type):
+            return None
     
-    manifest['path'] = src.split('/')[-1]
+    manifest.path = src.split('/')[-1]
 
     return manifest
         
@@ -470,47 +2339,439 @@ def scan_mods_folder() -> list[str]:
     folder_list = sorted(folder_list)
     return folder_list
 
+def process_item(item, type) -> dict:
+    """Validate and build one app or mod, returns its index.json data or None"""
+    _item_context.item = type+"s/"+item
+    try:
+        return build_item(item, type)
+    finally:
+        del _item_context.item
+
+def build_item(item, type) -> dict:
+    manifest = validate_item(item, type)
+    if manifest is not None:
+        return process_manifest(manifest, type)
+    return None
+
+def validate_item(item, type) -> Manifest:
+    """Parse and validate an item's manifest, None if the item can't be built"""
+    if(check_folder_sturcture(os.path.join('./'+type+'s', item))):
+        manifest = check_manifest(item, type)
+        if manifest is None:
+            print(f"Skipping {type}: {item} (validation failed)")
+        return manifest
+    add_warning(item, "missing_manifest", "manifest.yml file not found", type)
+    print(f"Skipping {type}: {item} (manifest.yml not found)")
+    return None
+
+def process_item_isolated(item, type) -> tuple:
+    """Process an item on a worker thread, returns its result and the warnings it raised"""
+    _item_context.warnings = []
+    try:
+        return process_item(item, type), _item_context.warnings
+    finally:
+        del _item_context.warnings
+
+def iter_processed_items(items, type):
+    """Process items in folder order, yields (item, index.json data or None, warnings).
+    With --jobs the items run on a thread pool, but only a few more than there are
+    workers are in flight at once, so finished results never pile up."""
+    if args.jobs <= 1:
+        for item in items:
+            yield (item, *process_item_isolated(item, type))
+        return
+
+    # Network-bound work runs on a bounded thread pool, results are yielded in
+    # folder order so that warnings.json stays deterministic
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        for item in items:
+            in_flight.append((item, pool.submit(process_item_isolated, item, type)))
+            if len(in_flight) >= 2 * args.jobs:
+                item, future = in_flight.popleft()
+                yield (item, *future.result())
+        while in_flight:
+            item, future = in_flight.popleft()
+            yield (item, *future.result())
+
+def process_items(items, type) -> list[tuple]:
+    """Process items in folder order, returns (item, index.json data) of the built ones"""
+    built = []
+    for item, result, warnings in iter_processed_items(items, type):
+        record_warnings(warnings)
+        if result is not None:
+            built.append((item, result))
+    return built
+
 def process_apps_folder(apps):
-    for app in apps:
-        if(check_folder_sturcture(os.path.join('./apps', app))):
-            manifest = check_manifest(app, 'app')
-            if manifest is not None:
-                process_manifest(manifest, 'app')
-            else:
-                print(f"Skipping app: {app} (validation failed)")
-        else:
-            add_warning(app, "missing_manifest", "manifest.yml file not found", "app")
-            print(f"Skipping app: {app} (manifest.yml not found)")
-        
+    return process_items(apps, 'app')
+
 def process_mods_folder(mods):
-    for mod in mods:
-        if(check_folder_sturcture(os.path.join('./mods', mod))):
-            manifest = check_manifest(mod, 'mod')
-            if manifest is not None:
-                process_manifest(manifest, 'mod')
-            else:
-                print(f"Skipping mod: {mod} (validation failed)")
-        else:
-            add_warning(mod, "missing_manifest", "manifest.yml file not found", "mod")
-            print(f"Skipping mod: {mod} (manifest.yml not found)")
-        
-def main():
-    apps: list[str] = scan_apps_folder()
-    mods: list[str] = scan_mods_folder()
+    return process_items(mods, 'mod')
 
-    print(apps)
-    print(mods)
+def stream_items(items, type) -> list[str]:
+    """--stream: push the items of a type through the build one at a time,
+    scan -> parse -> validate -> assets in process_item, then emit: warnings go to
+    build/warnings.jsonl and the item to the index writer, and nothing of it is
+    kept besides its path, which is returned for the changes feed"""
+    writer = ItemIndexWriter(type) if args.build else None
+    built = []
+    for item, result, warnings in iter_processed_items(items, type):
+        record_warnings(warnings)
+        finish_item_timings(type+"s/"+item)
+        if result is not None:
+            built.append(type+"s/"+item)
+            if writer is not None:
+                with timed_stage("index"):
+                    writer.add(item, result)
+    if writer is not None:
+        with timed_stage("index"):
+            writer.close()
+    return built
+
+# Changes feed for devices: build/latest.json names the current catalog version,
+# build/changes/<version>.json lists the items added, updated and removed since
+# the version before it and build/changes/snapshot.json has the index.json hash
+# of every item at the latest version, which is also what the next build diffs with
+CHANGES_DIR = "./build/changes"
+CHANGES_KEEP = 100  # Devices further behind sync from the snapshot instead
+
+def gen_changes_feed(paths, rebuilt=None) -> None:
+    """Diff the built items, given by their type+"s/"+item paths, against the
+    previous snapshot and publish a new version if anything changed. With
+    rebuilt, only the index.json of those paths is hashed again, the others
+    are taken from the snapshot."""
+    from datetime import datetime
+    snapshot_path = os.path.join(CHANGES_DIR, "snapshot.json")
+    try:
+        with open(snapshot_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {"version": 0, "items": None}
+
+    old = previous["items"]
+    current = {path: old[path] if rebuilt is not None and old and path in old and path not in rebuilt
+               else hash_file(os.path.join("./build", path, "index.json")) for path in paths}
+    if old is None:
+        added, updated, removed = sorted(current), [], []
+    else:
+        added = sorted(path for path in current if path not in old)
+        updated = sorted(path for path in current if path in old and old[path] != current[path])
+        removed = sorted(path for path in old if path not in current)
+        if not (added or updated or removed):
+            print(f"Changes feed: nothing changed, still at version {previous['version']}")
+            return
 
-    process_apps_folder(apps)
-    process_mods_folder(mods)
+    version = previous["version"] + 1
+    build_date = datetime.now().isoformat()
+    changes = {
+        "version": version,
+        "previous": previous["version"] if old is not None else None,
+        # No previous snapshot to diff with: everything is listed as added, devices resync
+        "full": old is None,
+        "build_date": build_date,
+        "added": [{"path": path, "sha256": current[path]} for path in added],
+        "updated": [{"path": path, "sha256": current[path]} for path in updated],
+        "removed": removed,
+    }
+    latest = {
+        "version": version,
+        "build_date": build_date,
+        "total": len(current),
+        "changes": f"changes/{version}.json",
+        "oldest": max(1, version - CHANGES_KEEP + 1),
+        "snapshot": "changes/snapshot.json",
+    }
 
+    os.makedirs(CHANGES_DIR, exist_ok=True)
+    for path, data in ((os.path.join(CHANGES_DIR, f"{version}.json"), changes),
+                       (snapshot_path, {"version": version, "items": current}),
+                       ("./build/latest.json", latest)):
+        write_json(path, data)
 
-    if args.build:
-        gen_json_index_manifests(apps, "app")
-        gen_json_index_manifests(mods, "mod")
-    
-    # Write warnings to JSON file
+    # Keep the last CHANGES_KEEP versions
+    for name in os.listdir(CHANGES_DIR):
+        stem = name.split('.')[0]
+        if stem.isdigit() and int(stem) < latest["oldest"]:
+            os.remove(os.path.join(CHANGES_DIR, name))
+    print(f"Changes feed: version {version}, {len(added)} added, {len(updated)} updated, {len(removed)} removed")
+
+def gen_item_indexes(items, type) -> None:
+    """Write the index pages and catalogs that list the built items of a type,
+    given as (item, index.json data) in folder order"""
+    writer = ItemIndexWriter(type)
+    for item, data in items:
+        writer.add(item, data)
+    writer.close()
+
+class ItemIndexUpdater:
+    """Keeps what the index files of a type hold about every item in memory, so
+    that --watch only writes the files a rebuild changes, the same way
+    ItemIndexWriter would have written them:
+    - the index_<page>.json name lists only when items were added or removed
+    - the ordered pages whose items or records changed
+    - catalog.json and catalog.bin from the kept records of the other items
+    - the search shards of the tokens an edit added or removed, all of them when
+      the positions of the items moved
+    It starts from the items the build indexed, as (item, index.json data) in
+    folder order, and assumes build/ holds the index files of exactly those."""
+
+    def __init__(self, type, items):
+        self.type = type
+        self.output_dir = os.path.join("./build", type+"s")
+        self.names = [item for item, _ in items]
+        self.entries = {item: self.entry(item, data) for item, data in items}
+        self.pages = self.paginate()
+
+    def entry(self, item, data) -> dict:
+        """What the index files hold about an item"""
+        catalog = catalog_record(item, data, self.type)
+        text = " ".join([catalog["path"], catalog["name"], catalog["short_description"], catalog["author"]])
+        return {
+            "records": {consumer: page_record(item, data, self.type, consumer) for consumer in INDEX_PAGE_SIZES},
+            "catalog": json.dumps(catalog, ensure_ascii=False, separators=(',', ':')),
+            "tokens": set(tokenize(text)),
+            "binary": binary_catalog_record(item, data, self.output_dir),
+        }
+
+    def paginate(self) -> dict:
+        """The items of every ordered page, by (consumer, order)"""
+        pages = {}
+        for order, key in INDEX_ORDERS.items():
+            ordered = sorted(self.names, key=lambda item: key(self.entries[item]["records"]["web"]))
+            for consumer, page_size in INDEX_PAGE_SIZES.items():
+                pages[consumer, order] = [ordered[start:start+page_size]
+                                          for start in range(0, max(1, len(ordered)), page_size)]
+        return pages
+
+    def update(self, items, rebuilt) -> list[str]:
+        """Write the index files that changed now that the items named in rebuilt
+        were built again or removed, items being all built items as for
+        __init__. Returns the paths it wrote or removed."""
+        data = dict(items)
+        names = [item for item, _ in items]
+        changed = {field: set() for field in ("catalog", "binary", *INDEX_PAGE_SIZES)}
+        tokens = set()
+        for item in set(rebuilt) | (set(names) ^ self.entries.keys()):
+            old = self.entries.pop(item, None)
+            new = self.entry(item, data[item]) if item in data else None
+            if new is not None:
+                self.entries[item] = new
+            for consumer in INDEX_PAGE_SIZES:
+                if (old and old["records"][consumer]) != (new and new["records"][consumer]):
+                    changed[consumer].add(item)
+            for field in ("catalog", "binary"):
+                if (old and old[field]) != (new and new[field]):
+                    changed[field].add(item)
+            tokens |= (old["tokens"] if old else set()) ^ (new["tokens"] if new else set())
+
+        reshaped = names != self.names
+        paths = []
+        if reshaped:
+            paths += self.write_names_pages(names)
+        old_count, self.names = len(self.names), names
+        pages, old_pages = self.paginate(), self.pages
+        self.pages = pages
+
+        for (consumer, order), ordered in pages.items():
+            output_dir = os.path.join(self.output_dir, "pages", consumer, order)
+            old = old_pages[consumer, order]
+            for page, page_items in enumerate(ordered):
+                # Every page holds the total
+                if len(names) == old_count and page < len(old) and page_items == old[page] and \
+                        changed[consumer].isdisjoint(page_items):
+                    continue
+                records = [self.entries[item]["records"][consumer] for item in page_items]
+                path = os.path.join(output_dir, f"{page}.json")
+                write_json(path, {"page": page, "total_pages": len(ordered), "total": len(names), "order": order,
+                                  "manifests": [record["path"] for record in records], "items": records})
+                paths.append(path)
+            paths += self.remove_pages(output_dir, "%d.json", len(ordered), len(old))
+
+        if reshaped or changed["catalog"]:
+            path = os.path.join(self.output_dir, "catalog.json")
+            write_bytes(path, ('{"total":%d,"items":[' % len(names) +
+                               ",".join(self.entries[item]["catalog"] for item in names) + ']}').encode('utf-8'))
+            paths.append(path)
+
+        # Tokens are listed with the positions of their items in folder order
+        search_dir = os.path.join(self.output_dir, "search")
+        shards = {search_shard_name(token) for token in tokens}
+        if reshaped:
+            shards |= {name[:-len(".json")] for name in os.listdir(search_dir) if name.endswith(".json")}
+            shards |= {search_shard_name(token) for item in names for token in self.entries[item]["tokens"]}
+        if shards:
+            index = {shard: {} for shard in shards}
+            for position, item in enumerate(names):
+                for token in self.entries[item]["tokens"]:
+                    shard = search_shard_name(token)
+                    if shard in index:
+                        index[shard].setdefault(token, []).append(position)
+            for shard, shard_tokens in sorted(index.items()):
+                path = os.path.join(search_dir, f"{shard}.json")
+                if shard_tokens:
+                    write_json(path, dict(sorted(shard_tokens.items())))
+                elif os.path.exists(path):
+                    os.remove(path)
+                paths.append(path)
+
+        if reshaped or changed["binary"]:
+            path = os.path.join(self.output_dir, "catalog.bin")
+            writer = BinaryCatalogWriter(path)
+            for item in names:
+                writer.add(self.entries[item]["binary"])
+            writer.close()
+            paths.append(path)
+        print(f"Index {self.type}s: rewrote {len(paths)} files")
+        return paths
+
+    def write_names_pages(self, names) -> list[str]:
+        """Write the index_<page>.json pages whose names changed, all of them when
+        the number of pages did"""
+        size = INDEX_PAGE_SIZES["device"]
+        pages, old_pages = max(1, -(-len(names) // size)), max(1, -(-len(self.names) // size))
+        paths = []
+        for page in range(pages):
+            manifests = names[page*size:(page+1)*size]
+            if pages == old_pages and manifests == self.names[page*size:(page+1)*size]:
+                continue
+            path = os.path.join(self.output_dir, f"index_{page}.json")
+            write_json(path, {"page": page, "total_pages": pages, "manifests": manifests})
+            paths.append(path)
+        return paths + self.remove_pages(self.output_dir, "index_%d.json", pages, old_pages)
+
+    def remove_pages(self, output_dir, name, pages, old_pages) -> list[str]:
+        """Remove the pages output_dir/<name % page> past the last one"""
+        paths = [os.path.join(output_dir, name % page) for page in range(pages, old_pages)]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        return paths
+
+# Output stage: every text file in build/ gets precompressed .gz (and .br with
+# brotli) siblings, and build/assets.json lists the SHA-256, size and encodings
+# of every published file, which is what scripts/upload.py diffs uploads with.
+# Hashes are cached in build/.cache/assets.json by file size and mtime.
+ASSETS_PATH = "./build/assets.json"
+ASSETS_CACHE_PATH = os.path.join(CACHE_DIR, "assets.json")
+ASSETS_VERSION = 1
+COMPRESSIBLE_EXTENSIONS = (".html", ".css", ".js", ".json", ".md", ".txt", ".svg")
+ASSET_ENCODINGS = [("gzip", ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+if brotli is not None:
+    ASSET_ENCODINGS.append(("br", ".br", brotli.compress))
+# Build diagnostics in build/ that are not published
+UNPUBLISHED_FILES = ("assets.json", "metrics.json", "trace.json", "profile.prof", "warnings.jsonl")
+# Downloads interrupted before they were renamed into place
+UNPUBLISHED_SUFFIXES = (".part", ".part.json")
+
+def build_asset(path, cached) -> dict:
+    """Hash a published file and write its compressed siblings, unless the cached
+    entry shows it is unchanged since the last build"""
+    stat = os.stat(path)
+    if (cached and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size
+            and all(os.path.exists(path + extension) for encoding, extension, _ in ASSET_ENCODINGS
+                    if encoding in cached["encodings"])):
+        return cached
+
+    asset = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": hash_file(path), "encodings": {}}
+    if path.endswith(COMPRESSIBLE_EXTENSIONS):
+        with open(path, 'rb') as f:
+            data = f.read()
+        for encoding, extension, compress in ASSET_ENCODINGS:
+            compressed = compress(data)
+            # Tiny files don't get smaller, clients get those as they are
+            if len(compressed) < len(data):
+                write_bytes(path + extension, compressed)
+                asset["encodings"][encoding] = len(compressed)
+            elif os.path.exists(path + extension):
+                os.remove(path + extension)
+    return asset
+
+def walk_paths(paths):
+    """os.walk over files and folders"""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from os.walk(path)
+        elif os.path.exists(path):
+            yield os.path.dirname(path), [], [os.path.basename(path)]
+
+def published_files(paths=("./build",)) -> dict:
+    """The files of build/ that are published, by their key in assets.json,
+    without their precompressed siblings. paths limits it to some files and
+    folders in build/."""
+    files = {}
+    for root, dirs, names in walk_paths(paths):
+        if root == "./build" and ".cache" in dirs:
+            dirs.remove(".cache")
+        for name in names:
+            path = os.path.join(root, name)
+            key = os.path.relpath(path, "./build").replace(os.sep, '/')
+            if key in UNPUBLISHED_FILES or name.startswith(".tmp-") or name.endswith(UNPUBLISHED_SUFFIXES):
+                continue
+            if name.endswith((".gz", ".br")) and name[:-3].endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            files[key] = path
+    return files
+
+def gen_assets(changed=None) -> None:
+    """Precompress the published files of build/ and write build/assets.json.
+    With changed, the files and folders of build/ --watch wrote or removed,
+    only those are looked at again and the other files keep their entry."""
+    cache = {}
+    try:
+        with open(ASSETS_CACHE_PATH, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        # Files compressed without brotli need a .br sibling now that it is installed
+        if state.get("version") == ASSETS_VERSION and state.get("encodings") == [e for e, _, _ in ASSET_ENCODINGS]:
+            cache = state["files"]
+    except (OSError, ValueError):
+        pass
+
+    if changed is None or not cache:
+        changed = ["./build"]
+        kept = {}
+    else:
+        keys = {os.path.relpath(path, "./build").replace(os.sep, '/') for path in changed}
+
+        def is_changed(key):
+            while key:
+                if key in keys:
+                    return True
+                key = key.rpartition('/')[0]
+            return False
+
+        kept = {key: asset for key, asset in cache.items() if not is_changed(key)}
+    paths = published_files(changed)
+    # Siblings of files that are gone are left from a previous build
+    for root, _, names in walk_paths([path + extension for path in changed for extension in ("", ".gz", ".br")]):
+        for name in names:
+            path = os.path.join(root, name)
+            if name.endswith((".gz", ".br")) and name[:-3].endswith(COMPRESSIBLE_EXTENSIONS) and \
+                    not os.path.exists(path[:-3]):
+                os.remove(path)
+
+    keys = sorted(paths)
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        assets = dict(zip(keys, pool.map(lambda key: build_asset(paths[key], cache.get(key)), keys)))
+    assets = dict(sorted({**kept, **assets}.items()))
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(ASSETS_CACHE_PATH, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"version": ASSETS_VERSION, "encodings": [e for e, _, _ in ASSET_ENCODINGS], "files": assets},
+                           ensure_ascii=False, separators=(',', ':')))
+    write_json(ASSETS_PATH, {
+        "version": ASSETS_VERSION,
+        "files": {key: {"sha256": asset["sha256"], "size": asset["size"], "encodings": asset["encodings"]}
+                  for key, asset in assets.items()},
+    })
+    compressed = sum(1 for asset in assets.values() if asset["encodings"])
+    print(f"Assets: {len(assets)} files, {compressed} precompressed, listed in build/assets.json")
+
+def write_warnings() -> None:
     from datetime import datetime
+    if args.stream:
+        write_streamed_warnings(datetime.now().isoformat())
+        return
     warnings_data = {
         "build_date": datetime.now().isoformat(),
         "total_warnings": len(build_warnings),
@@ -518,13 +2779,706 @@ def main():
     }
     
     os.makedirs("./build", exist_ok=True)
-    with open("./build/warnings.json", 'w') as f:
-        json.dump(warnings_data, f, indent=2)
+    write_json("./build/warnings.json", warnings_data)
+
+def write_streamed_warnings(build_date) -> None:
+    """--stream: write warnings.json from build/warnings.jsonl one warning at a
+    time, in the same format as without --stream"""
+    global _warnings_log
+    record_warnings(build_warnings)
+    build_warnings.clear()
+    if _warnings_log is not None:
+        _warnings_log.close()
+        _warnings_log = None
+    else:
+        open(WARNINGS_LOG_PATH, 'w').close()
+    prefix, suffix = json_text({"build_date": build_date, "total_warnings": warnings_logged, "warnings": []}).rsplit("[]", 1)
+    with open(WARNINGS_LOG_PATH, 'r', encoding='utf-8') as log, open("./build/warnings.json", 'w', encoding='utf-8') as f:
+        f.write(prefix + "[")
+        for i, line in enumerate(log):
+            warning = json_text(json.loads(line))
+            if args.pretty:
+                warning = "\n    " + warning.replace("\n", "\n    ")
+            f.write(("," if i else "") + warning)
+        f.write(("\n  ]" if args.pretty and warnings_logged else "]") + suffix)
+
+def warnings_total() -> int:
+    # Only --stream logs warnings
+    return warnings_logged + len(build_warnings)
+
+def print_stage_timings(wall_time):
+    print(f"\nStage timings (summed over {args.jobs} job(s)):")
+    for stage in BUILD_STAGES:
+        print(f"  {stage:<10} {stage_timings.get(stage, 0.0):8.2f}s")
+    print(f"  {'wall':<10} {wall_time:8.2f}s")
+
+def write_metrics(wall_time) -> None:
+    """Write build/metrics.json: stage totals, per-item stage times, the slowest
+    items and every span. With --trace also build/trace.json for chrome://tracing
+    or Perfetto."""
+    items = {}
+    for span in build_spans:
+        if span["item"] and span["stage"] in BUILD_STAGES:
+            stages = items.setdefault(span["item"], {})
+            stages[span["stage"]] = round(stages.get(span["stage"], 0.0) + span["duration"], 6)
+    if args.stream:
+        # No spans were kept, only the slowest items' totals
+        slowest = [(item, duration) for duration, item in sorted(_slowest_items, reverse=True)]
+    else:
+        slowest = sorted(((item, sum(stages.values())) for item, stages in items.items()), key=lambda item: -item[1])[:SLOWEST_ITEMS]
+
+    metrics = {
+        "jobs": args.jobs,
+        "wall": round(wall_time, 6),
+        "stages": {stage: round(stage_timings.get(stage, 0.0), 6) for stage in BUILD_STAGES},
+        "slowest_items": [{"item": item, "duration": round(duration, 6)} for item, duration in slowest],
+        "items": items,
+        "spans": build_spans,
+    }
+    os.makedirs("./build", exist_ok=True)
+    with open("./build/metrics.json", 'w') as f:
+        json.dump(metrics, f, indent=2)
+
+    if args.trace:
+        threads = {}
+        events = []
+        for span in build_spans:
+            tid = threads.setdefault(span["thread"], len(threads))
+            events.append({
+                "name": f"{span['stage']} {span['item'] or ''}".strip(),
+                "cat": span["stage"],
+                "ph": "X",
+                "ts": int(span["start"] * 1e6),
+                "dur": int(span["duration"] * 1e6),
+                "pid": 1,
+                "tid": tid,
+                "args": {key: value for key, value in span.items() if key not in ("start", "duration", "thread")},
+            })
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+                   for name, tid in threads.items()]
+        with open("./build/trace.json", 'w') as f:
+            json.dump({"traceEvents": events}, f)
+
+# Site files copied next to the build output, as scripts/build.site.sh does
+SITE_FILES_DIR = "./site"
+WATCH_DIRS = ("apps", "mods", "site")
+WATCH_INTERVAL = 0.2  # seconds, also how long to wait for an editor to finish saving
+
+def site_files() -> list[tuple]:
+    """(source, destination) of the site files"""
+    names = sorted(os.listdir(SITE_FILES_DIR)) if os.path.isdir(SITE_FILES_DIR) else []
+    files = [(os.path.join(SITE_FILES_DIR, name), os.path.join("./build", name))
+             for name in names if os.path.isfile(os.path.join(SITE_FILES_DIR, name))]
+    if os.path.exists("README.md"):
+        files.append(("README.md", "./build/README.md"))
+    return files
+
+def copy_site_files() -> None:
+    for source, dest in site_files():
+        copy_file(source, dest)
+
+# Build graph: a --build models its outputs as nodes with explicit inputs, one
+# per app/mod (index.json and static/), the index pages and catalogs of each
+# type, the changes feed, warnings.json, each site file and the output stage.
+# The inputs every node was built from are kept in build/.cache/state.json, a
+# node only runs when they changed, when an output is missing, or when it can't
+# tell (a remote file without validators). --dry-run prints what would run and why.
+class BuildGraph:
+    """Nodes run once the nodes they depend on are done, nodes that don't
+    depend on each other in parallel on --jobs threads"""
+
+    def __init__(self):
+        self.nodes = {}
+
+    def add(self, name, inputs, action, outputs=(), deps=(), reuse=None, item=False) -> None:
+        """Add a node after the nodes it depends on. inputs() returns what the
+        node's output depends on as a dict, or None when there is nothing to
+        build; action() writes the outputs and returns the node's result, reuse()
+        the result of the previous build, None if that can't be reused. Item
+        nodes run in their item's context, for the metrics and warnings."""
+        assert all(dep in self.nodes for dep in deps), f"{name} depends on unknown nodes"
+        self.nodes[name] = {"inputs": inputs, "action": action, "outputs": list(outputs), "deps": list(deps),
+                            "reuse": reuse, "item": item, "state": None, "reason": None, "result": None,
+                            "warnings": []}
+
+    def result(self, name):
+        return self.nodes[name]["result"]
+
+    def warnings(self, names) -> list:
+        """Warnings of the given item nodes, in their order"""
+        return [warning for name in names for warning in self.nodes[name]["warnings"]]
+
+    def evaluate(self, name, dry_run) -> None:
+        node = self.nodes[name]
+        if node["item"]:
+            _item_context.item = name
+            _item_context.warnings = node["warnings"]
+        try:
+            # What a node depends on can't be compared before it was rebuilt
+            stale = [dep for dep in node["deps"] if self.nodes[dep]["state"] == "stale"]
+            if stale:
+                node["state"], node["reason"] = "stale", f"{stale[0]} would rebuild" + \
+                    (f" and {len(stale) - 1} more" if len(stale) > 1 else "")
+                return
+            inputs = node["inputs"]()
+            if inputs is None:
+                node["state"] = "skipped"
+                return
+            reason = node_stale_reason(name, inputs, node["outputs"])
+            if reason is None and node["reuse"] is not None:
+                node["result"] = node["reuse"]()
+                if node["result"] is None:
+                    reason = "previous output is incomplete"
+            if reason is None:
+                if node["item"]:
+                    print(f"Up to date, reusing build output: {name}")
+                node["state"] = "reused"
+            elif dry_run:
+                node["state"], node["reason"] = "stale", reason
+                return
+            else:
+                print(f"Building {name}: {reason}")
+                node["result"] = node["action"]()
+                node["state"], node["reason"] = "built", reason
+            record_node(name, inputs)
+        finally:
+            if node["item"]:
+                del _item_context.item
+                del _item_context.warnings
+
+    def run(self, dry_run=False) -> None:
+        if args.jobs <= 1:
+            for name in self.nodes:
+                self.evaluate(name, dry_run)
+        else:
+            waiting = {name: set(node["deps"]) for name, node in self.nodes.items()}
+            dependents = {}
+            for name, node in self.nodes.items():
+                for dep in node["deps"]:
+                    dependents.setdefault(dep, []).append(name)
+            with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+                running = {pool.submit(self.evaluate, name, dry_run): name for name, deps in waiting.items() if not deps}
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        future.result()
+                        for dependent in dependents.get(name, []):
+                            waiting[dependent].discard(name)
+                            if not waiting[dependent]:
+                                running[pool.submit(self.evaluate, dependent, dry_run)] = dependent
+        self.report(dry_run)
+
+    async def run_async(self, prefetch, dry_run=False) -> None:
+        """run() on asyncio: every node is a task that starts once the nodes it
+        depends on are done, awaits prefetch(name) for item nodes and then
+        evaluates the node on a thread of --jobs threads (at least 2)"""
+        executor = ThreadPoolExecutor(max_workers=max(2, args.jobs))
+        loop = asyncio.get_running_loop()
+        tasks = {}
+
+        async def evaluate(name, node):
+            await asyncio.gather(*(tasks[dep] for dep in node["deps"]))
+            if node["item"]:
+                await prefetch(name)
+            await loop.run_in_executor(executor, self.evaluate, name, dry_run)
+
+        try:
+            for name, node in self.nodes.items():
+                tasks[name] = asyncio.create_task(evaluate(name, node))
+            await asyncio.gather(*tasks.values())
+        finally:
+            executor.shutdown()
+        self.report(dry_run)
+
+    def report(self, dry_run) -> None:
+        states = [node["state"] for node in self.nodes.values()]
+        if dry_run:
+            print(f"\nBuild plan: {states.count('stale')} of {len(states)} nodes would rebuild")
+            for name, node in self.nodes.items():
+                if node["state"] == "stale":
+                    print(f"  {name}: {node['reason']}")
+        else:
+            print(f"\nBuild graph: {len(states)} nodes, {states.count('built')} rebuilt, "
+                  f"{states.count('reused')} up to date, {states.count('skipped')} skipped")
+
+    def built_items(self, items, type) -> list[tuple]:
+        """(item, index.json data) of the built items of a type, in folder order"""
+        return [(item, self.result(type+"s/"+item)) for item in items if self.result(type+"s/"+item) is not None]
+
+def item_output_hashes(keys) -> dict:
+    return {key: hash_file(os.path.join("./build", key, "index.json")) for key in keys}
+
+def build_graph(apps, mods) -> BuildGraph:
+    """The nodes of a --build"""
+    graph = BuildGraph()
+    items = {"app": apps, "mod": mods}
+    item_keys = [type+"s/"+item for type in ("app", "mod") for item in items[type]]
+
+    for type in ("app", "mod"):
+        for item in items[type]:
+            key = type+"s/"+item
+            validated = {}
+
+            def inputs(item=item, type=type, validated=validated):
+                manifest = validate_item(item, type)
+                if manifest is None:
+                    return None
+                validated["manifest"] = manifest
+                with timed_stage("cache"):
+                    return item_inputs(manifest, type)
+
+            graph.add(key, inputs, lambda type=type, validated=validated: write_item_output(validated.pop("manifest"), type),
+                      item_outputs(key, type), reuse=lambda key=key: load_item_output(key), item=True)
+
+    def built_keys(type):
+        return [type+"s/"+item for item, _ in graph.built_items(items[type], type)]
+
+    for type in ("app", "mod"):
+        output_dir = os.path.join("./build", type+"s")
+
+        def index_inputs(type=type):
+            keys = built_keys(type)
+            hashes = item_output_hashes(keys)
+            return {"page_sizes": INDEX_PAGE_SIZES,
+                    **{key: [hashes[key], item_update_time(key.split("/", 1)[1], type)] for key in keys}}
+
+        def gen_indexes(type=type):
+            with timed_stage("index"):
+                gen_item_indexes(graph.built_items(items[type], type), type)
+
+        graph.add(f"index:{type}s", index_inputs, gen_indexes,
+                  [os.path.join(output_dir, name) for name in ("index_0.json", "catalog.json", "catalog.bin")],
+                  deps=[type+"s/"+item for item in items[type]])
+
+    def changes_feed():
+        with timed_stage("index"):
+            gen_changes_feed(built_keys("app") + built_keys("mod"))
+
+    graph.add("changes", lambda: item_output_hashes(built_keys("app") + built_keys("mod")), changes_feed,
+              [os.path.join(CHANGES_DIR, "snapshot.json"), "./build/latest.json"], deps=item_keys)
+
+    def warnings_inputs():
+        record_warnings(graph.warnings(item_keys))
+        return {"warnings": hashlib.sha256(json.dumps(build_warnings, sort_keys=True).encode('utf-8')).hexdigest()}
+
+    graph.add("warnings", warnings_inputs, write_warnings, ["./build/warnings.json"], deps=item_keys)
+
+    def prune_inputs():
+        return {key: "removed" for key in stale_item_outputs(set(built_keys("app") + built_keys("mod")))}
+
+    graph.add("prune", prune_inputs, lambda: remove_item_outputs(prune_inputs()), deps=item_keys)
+
+    def copy_site_file(source, dest):
+        # Site files don't wait for the items, build/ may not exist yet
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        copy_file(source, dest)
+
+    for source, dest in site_files():
+        graph.add(f"site:{os.path.basename(dest)}", lambda source=source: {os.path.normpath(source): hash_file(source)},
+                  lambda source=source, dest=dest: copy_site_file(source, dest), [dest])
+
+    def assets_inputs():
+        files = published_files()
+        listing = "\n".join(f"{key} {os.path.getsize(files[key])} {os.stat(files[key]).st_mtime_ns}" for key in sorted(files))
+        return {"build/": hashlib.sha256(listing.encode('utf-8')).hexdigest()}
+
+    def gen_output():
+        with timed_stage("output"):
+            gen_assets()
+
+    graph.add("assets", assets_inputs, gen_output, [ASSETS_PATH], deps=list(graph.nodes))
+    return graph
+
+# Async engine (--async): the build graph runs on asyncio, every node starting as
+# soon as the nodes it depends on are done. Before an item is validated all the
+# HEAD requests its validation and inputs need are sent at once, at most
+# HTTP_POOL_SIZE per host so no request waits for a pooled connection on a
+# thread, and they land in the HEAD cache. Nodes run on threads and images are
+# encoded on the process pool, so one item's downloads overlap another's image
+# work. The output is the same as with the default engine.
+_http_executor = None
+_host_semaphores = {}
+
+def item_head_urls(item, type) -> list[str]:
+    """The URLs validating and fingerprinting an item sends HEAD requests for,
+    none if its manifest has structural errors and the item is skipped"""
+    try:
+        manifest_path = os.path.join(type+"s", item, 'manifest.yml')
+        data = parse_manifest_file(manifest_path)
+        if any(critical for _, _, critical in manifest_structure_errors(manifest_path, type, data)):
+            return []
+        manifest = Manifest(data, os.path.join(type+"s", item), item, type)
+        urls = item_remote_urls(manifest, type)
+        origin = (manifest.sources or {}).get('location', {}).get('origin')
+    except Exception:
+        # Validation reports what is wrong with the manifest
+        return []
+    if isinstance(origin, str) and 'github.com' in origin and cached_url_status(origin) is None:
+        urls.append(origin)
+    return [url for url in dict.fromkeys(urls) if isinstance(url, str) and is_remote(url)]
+
+def check_remote_urls(items) -> None:
+    """Resolve the status of the remote URLs of all items, given as (item, type),
+    in one concurrent batch. Validating the items one at a time then finds them
+    in the URL status cache and the HEAD cache instead of sending requests."""
+    if args.offline:
+        return
+    start = time.perf_counter()
+    urls = list(dict.fromkeys(url for item, type in items for url in item_head_urls(item, type)))
+    with timed_stage("validate", urls=len(urls)):
+        statuses = url_statuses(urls)
+    failed = sum(1 for status in statuses.values() if isinstance(status, Exception) or status >= 400)
+    print(f"Checked {len(urls)} remote URLs in {time.perf_counter() - start:.2f}s, {failed} not found or failed")
+
+def prefetch_head(url, name) -> None:
+    _item_context.item = name
+    try:
+        http_head(url)
+    except Exception:
+        pass  # Not cached, the item's validation asks again and reports the error
+    finally:
+        del _item_context.item
+
+async def async_http_head(url, name) -> None:
+    """Send a HEAD request of the item node name into the HEAD cache, at most
+    HTTP_POOL_SIZE per host at once"""
+    semaphore = _host_semaphores.setdefault(urlsplit(url).netloc, asyncio.Semaphore(HTTP_POOL_SIZE))
+    async with semaphore:
+        await asyncio.get_running_loop().run_in_executor(_http_executor, prefetch_head, url, name)
+
+async def prefetch_item(name) -> None:
+    """Send the HEAD requests of the item node name ("apps/<item>") concurrently"""
+    folder, item = name.split("/", 1)
+    urls = await asyncio.get_running_loop().run_in_executor(_http_executor, item_head_urls, item, folder[:-1])
+    await asyncio.gather(*(async_http_head(url, name) for url in urls))
+
+async def run_graph_async(graph, dry_run=False) -> None:
+    global _http_executor
+    _http_executor = ThreadPoolExecutor(max_workers=max(1, args.http_concurrency))
+    _host_semaphores.clear()
+    try:
+        await graph.run_async(prefetch_item, dry_run)
+    finally:
+        _http_executor.shutdown()
+        _http_executor = None
+
+def snapshot_watched_files() -> dict:
+    """Modification time and size of every file under WATCH_DIRS"""
+    files = {}
+    for folder in WATCH_DIRS:
+        for root, dirs, names in os.walk(folder):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files[path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+def watch_changes():
+    """Yield the sets of paths that changed under WATCH_DIRS. Uses watchdog
+    (inotify on Linux) when it is installed, polls modification times otherwise."""
+    if Observer is None:
+        print(f"Watching {', '.join(WATCH_DIRS)} (polling, install watchdog for inotify)")
+        previous = snapshot_watched_files()
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            current = snapshot_watched_files()
+            changed = {path for path in current.keys() | previous.keys() if current.get(path) != previous.get(path)}
+            previous = current
+            if changed:
+                yield changed
+
+    changes = queue.Queue()
+
+    class ChangeHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.event_type in ("created", "modified", "deleted", "moved"):
+                changes.put(event.src_path)
+                if getattr(event, "dest_path", None):
+                    changes.put(event.dest_path)
+
+    observer = Observer()
+    for folder in WATCH_DIRS:
+        observer.schedule(ChangeHandler(), folder, recursive=True)
+    observer.start()
+    print(f"Watching {', '.join(WATCH_DIRS)}")
+    try:
+        while True:
+            changed = {changes.get()}
+            # Collect the rest of the burst an editor save or git checkout causes
+            time.sleep(WATCH_INTERVAL)
+            while not changes.empty():
+                changed.add(changes.get())
+            yield {os.path.relpath(path) for path in changed}
+    finally:
+        observer.stop()
+
+def rebuild_changes(changed, folders, built, indexes) -> None:
+    """Rebuild the items and site files that changed paths belong to, then the
+    index files of their types that changed, with the ItemIndexUpdater of each
+    type in indexes"""
+    start_time = time.perf_counter()
+    items = set()
+    site_changed = False
+    for path in changed:
+        parts = os.path.normpath(path).split(os.sep)
+        if parts[0] == "site":
+            site_changed = True
+        elif parts[0] in ("apps", "mods") and len(parts) > 1:
+            type = parts[0][:-1]
+            # Skip loose files next to the item folders
+            if os.path.isdir(os.path.join(parts[0], parts[1])) or parts[1] in folders[type]:
+                items.add((type, parts[1]))
+
+    if not (items or site_changed):
+        return
+    # Written outside the build graph below, the next build runs these nodes again
+    with _build_state_lock:
+        names = build_state["nodes"].keys() | previous_build_state.get("nodes", {}).keys()
+    forget_nodes([name for name in names if not name.startswith(("apps/", "mods/"))])
+
+    if site_changed:
+        print("Site files changed, copying them to build/")
+        copy_site_files()
+    # What gen_assets has to look at again
+    written = [dest for _, dest in site_files()] if site_changed else []
+    if not items:
+        save_build_state()
+        gen_assets(written)
+        return
+
+    build_spans.clear()
+    for type, item in sorted(items):
+        print(f"\nRebuilding {type}s/{item}")
+        build_warnings[:] = [w for w in build_warnings if not (w["name"] == item and w.get("item_type") == type)]
+        forget_item_update_time(item, type)
+        result = None
+        if os.path.isdir(os.path.join(type+"s", item)):
+            try:
+                result, warnings = process_item_isolated(item, type)
+                build_warnings.extend(warnings)
+            except Exception as e:
+                print(f"ERROR: Failed to rebuild {type}s/{item}: {e}")
+        if result is None:
+            remove_item_outputs([type+"s/"+item])
+            built[type].pop(item, None)
+        else:
+            built[type][item] = result
+            written += [os.path.join(BLOBS_DIR, blob) for blob in result.get("blobs", {}).values()]
+        written.append(os.path.join("./build", type+"s", item))
+
+    for type in sorted({type for type, _ in items}):
+        folders[type] = scan_apps_folder() if type == "app" else scan_mods_folder()
+        written += indexes[type].update([(item, built[type][item]) for item in folders[type] if item in built[type]],
+                                        [item for item_type, item in items if item_type == type])
+    gen_changes_feed([type+"s/"+item for type in ("app", "mod") for item in built[type]],
+                     {type+"s/"+item for type, item in items})
+    written += [CHANGES_DIR, "./build/latest.json", "./build/warnings.json"]
+
+    save_build_state()
+    save_manifest_cache()
+    save_url_cache()
+    save_validation_cache()
+    save_fixtures()
+    write_warnings()
+    gen_assets(written)
+    print(f"Rebuilt {len(items)} item(s) in {time.perf_counter() - start_time:.2f}s, {len(build_warnings)} warnings")
+
+# Content types the CDN serves, some of which http.server doesn't know
+SERVE_CONTENT_TYPES = {
+    ".json": "application/json",
+    ".js": "text/javascript",
+    ".md": "text/markdown; charset=utf-8",
+    ".bin": "application/octet-stream",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+
+class PreviewRequestHandler(SimpleHTTPRequestHandler):
+    """Serves build/ the way the CDN does: the precompressed .br/.gz sibling when
+    the client accepts it, other text files gzipped on the fly, nothing cached"""
+    extensions_map = {**SimpleHTTPRequestHandler.extensions_map, **SERVE_CONTENT_TYPES}
+
+    def __init__(self, *handler_args, **kwargs):
+        super().__init__(*handler_args, directory="./build", **kwargs)
+
+    def log_message(self, format, *log_args):
+        pass
+
+    def end_headers(self):
+        self.send_header("Cache-Control", "no-cache")
+        super().end_headers()
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split('?')[0].endswith('/'):
+            path = os.path.join(path, "index.html")
+        if not os.path.isfile(path) or not path.endswith(COMPRESSIBLE_EXTENSIONS):
+            return super().send_head()
+
+        accepted = self.headers.get("Accept-Encoding", "")
+        body, encoding = None, None
+        for candidate, extension in (("br", ".br"), ("gzip", ".gz")):
+            # A precompressed sibling older than the file is left over from a previous build
+            compressed = path + extension
+            if candidate in accepted and os.path.exists(compressed) and os.path.getmtime(compressed) >= os.path.getmtime(path):
+                with open(compressed, 'rb') as f:
+                    body, encoding = f.read(), candidate
+                break
+        if body is None:
+            with open(path, 'rb') as f:
+                body = f.read()
+            if "gzip" in accepted:
+                body, encoding = gzip.compress(body, compresslevel=6), "gzip"
+
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(path))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        return io.BytesIO(body)
+
+def start_preview_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), PreviewRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving build/ on http://localhost:{server.server_address[1]}")
+    return server
+
+def dump_catalog(path) -> None:
+    records = read_binary_catalog(path)
+    for record in records:
+        if "icon" in record:
+            record["icon"] = f"<{len(record['icon'])} bytes RGB565>"
+    json.dump(records, sys.stdout, indent=2, ensure_ascii=False)
+    print()
+
+def decode_preview(path) -> None:
+    """Decode a screenshot preview with the reference decoder and save it as PNG next to it"""
+    width, height, pixels = read_screen_preview(path)
+    output_path = os.path.splitext(path)[0] + ".png"
+    rgb565_to_rgb(pixels, width, height).save(output_path)
+    print(f"{path}: {width}x{height}, saved as {output_path}")
+
+def main():
+    global image_pool
+    if args.dump_catalog:
+        dump_catalog(args.dump_catalog)
+        return
+    if args.decode_preview:
+        decode_preview(args.decode_preview)
+        return
+
+    start_time = time.perf_counter()
+
+    apps: list[str] = scan_apps_folder()
+    mods: list[str] = scan_mods_folder()
+
+    print(apps)
+    print(mods)
+
+    load_manifest_cache()
+    load_url_cache()
+    load_validation_cache()
+    if args.build:
+        load_build_state()
+    items = [(app, "app") for app in apps] + [(mod, "mod") for mod in mods]
+
+    if (args.jobs > 1 or args.async_engine) and not args.dry_run:
+        # Spawn rather than fork, the pool is used from worker threads
+        image_pool = ProcessPoolExecutor(max_workers=process_pool_workers(),
+                                         mp_context=multiprocessing.get_context("spawn"))
+    try:
+        check_manifest_structures(items)
+        if args.record:
+            load_fixtures(args.record)
+        if args.replay:
+            start_replay_server()
+        check_remote_urls(items)
+
+        if args.stream:
+            built_paths = stream_items(apps, "app") + stream_items(mods, "mod")
+        elif args.build:
+            graph = build_graph(apps, mods)
+            if args.async_engine:
+                asyncio.run(run_graph_async(graph, args.dry_run))
+            else:
+                graph.run(dry_run=args.dry_run)
+            built_apps = graph.built_items(apps, "app")
+            built_mods = graph.built_items(mods, "mod")
+        else:
+            built_apps = process_apps_folder(apps)
+            built_mods = process_mods_folder(mods)
+    finally:
+        if image_pool is not None:
+            image_pool.shutdown()
+            image_pool = None
+    if args.replay:
+        print(f"Replayed {_fixture_stats['replayed']} responses, {_fixture_stats['missing']} requests had no fixture")
+    if args.dry_run:
+        return
+    save_manifest_cache()
+    save_url_cache()
+    save_validation_cache()
+    save_fixtures()
+
+    if args.stream:
+        with timed_stage("index"):
+            gen_changes_feed(built_paths)
+    if args.build:
+        save_build_state()
+        prune_render_cache()
+
+    # The build graph wrote warnings.json, the site files and assets.json
+    if not args.build or args.stream:
+        write_warnings()
+    if args.stream:
+        copy_site_files()
+        remove_item_outputs(stale_item_outputs(set(built_paths)))
+        with timed_stage("output"):
+            gen_assets()
     
     print(f"\n{'='*50}")
-    print(f"Build completed with {len(build_warnings)} warnings")
+    print(f"Build completed with {warnings_total()} warnings")
     print(f"Warnings saved to: build/warnings.json")
     print(f"{'='*50}")
 
+    wall_time = time.perf_counter() - start_time
+    print_stage_timings(wall_time)
+    write_metrics(wall_time)
+    print("Metrics saved to: build/metrics.json" + (", build/trace.json" if args.trace else ""))
+
+    if args.watch or args.serve:
+        if args.serve:
+            start_preview_server()
+        try:
+            if args.watch:
+                folders = {"app": apps, "mod": mods}
+                built = {"app": dict(built_apps), "mod": dict(built_mods)}
+                indexes = {"app": ItemIndexUpdater("app", built_apps), "mod": ItemIndexUpdater("mod", built_mods)}
+                for changed in watch_changes():
+                    rebuild_changes(changed, folders, built, indexes)
+            else:
+                threading.Event().wait()
+        except KeyboardInterrupt:
+            print("\nStopped")
+
+def profile_main(top=30) -> None:
+    """Run main() under cProfile, print the hottest functions and keep the full profile"""
+    profiler = cProfile.Profile()
+    profiler.runcall(main)
+    os.makedirs("./build", exist_ok=True)
+    profiler.dump_stats("./build/profile.prof")
+    print(f"\nTop {top} functions by cumulative time (full profile: build/profile.prof):")
+    pstats.Stats(profiler).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+
 if __name__ == '__main__': 
-    main()
+    if args.profile:
+        profile_main()
+    else:
+        main()
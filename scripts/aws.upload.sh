@@ -1,3 +1,6 @@
 mkdir -p "$(dirname "$0")/../build"
 python "$(dirname "$0")/../build.py" --build true
-aws s3 sync ./build s3://$S3_BUCKET --delete --acl public-read
+# Only changed files are uploaded, with Content-Type, Cache-Control and the
+# Content-Encoding of their .gz/.br siblings. Blobs are content-addressed: they
+# are cached forever and never deleted, older builds may still use them.
+python "$(dirname "$0")/upload.py" "s3://$S3_BUCKET"
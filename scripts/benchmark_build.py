@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark build.py on synthetic catalogs
+For every catalog size and job count:
+- Generates the apps with generate_test_apps.py into a temporary tree
+- Serves their "remote" files from a local HTTP server instead of GitHub
+- Runs build.py --build and records wall time, per-stage time, peak RSS
+  and the size of the build output
+
+Results are printed and can be saved as JSON to compare commits:
+    python3 scripts/benchmark_build.py --sizes 100,1000 --jobs 1,8 -o bench.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+import generate_test_apps
+
+MOCK_FILE_SIZE = 16 * 1024
+
+
+class MockOriginHandler(BaseHTTPRequestHandler):
+    """Answers every HEAD/GET with a deterministic body derived from the path,
+    with ETag, Last-Modified, conditional GET and Range support like GitHub"""
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, send_body):
+        if self.latency:
+            time.sleep(self.latency)
+        seed = hashlib.sha256(self.path.encode('utf-8')).digest()
+        body = (seed * (MOCK_FILE_SIZE // len(seed) + 1))[:MOCK_FILE_SIZE]
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+
+        status = 200
+        if self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        elif self.headers.get("Range", "").startswith("bytes="):
+            start = int(self.headers["Range"][len("bytes="):].split("-")[0])
+            status, body = 206, body[start:]
+
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.respond(False)
+
+    def do_GET(self):
+        self.respond(True)
+
+
+def start_mock_origin(latency):
+    handler = type("Handler", (MockOriginHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def generate_tree(tree_dir, size, origin):
+    """Generate size synthetic apps in tree_dir with URLs pointing at origin"""
+    os.makedirs(os.path.join(tree_dir, "mods"), exist_ok=True)
+    template_dir = os.path.join(tree_dir, "apps", "test.app")
+    os.makedirs(template_dir, exist_ok=True)
+    # An oversized screenshot, so every copy has to be resized and recompressed
+    random.seed(size)
+    screen = (1920, 1200)
+    Image.merge("RGB", (Image.linear_gradient("L").resize(screen), Image.radial_gradient("L").resize(screen),
+                        Image.effect_mandelbrot(screen, (-2, -1.2, 1, 1.2), 100))).save(os.path.join(template_dir, "screenshot1.png"))
+
+    cwd = os.getcwd()
+    os.chdir(tree_dir)
+    try:
+        for i in range(1, size + 1):
+            app_dir = os.path.join("apps", generate_test_apps.generate_app(i))
+            manifest_path = os.path.join(app_dir, "manifest.yml")
+            with open(manifest_path, 'r') as f:
+                manifest = f.read()
+            with open(manifest_path, 'w') as f:
+                f.write(manifest.replace("https://", origin + "/"))
+    finally:
+        os.chdir(cwd)
+    shutil.rmtree(template_dir)
+
+
+def tree_size(path):
+    files, total = 0, 0
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if d != ".cache"]
+        for name in names:
+            if root == path and name in ("metrics.json", "trace.json", "profile.prof"):
+                continue
+            files += 1
+            total += os.path.getsize(os.path.join(root, name))
+    return files, total
+
+
+def run_build(tree_dir, jobs, extra_args):
+    """Run build.py in tree_dir, returns its measurements"""
+    command = [sys.executable, os.path.join(PROJECT_DIR, "build.py"), "--build", "--jobs", str(jobs)] + extra_args
+    start = time.perf_counter()
+    with open(os.path.join(tree_dir, "build.log"), 'a') as log:
+        process = subprocess.Popen(command, cwd=tree_dir, stdout=log, stderr=subprocess.STDOUT)
+        _, status, rusage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"build.py failed, see {os.path.join(tree_dir, 'build.log')}")
+
+    with open(os.path.join(tree_dir, "build", "metrics.json"), 'r') as f:
+        metrics = json.load(f)
+    files, total = tree_size(os.path.join(tree_dir, "build"))
+    return {
+        "wall": round(wall, 3),
+        "stages": {stage: round(seconds, 3) for stage, seconds in metrics["stages"].items()},
+        "slowest_items": metrics["slowest_items"][:3],
+        "peak_rss_kb": rusage.ru_maxrss,
+        "output_files": files,
+        "output_bytes": total,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=PROJECT_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark build.py on synthetic catalogs")
+    parser.add_argument("--sizes", default="100", help="Comma separated catalog sizes, e.g. 100,1000,10000")
+    parser.add_argument("--jobs", default="1", help="Comma separated --jobs values to run build.py with")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated network latency per request in ms")
+    parser.add_argument("--warm", action="store_true", help="Also measure a second, incremental build of the same tree")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated trees")
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file")
+    options, build_args = parser.parse_known_args()
+
+    server = start_mock_origin(options.latency / 1000)
+    origin = f"http://127.0.0.1:{server.server_address[1]}"
+    results = {"commit": git_commit(), "python": sys.version.split()[0], "cpus": os.cpu_count(),
+               "latency_ms": options.latency, "build_args": build_args, "runs": []}
+
+    for size in [int(s) for s in options.sizes.split(",")]:
+        for jobs in [int(j) for j in options.jobs.split(",")]:
+            tree_dir = tempfile.mkdtemp(prefix=f"lilka-bench-{size}-")
+            try:
+                print(f"⏱  {size} apps, --jobs {jobs}: generating...", flush=True)
+                generate_tree(tree_dir, size, origin)
+                runs = [("cold", run_build(tree_dir, jobs, build_args))]
+                if options.warm:
+                    runs.append(("warm", run_build(tree_dir, jobs, build_args)))
+                for build, run in runs:
+                    results["runs"].append({"items": size, "jobs": jobs, "build": build, **run})
+                    stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in run["stages"].items())
+                    print(f"   {build}: {run['wall']:.2f}s wall ({stages}), "
+                          f"peak RSS {run['peak_rss_kb'] // 1024} MB, "
+                          f"{run['output_bytes'] // 1024} KB in {run['output_files']} files")
+            finally:
+                if options.keep:
+                    print(f"   tree kept in {tree_dir}")
+                else:
+                    shutil.rmtree(tree_dir, ignore_errors=True)
+
+    server.shutdown()
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to: {options.output}")
+
+
+if __name__ == "__main__":
+    main()
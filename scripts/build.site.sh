@@ -21,36 +21,21 @@ PROJECT_DIR="$(dirname "$SCRIPT_DIR")"
 echo -e "${BLUE}📂 Project Directory: ${PROJECT_DIR}${NC}"
 echo ""
 
-# Step 1: Build JSON files
-echo -e "${YELLOW}Step 1/3: Building JSON files from manifests...${NC}"
+# Step 1: Build JSON files and copy the site files, only what changed since the last build
+echo -e "${YELLOW}Step 1/2: Building JSON files and copying static site files...${NC}"
 cd "$PROJECT_DIR"
 python3 build.py --build
 
 if [ $? -eq 0 ]; then
-    echo -e "${GREEN}✓ JSON files built successfully${NC}"
+    echo -e "${GREEN}✓ JSON files built and site files copied to build/${NC}"
 else
     echo "❌ Failed to build JSON files"
     exit 1
 fi
 echo ""
 
-# Step 2: Copy static site files to build directory
-echo -e "${YELLOW}Step 2/3: Copying static site files...${NC}"
-
-# Create build directory if it doesn't exist
-mkdir -p "$PROJECT_DIR/build"
-
-# Copy HTML, CSS, JS files
-cp "$PROJECT_DIR/site/index.html" "$PROJECT_DIR/build/"
-cp "$PROJECT_DIR/site/styles.css" "$PROJECT_DIR/build/"
-cp "$PROJECT_DIR/site/script.js" "$PROJECT_DIR/build/"
-cp "$PROJECT_DIR/README.md" "$PROJECT_DIR/build/"
-
-echo -e "${GREEN}✓ Static site files copied to build/${NC}"
-echo ""
-
-# Step 3: Verify build
-echo -e "${YELLOW}Step 3/3: Verifying build...${NC}"
+# Step 2: Verify build
+echo -e "${YELLOW}Step 2/2: Verifying build...${NC}"
 
 # Check if required files exist
 REQUIRED_FILES=(
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""
+Check that build.py --async builds exactly what the default engine builds,
+and that warm builds build exactly what cold ones do
+- Copies apps/, mods/, site/ and README.md into two temporary trees
+- Runs build.py --build --no-cache in one and build.py --build --no-cache
+  --async in the other
+- Compares the two build/ directories byte for byte. Only the build date in
+  warnings.json, latest.json and changes/ may differ, and with it the hashes
+  of those files in assets.json
+- Then removes the index.json of every item and builds both trees again with
+  their cache: every item is rebuilt with its images from the image cache,
+  and the output must not change
+
+    python3 scripts/compare_engines.py --jobs 4
+    python3 scripts/compare_engines.py --mock-origin  # No network, see benchmark_build.py
+
+tests/test_engines.py runs the same check on a few items.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+# Written by every build, not part of the output
+IGNORED_FILES = ("metrics.json", "trace.json", "profile.prof", "warnings.jsonl")
+# Files with the build date in them, compared without it
+DATED_FILES = ("warnings.json", "latest.json")
+DATED_DIRS = ("changes/",)
+ENGINES = (("default", []), ("async", ["--async"]))
+
+
+def copy_sources(tree_dir, origin=None, items=None):
+    """Copy the catalog into tree_dir, with its remote URLs pointing at origin if
+    given. items limits it to some "apps/<name>" and "mods/<name>" folders."""
+    for name in ("apps", "mods"):
+        names = sorted(os.listdir(os.path.join(PROJECT_DIR, name)))
+        os.makedirs(os.path.join(tree_dir, name))
+        for item in names:
+            if items is None or f"{name}/{item}" in items:
+                shutil.copytree(os.path.join(PROJECT_DIR, name, item), os.path.join(tree_dir, name, item))
+    shutil.copytree(os.path.join(PROJECT_DIR, "site"), os.path.join(tree_dir, "site"))
+    shutil.copy2(os.path.join(PROJECT_DIR, "README.md"), tree_dir)
+    if origin is None:
+        return
+    for folder in ("apps", "mods"):
+        for root, _, names in os.walk(os.path.join(tree_dir, folder)):
+            if "manifest.yml" in names:
+                path = os.path.join(root, "manifest.yml")
+                stat = os.stat(path)
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifest = f.read()
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(manifest.replace("https://", origin + "/"))
+                # Keep the modification time, the update time of items falls back to it
+                os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def remove_item_outputs(build_dir):
+    for folder in ("apps", "mods"):
+        if not os.path.isdir(os.path.join(build_dir, folder)):
+            continue
+        for item in os.listdir(os.path.join(build_dir, folder)):
+            path = os.path.join(build_dir, folder, item, "index.json")
+            if os.path.isfile(path):
+                os.remove(path)
+
+
+def run_build(tree_dir, extra_args):
+    command = [sys.executable, os.path.join(PROJECT_DIR, "build.py"), "--build"] + extra_args
+    start = time.perf_counter()
+    with open(os.path.join(tree_dir, "build.log"), 'a') as log:
+        status = subprocess.run(command, cwd=tree_dir, stdout=log, stderr=subprocess.STDOUT).returncode
+    if status != 0:
+        raise RuntimeError(f"{' '.join(command[1:])} failed, see {os.path.join(tree_dir, 'build.log')}")
+    return time.perf_counter() - start
+
+
+def is_dated(key):
+    return key in DATED_FILES or key.startswith(DATED_DIRS)
+
+
+def build_files(build_dir):
+    files = {}
+    for root, dirs, names in os.walk(build_dir):
+        if root == build_dir and ".cache" in dirs:
+            dirs.remove(".cache")
+        for name in names:
+            key = os.path.relpath(os.path.join(root, name), build_dir).replace(os.sep, '/')
+            if key not in IGNORED_FILES:
+                files[key] = os.path.join(root, name)
+    return files
+
+
+def comparable(key, path):
+    """The content of a build file as compared, without the build date"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if key.endswith(".gz") and is_dated(key[:-3]):
+        key, data = key[:-3], gzip.decompress(data)
+    elif key.endswith(".br") and is_dated(key[:-3]):
+        return None  # Compared through its .json and .gz
+    if is_dated(key):
+        content = json.loads(data)
+        content.pop("build_date", None)
+        return content
+    if key == "assets.json":
+        content = json.loads(data)
+        content["files"] = {name: asset for name, asset in content["files"].items() if not is_dated(name)}
+        return content
+    return data
+
+
+def compare(build_a, build_b, name_a, name_b):
+    """Paths that only one build has or that differ"""
+    files_a, files_b = build_files(build_a), build_files(build_b)
+    differences = [f"only in the {name_a} build: {key}" for key in sorted(files_a.keys() - files_b.keys())]
+    differences += [f"only in the {name_b} build: {key}" for key in sorted(files_b.keys() - files_a.keys())]
+    for key in sorted(files_a.keys() & files_b.keys()):
+        if comparable(key, files_a[key]) != comparable(key, files_b[key]):
+            differences.append(f"{name_a} and {name_b} builds differ: {key}")
+    return differences, len(files_a)
+
+
+def check_engines(tree_dir, origin=None, jobs=1, build_args=(), items=None, log=print):
+    """Build the catalog cold and warm with both engines in tree_dir, returns
+    the differences between the builds and the number of files built"""
+    trees = {}
+    for engine, engine_args in ENGINES:
+        trees[engine] = os.path.join(tree_dir, engine)
+        os.makedirs(trees[engine])
+        copy_sources(trees[engine], origin, items)
+        seconds = run_build(trees[engine], ["--no-cache", "--jobs", str(jobs)] + engine_args + list(build_args))
+        log(f"{engine} engine, cold: {seconds:.2f}s")
+        shutil.copytree(os.path.join(trees[engine], "build"), os.path.join(trees[engine], "cold"),
+                        ignore=shutil.ignore_patterns(".cache"))
+    differences, files = compare(os.path.join(trees["default"], "build"), os.path.join(trees["async"], "build"),
+                                 "default", "--async")
+
+    # Without their index.json every item is rebuilt, but not its images
+    for engine, engine_args in ENGINES:
+        remove_item_outputs(os.path.join(trees[engine], "build"))
+        seconds = run_build(trees[engine], ["--jobs", str(jobs)] + engine_args + list(build_args))
+        log(f"{engine} engine, warm: {seconds:.2f}s")
+        differences += compare(os.path.join(trees[engine], "cold"), os.path.join(trees[engine], "build"),
+                               f"cold {engine}", f"warm {engine}")[0]
+    return differences, files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that build.py --async and warm builds build exactly what "
+                                                 "a cold build with the default engine builds")
+    parser.add_argument("--jobs", type=int, default=1, help="--jobs of all builds")
+    parser.add_argument("--mock-origin", action="store_true",
+                        help="Serve the remote files from benchmark_build.py's local mock origin instead of the network")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary trees")
+    options, build_args = parser.parse_known_args()
+
+    server = origin = None
+    if options.mock_origin:
+        import benchmark_build
+        server = benchmark_build.start_mock_origin(0.0)
+        origin = f"http://127.0.0.1:{server.server_address[1]}"
+
+    tree_dir = tempfile.mkdtemp(prefix="lilka-engines-")
+    try:
+        differences, files = check_engines(tree_dir, origin, options.jobs, build_args)
+    finally:
+        if server is not None:
+            server.shutdown()
+        if options.keep:
+            print(f"Trees kept in {tree_dir}")
+        else:
+            shutil.rmtree(tree_dir, ignore_errors=True)
+
+    for difference in differences:
+        print(f"  {difference}")
+    if differences:
+        sys.exit(f"❌ {len(differences)} differences between the builds of {files} files")
+    print(f"✓ Both engines, cold and warm, built the same {files} files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+"""
+Upload build/ to S3 or a local directory, pushing only what changed
+- Compares build/assets.json, written by build.py, with what the last upload
+  to the same destination pushed (kept in build/.cache/uploads/)
+- Uploads changed files with their Content-Type and Cache-Control, and their
+  precompressed .gz/.br siblings with the matching Content-Encoding
+- Deletes files that are no longer built, except blobs/, which older builds
+  and devices still reference
+- Uploads latest.json and assets.json last, once everything they list is there
+
+    python3 scripts/upload.py s3://$S3_BUCKET
+    python3 scripts/upload.py /var/www/lilka --dry-run
+    python3 scripts/upload.py _site --full --no-headers  # GitHub Pages artifact
+"""
+
+import argparse
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BUILD_DIR = "build"
+ASSETS_PATH = os.path.join(BUILD_DIR, "assets.json")
+UPLOADS_DIR = os.path.join(BUILD_DIR, ".cache", "uploads")
+
+ENCODINGS = {"gzip": ".gz", "br": ".br"}
+CONTENT_TYPES = {
+    ".json": "application/json",
+    ".js": "text/javascript",
+    ".md": "text/markdown; charset=utf-8",
+    ".bin": "application/octet-stream",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+# Blobs are content-addressed and never change, everything else may change
+# with the next build. latest.json and assets.json are always revalidated.
+CACHE_CONTROL = (
+    (re.compile(r"blobs/"), "public, max-age=31536000, immutable"),
+    (re.compile(r"(latest|assets)\.json$"), "no-cache"),
+    (re.compile(r""), "public, max-age=300"),
+)
+# Blobs are uploaded first, since the rest refers to them, and these last
+UPLOAD_LAST = ("latest.json", "assets.json")
+
+
+def content_type(key):
+    extension = os.path.splitext(key)[1].lower()
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+def cache_control(key):
+    return next(value for pattern, value in CACHE_CONTROL if pattern.match(key))
+
+
+class LocalBackend:
+    """Copies the files into a directory, their headers go to <directory>/.headers.json
+    for the server in front of it, unless write_headers is off"""
+
+    def __init__(self, root, write_headers=True):
+        self.root = root
+        self.write_headers = write_headers
+        self.headers_path = os.path.join(root, ".headers.json")
+        self.lock = threading.Lock()
+        try:
+            with open(self.headers_path, 'r') as f:
+                self.headers = json.load(f)
+        except (OSError, ValueError):
+            self.headers = {}
+
+    def put(self, key, path, headers):
+        dest = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(path, dest + ".tmp")
+        os.replace(dest + ".tmp", dest)
+        with self.lock:
+            self.headers[key] = headers
+
+    def delete(self, key):
+        if os.path.exists(os.path.join(self.root, key)):
+            os.remove(os.path.join(self.root, key))
+        with self.lock:
+            self.headers.pop(key, None)
+
+    def close(self):
+        os.makedirs(self.root, exist_ok=True)
+        if not self.write_headers:
+            return
+        with open(self.headers_path, 'w') as f:
+            json.dump(self.headers, f, indent=2, sort_keys=True)
+
+
+class S3Backend:
+    """Uploads with the AWS CLI, publicly readable like aws.upload.sh did"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def put(self, key, path, headers):
+        command = ["aws", "s3", "cp", path, f"{self.url}/{key}", "--only-show-errors", "--acl", "public-read",
+                   "--content-type", headers["Content-Type"], "--cache-control", headers["Cache-Control"]]
+        if "Content-Encoding" in headers:
+            command += ["--content-encoding", headers["Content-Encoding"]]
+        subprocess.run(command, check=True)
+
+    def delete(self, key):
+        subprocess.run(["aws", "s3", "rm", f"{self.url}/{key}", "--only-show-errors"], check=True)
+
+    def close(self):
+        pass
+
+
+def load_assets():
+    with open(ASSETS_PATH, 'r', encoding='utf-8') as f:
+        assets = json.load(f)["files"]
+    # assets.json doesn't list itself
+    assets["assets.json"] = {"sha256": file_sha256(ASSETS_PATH), "size": os.path.getsize(ASSETS_PATH), "encodings": {}}
+    return assets
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def objects_of(key, asset):
+    """The objects a file is uploaded as: (object key, local path, headers)"""
+    path = os.path.join(BUILD_DIR, key)
+    headers = {"Content-Type": content_type(key), "Cache-Control": cache_control(key)}
+    objects = [(key, path, headers)]
+    for encoding in sorted(asset.get("encodings", {})):
+        objects.append((key + ENCODINGS[encoding], path + ENCODINGS[encoding], {**headers, "Content-Encoding": encoding}))
+    return objects
+
+
+def plan(assets, uploaded):
+    """Files to upload and object keys to delete"""
+    changed = [key for key, asset in assets.items()
+               if key not in uploaded or uploaded[key]["sha256"] != asset["sha256"]
+               or sorted(uploaded[key]["encodings"]) != sorted(asset["encodings"])]
+    deleted = []
+    for key, previous in uploaded.items():
+        if key.startswith("blobs/"):
+            continue
+        gone = [encoding for encoding in previous["encodings"] if encoding not in assets.get(key, {}).get("encodings", {})]
+        deleted += [key + ENCODINGS[encoding] for encoding in gone]
+        if key not in assets:
+            deleted.append(key)
+    changed.sort(key=upload_order)
+    return changed, sorted(deleted)
+
+
+def upload_order(key):
+    if key in UPLOAD_LAST:
+        return (2, UPLOAD_LAST.index(key), key)
+    return (0 if key.startswith("blobs/") else 1, 0, key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload the changed files of build/ to S3 or a local directory")
+    parser.add_argument("destination", help="s3://bucket[/prefix] or a local directory")
+    parser.add_argument("--jobs", type=int, default=8, help="Files uploaded at once")
+    parser.add_argument("--full", action="store_true", help="Forget what was uploaded before and upload everything")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be uploaded and deleted")
+    parser.add_argument("--no-headers", action="store_true",
+                        help="Don't write .headers.json into a local destination, e.g. for GitHub Pages, which sets its own")
+    options = parser.parse_args()
+
+    if not os.path.exists(ASSETS_PATH):
+        sys.exit(f"error: {ASSETS_PATH} not found, run build.py --build first")
+    assets = load_assets()
+
+    state_path = os.path.join(UPLOADS_DIR, re.sub(r'[^\w.-]+', '_', options.destination) + ".json")
+    uploaded = {}
+    if not options.full and os.path.exists(state_path):
+        with open(state_path, 'r') as f:
+            uploaded = json.load(f)
+    if not uploaded:
+        print(f"No record of a previous upload to {options.destination}, uploading everything")
+
+    changed, deleted = plan(assets, uploaded)
+    objects = sum(len(objects_of(key, assets[key])) for key in changed)
+    print(f"{len(changed)} changed files ({objects} objects) to upload, {len(deleted)} objects to delete, "
+          f"{len(assets) - len(changed)} files unchanged")
+    if options.dry_run:
+        for key in changed:
+            print(f"  upload {key}")
+        for key in deleted:
+            print(f"  delete {key}")
+        return
+
+    backend = S3Backend(options.destination) if options.destination.startswith("s3://") else LocalBackend(options.destination, not options.no_headers)
+
+    def upload(key):
+        for object_key, path, headers in objects_of(key, assets[key]):
+            backend.put(object_key, path, headers)
+        return key
+
+    # What was uploaded is recorded even when a later upload fails, the next run continues from there
+    try:
+        first = [key for key in changed if key not in UPLOAD_LAST]
+        with ThreadPoolExecutor(max_workers=max(1, options.jobs)) as pool:
+            for key in pool.map(upload, first):
+                uploaded[key] = {"sha256": assets[key]["sha256"], "encodings": sorted(assets[key]["encodings"])}
+        for key in changed[len(first):]:
+            upload(key)
+            uploaded[key] = {"sha256": assets[key]["sha256"], "encodings": sorted(assets[key]["encodings"])}
+
+        for key in deleted:
+            backend.delete(key)
+        uploaded = {key: entry for key, entry in uploaded.items() if key in assets or key.startswith("blobs/")}
+    finally:
+        backend.close()
+        os.makedirs(UPLOADS_DIR, exist_ok=True)
+        with open(state_path, 'w') as f:
+            json.dump(uploaded, f, indent=2, sort_keys=True)
+    print(f"Uploaded {len(changed)} files, deleted {len(deleted)} objects")
+
+
+if __name__ == "__main__":
+    main()
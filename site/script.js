@@ -2,10 +2,16 @@ class LilkaRepository {
     constructor() {
         this.currentType = 'apps';
         this.currentPage = 0;
+        this.currentOrder = 'name';
         this.totalPages = 0;
         this.manifests = [];
         this.currentScreenshots = [];
         this.currentLightboxIndex = 0;
+        this.catalogs = {};
+        this.searchShards = {};
+        this.searchQuery = '';
+        this.searchRequest = 0;
+        this.markedLoaded = null;
         this.init();
     }
 
@@ -20,6 +26,8 @@ class LilkaRepository {
         const type = params.get('type');
         const page = params.get('page');
         const item = params.get('item');
+        this.currentOrder = params.get('order') || 'name';
+        document.getElementById('sort').value = this.currentOrder;
         
         // Handle direct item link: ?type=apps&item=ble.app
         if (item && type) {
@@ -73,6 +81,52 @@ class LilkaRepository {
         }
     }
 
+    // Descriptions and changelogs come pre-rendered and sanitized in the item's
+    // description.html, items built without it are rendered from index.json
+    async loadDescription(basePath, manifest) {
+        const containers = document.querySelectorAll('#modalBody .markdown-content[data-field]');
+        if (containers.length === 0) {
+            return;
+        }
+        try {
+            if (!manifest.description_html) {
+                throw new Error('Not pre-rendered');
+            }
+            const response = await fetch(`${basePath}/${manifest.description_html}`);
+            if (!response.ok) {
+                throw new Error(`Failed to load ${manifest.description_html}: ${response.status}`);
+            }
+            const rendered = document.createElement('template');
+            rendered.innerHTML = await response.text();
+            containers.forEach(container => {
+                const section = rendered.content.querySelector(`section[data-field="${container.dataset.field}"]`);
+                container.innerHTML = section ? section.innerHTML : '';
+            });
+        } catch (error) {
+            await this.loadMarked();
+            containers.forEach(container => {
+                container.innerHTML = marked.parse(manifest[container.dataset.field]);
+            });
+        }
+    }
+
+    // marked is only loaded for README.md and items without description.html
+    loadMarked() {
+        if (!this.markedLoaded) {
+            this.markedLoaded = new Promise((resolve, reject) => {
+                const script = document.createElement('script');
+                script.src = 'https://cdn.jsdelivr.net/npm/marked/marked.min.js';
+                script.onload = resolve;
+                script.onerror = () => {
+                    this.markedLoaded = null;
+                    reject(new Error('Failed to load marked'));
+                };
+                document.head.appendChild(script);
+            });
+        }
+        return this.markedLoaded;
+    }
+
     updateURL(type = null, page = null, itemName = null) {
         const params = new URLSearchParams();
         
@@ -86,6 +140,9 @@ class LilkaRepository {
             if (page !== null && page > 0) {
                 params.set('page', page);
             }
+            if (this.currentOrder !== 'name') {
+                params.set('order', this.currentOrder);
+            }
         }
         
         const url = params.toString() ? `?${params.toString()}` : '/';
@@ -132,6 +189,21 @@ class LilkaRepository {
             });
         });
 
+        // Sort order, every order has its own precomputed pages
+        document.getElementById('sort').addEventListener('change', (e) => {
+            this.currentOrder = e.target.value;
+            this.currentPage = 0;
+            this.clearSearch();
+            this.loadPage();
+        });
+
+        // Search
+        let searchTimeout = null;
+        document.getElementById('search').addEventListener('input', (e) => {
+            clearTimeout(searchTimeout);
+            searchTimeout = setTimeout(() => this.search(e.target.value), 150);
+        });
+
         // Pagination - top
         document.getElementById('prevPage').addEventListener('click', () => {
             if (this.currentPage > 0) {
@@ -197,6 +269,7 @@ class LilkaRepository {
     }
     async switchType(type) {
         this.currentType = type;
+        this.clearSearch();
         const params = new URLSearchParams(window.location.search);
         if (params.get('type') !== type) {
             this.currentPage = 0;
@@ -235,6 +308,7 @@ class LilkaRepository {
                 throw new Error('Failed to load documentation');
             }
             const markdown = await response.text();
+            await this.loadMarked();
             docsContainer.innerHTML = marked.parse(markdown);
         } catch (error) {
             docsContainer.innerHTML = `<p style="color: var(--error);">Failed to load documentation: ${error.message}</p>`;
@@ -251,7 +325,7 @@ class LilkaRepository {
         this.hideError();
 
         try {
-            const indexPath = `${this.currentType}/index_${this.currentPage}.json`;
+            const indexPath = `${this.currentType}/pages/web/${this.currentOrder}/${this.currentPage}.json`;
             const response = await fetch(indexPath);
             
             if (!response.ok) {
@@ -260,10 +334,9 @@ class LilkaRepository {
 
             const data = await response.json();
             this.totalPages = data.total_pages;
-            // Remove trailing comma from manifests array
-            this.manifests = data.manifests.filter(m => m && m.trim());
+            this.manifests = data.manifests;
             
-            this.loadManifests();
+            this.showPageItems(data.items);
             this.updatePagination();
             
             // Update URL when page loads
@@ -276,59 +349,138 @@ class LilkaRepository {
         }
     }
 
-    loadManifests() {
+    showPageItems(records) {
         const itemsContainer = document.getElementById('items');
         itemsContainer.innerHTML = '';
 
-        for (const manifestName of this.manifests) {
-            try {
-                const manifestPath = `${this.currentType}/${manifestName}/index.json`;
-                fetch(manifestPath)
-                    .then(response => {
-                        if (!response.ok) {
-                            console.warn(`Failed to load ${manifestPath}`);
-                            return null;
-                        }
-                        return response.json();
-                    })
-                    .then(manifest => {
-                        if (manifest) {
-                            const card = this.createItemCard(manifest, manifestName);
-                            itemsContainer.appendChild(card);
-                        }
-                    })
-                    .catch(error => {
-                        console.error(`Error loading manifest ${manifestName}:`, error);
-                    });
-            } catch (error) {
-                console.error(`Error loading manifest ${manifestName}:`, error);
-            }
+        // Pages embed short records of their items, the full manifest is only fetched for the modal
+        for (const record of records) {
+            const card = this.createItemCard(record, record.path, null, () => {
+                this.openDirectItem(this.currentType, record.path);
+                this.updateURL(this.currentType, null, record.path);
+            });
+            itemsContainer.appendChild(card);
         }
     }
 
-    createItemCard(manifest, manifestName) {
+    createItemCard(manifest, manifestName, iconPath = null, onClick = null) {
         const card = document.createElement('div');
         card.className = 'item-card';
         
         // Build icon path without duplicating type
-        const iconPath = `${this.currentType}/${manifestName}/static/${manifest.icon}`;
+        const iconAttrs = `alt="${this.escapeHtml(manifest.name)}" class="icon"`;
+        const icon = iconPath
+            ? this.imageHtml(iconPath, iconAttrs)
+            : this.pictureHtml(`${this.currentType}/${manifestName}`, manifest, manifest.icon, iconAttrs,
+                '(max-width: 768px) 100vw, (max-width: 1024px) 50vw, 300px');
         
         card.innerHTML = `
-            ${manifest.icon ? `<img src="${iconPath}" alt="${manifest.name}" class="icon" onerror="this.style.display='none'">` : ''}
+            ${manifest.icon ? icon : ''}
             <h3>${this.escapeHtml(manifest.name)}</h3>
             <div class="author">${this.escapeHtml(manifest.author)}</div>
             <div class="short-desc">${this.escapeHtml(manifest.short_description)}</div>
         `;
 
-        card.addEventListener('click', () => {
+        card.addEventListener('click', onClick || (() => {
             this.showModal(manifest, manifestName);
             // Update URL when opening modal
             this.updateURL(this.currentType, null, manifestName);
-        });
+        }));
 
         return card;
     }
 
+    // Search works on build output: <type>/catalog.json holds short records of all
+    // items and <type>/search/<shard>.json maps tokens to positions in that catalog
+    tokenize(text) {
+        return (text.toLocaleLowerCase().replace(/['’ʼ`]/g, '').match(/[\p{L}\p{N}_]+/gu) || []);
+    }
+
+    async loadCatalog(type) {
+        if (!this.catalogs[type]) {
+            const response = await fetch(`${type}/catalog.json`);
+            if (!response.ok) {
+                throw new Error(`Failed to load ${type}/catalog.json: ${response.status}`);
+            }
+            this.catalogs[type] = await response.json();
+        }
+        return this.catalogs[type];
+    }
+
+    async loadSearchShard(type, token) {
+        const shard = token.codePointAt(0).toString(16).padStart(4, '0');
+        const key = `${type}/${shard}`;
+        if (!this.searchShards[key]) {
+            const response = await fetch(`${type}/search/${shard}.json`);
+            // A missing shard just means no item has a word starting with that letter
+            this.searchShards[key] = response.ok ? await response.json() : {};
+        }
+        return this.searchShards[key];
+    }
+
+    async search(query) {
+        this.searchQuery = query.trim();
+        const tokens = this.tokenize(this.searchQuery);
+        if (tokens.length === 0) {
+            this.clearSearch();
+            this.loadPage();
+            return;
+        }
+
+        const request = ++this.searchRequest;
+        const type = this.currentType;
+        try {
+            const [catalog, shards] = await Promise.all([
+                this.loadCatalog(type),
+                Promise.all(tokens.map(token => this.loadSearchShard(type, token)))
+            ]);
+            if (request !== this.searchRequest) {
+                return;  // A newer query was typed meanwhile
+            }
+
+            // Every query word has to be a prefix of some word of the item
+            let matches = null;
+            tokens.forEach((token, i) => {
+                const found = new Set();
+                for (const [word, positions] of Object.entries(shards[i])) {
+                    if (word.startsWith(token)) {
+                        positions.forEach(position => found.add(position));
+                    }
+                }
+                matches = matches === null ? found : new Set([...matches].filter(position => found.has(position)));
+            });
+
+            this.showSearchResults([...matches].sort((a, b) => a - b).map(position => catalog.items[position]));
+        } catch (error) {
+            this.showError(`Search failed: ${error.message}`);
+            console.error(error);
+        }
+    }
+
+    showSearchResults(records) {
+        document.querySelectorAll('.pagination').forEach(el => el.style.display = 'none');
+        document.getElementById('searchEmpty').style.display = records.length ? 'none' : 'block';
+
+        const itemsContainer = document.getElementById('items');
+        itemsContainer.innerHTML = '';
+        for (const record of records) {
+            // Catalog records are short, fetch the full manifest for the modal
+            const card = this.createItemCard(record, record.path, record.icon, () => {
+                this.openDirectItem(this.currentType, record.path);
+                this.updateURL(this.currentType, null, record.path);
+            });
+            itemsContainer.appendChild(card);
+        }
+    }
+
+    clearSearch() {
+        this.searchQuery = '';
+        this.searchRequest++;
+        document.getElementById('search').value = '';
+        document.getElementById('searchEmpty').style.display = 'none';
+        document.querySelectorAll('.pagination').forEach(el => el.style.display = '');
+    }
+
     showModal(manifest, manifestName) {
         console.log('Opening modal for:', manifestName, manifest);
         
@@ -337,7 +489,6 @@ class LilkaRepository {
         
         // Build paths - manifestName already includes the full path relative to type
         const basePath = `${this.currentType}/${manifestName}`;
-        const iconPath = `${basePath}/static/${manifest.icon}`;
         
         // Parse execution file or mod files
         let filesSection = '';
@@ -345,13 +496,13 @@ class LilkaRepository {
             if (this.currentType === 'apps' && manifest.executionfile) {
                 const execFile = this.parseJsonString(manifest.executionfile);
                 if (execFile && execFile.location) {
-                    const downloadPath = `${basePath}/static/${execFile.location}`;
+                    const downloadPath = this.assetPath(basePath, manifest, execFile.location);
                     filesSection = `
                         <div class="modal-section">
                             <h3>📦 Execution File</h3>
                             <p><strong>Type:</strong> ${this.escapeHtml(execFile.type || 'N/A')}</p>
                             <p><strong>File:</strong> ${this.escapeHtml(execFile.location || 'N/A')}</p>
-                            <a href="${downloadPath}" download class="download-btn">⬇️ Download Execution File</a>
+                            <a href="${downloadPath}" download="${this.escapeHtml(execFile.location)}" class="download-btn">⬇️ Download Execution File</a>
                         </div>
                     `;
                 }
@@ -362,11 +513,11 @@ class LilkaRepository {
                         <div class="modal-section">
                             <h3>📦 Mod Files</h3>
                             ${modFiles.map(file => {
-                                const downloadPath = `${basePath}/static/${file.location}`;
+                                const downloadPath = this.assetPath(basePath, manifest, file.location);
                                 return `
                                     <div class="file-item">
                                         <p><strong>${this.escapeHtml(file.type || 'Unknown')}:</strong> ${this.escapeHtml(file.location || 'N/A')}</p>
-                                        <a href="${downloadPath}" download class="download-btn-small">⬇️ Download</a>
+                                        <a href="${downloadPath}" download="${this.escapeHtml(file.location)}" class="download-btn-small">⬇️ Download</a>
                                     </div>
                                 `;
                             }).join('')}
@@ -404,8 +555,8 @@ class LilkaRepository {
                     <h3>📷 Screenshots</h3>
                     <div class="screenshots-gallery">
                         ${manifest.screenshots.map((screenshot, index) => {
-                            const screenshotPath = `${basePath}/static/${screenshot}`;
-                            return `<img src="${screenshotPath}" alt="Screenshot" class="screenshot-thumb" data-index="${index}" onerror="this.style.display='none'">`;
+                            return this.pictureHtml(basePath, manifest, screenshot,
+                                `alt="Screenshot" class="screenshot-thumb" data-index="${index}"`, '240px');
                         }).join('')}
                     </div>
                 </div>
@@ -414,7 +565,7 @@ class LilkaRepository {
         
         // Store screenshots for lightbox
         this.currentScreenshots = manifest.screenshots ? manifest.screenshots.map(s => 
-            `${basePath}/static/${s}`
+            this.assetPath(basePath, manifest, s)
         ) : [];
 
         modalBody.innerHTML = `
@@ -422,18 +573,19 @@ class LilkaRepository {
                 <h2>${this.escapeHtml(manifest.name)}</h2>
                 <div class="author">${this.escapeHtml(manifest.author)}</div>
             </div>
-            ${manifest.icon ? `<img src="${iconPath}" alt="${manifest.name}" class="modal-icon" onerror="this.style.display='none'">` : ''}
+            ${manifest.icon ? this.pictureHtml(basePath, manifest, manifest.icon,
+                `alt="${this.escapeHtml(manifest.name)}" class="modal-icon"`, '(max-width: 900px) 100vw, 900px') : ''}
             ${screenshotsSection}
             ${manifest.description && manifest.description.trim() ? `
             <div class="modal-section">
                 <h3>📝 Description</h3>
-                <div class="markdown-content">${marked.parse(manifest.description)}</div>
+                <div class="markdown-content" data-field="description"></div>
             </div>
             ` : ''}
             ${manifest.changelog && manifest.changelog.trim() ? `
             <div class="modal-section">
                 <h3>📋 Changelog</h3>
-                <div class="markdown-content">${marked.parse(manifest.changelog)}</div>
+                <div class="markdown-content" data-field="changelog"></div>
             </div>
             ` : ''}
             ${filesSection}
@@ -441,6 +593,7 @@ class LilkaRepository {
         `;
 
         modal.style.display = 'block';
+        this.loadDescription(basePath, manifest).catch(error => console.error('Error loading description:', error));
         
         // Scroll modal content to top
         const modalContent = modal.querySelector('.modal-content');
@@ -502,6 +655,39 @@ class LilkaRepository {
         counter.textContent = `${this.currentLightboxIndex + 1} / ${this.currentScreenshots.length}`;
     }
 
+    imageHtml(src, attrs) {
+        return `<img src="${src}" ${attrs} loading="lazy" decoding="async" onerror="this.style.display='none'">`;
+    }
+
+    // Images with responsive variants in index.json "images" become a <picture>
+    // with a srcset per format, the browser picks the smallest one that fits sizes
+    pictureHtml(basePath, manifest, file, attrs, sizes) {
+        const img = this.imageHtml(this.assetPath(basePath, manifest, file), attrs);
+        const variants = (manifest.images && manifest.images[file]) || [];
+        if (variants.length === 0) {
+            return img;
+        }
+
+        // Variants are sorted by width then type, so AVIF comes before WebP
+        const types = [...new Set(variants.map(variant => variant.type))];
+        const sources = types.map(type => {
+            const srcset = variants
+                .filter(variant => variant.type === type)
+                .map(variant => `${this.assetPath(basePath, manifest, variant.file)} ${variant.width}w`)
+                .join(', ');
+            return `<source type="${type}" srcset="${srcset}" sizes="${sizes}">`;
+        }).join('');
+        return `<picture>${sources}${img}</picture>`;
+    }
+
+    assetPath(basePath, manifest, file) {
+        // Prefer the shared content-addressed copy, it is cached forever
+        if (manifest.blobs && manifest.blobs[file]) {
+            return `blobs/${manifest.blobs[file]}`;
+        }
+        return `${basePath}/static/${file}`;
+    }
+
     parseJsonString(str) {
         try {
             // Handle Python dict-like strings
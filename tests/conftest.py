@@ -0,0 +1,13 @@
+import os
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+# build.py parses its command line on import, give it the defaults
+_argv = sys.argv
+sys.argv = [os.path.join(PROJECT_DIR, "build.py")]
+try:
+    import build  # noqa: F401
+finally:
+    sys.argv = _argv
@@ -0,0 +1,75 @@
+"""catalog.bin written by BinaryCatalogWriter and read back by the reference reader"""
+
+import pytest
+
+import build
+
+ICON_SIZE = 8
+
+
+def write_catalog(path, records, icon_size=ICON_SIZE):
+    writer = build.BinaryCatalogWriter(str(path), icon_size)
+    for record in records:
+        writer.add(record)
+    size = writer.close()
+    assert size == path.stat().st_size
+    return build.read_binary_catalog(str(path))
+
+
+def record(path, **fields):
+    return {"path": path, "name": path.title(), "short_description": "", "author": "", "keira_version": "",
+            "executionfile": "", "executionfile_sha256": "", **fields}
+
+
+def test_round_trip(tmp_path):
+    icon = bytes(range(ICON_SIZE * ICON_SIZE * 2))
+    records = [
+        record("snake", short_description="Класична змійка 🐍", author="Ліль", keira_version="1.0.0",
+               executionfile="https://example.com/snake.lua", executionfile_sha256="ab" * 32, icon=icon),
+        record("odd"),
+        record("icon-after-odd-offset", name="x" * 3, icon=icon[::-1]),
+    ]
+    assert write_catalog(tmp_path / "catalog.bin", records) == records
+
+
+def test_icons_are_aligned(tmp_path):
+    icons = [bytes([n]) * (ICON_SIZE * ICON_SIZE * 2) for n in range(1, 5)]
+    path = tmp_path / "catalog.bin"
+    write_catalog(path, [record(name * n, icon=icon) for n, name, icon in zip(range(1, 5), "abcd", icons)])
+    data = path.read_bytes()
+    assert [data.index(icon) % 4 for icon in icons] == [0, 0, 0, 0]
+
+
+def test_empty_catalog(tmp_path):
+    assert write_catalog(tmp_path / "catalog.bin", []) == []
+
+
+def test_absent_fields_are_empty_strings(tmp_path):
+    records = write_catalog(tmp_path / "catalog.bin", [{"path": "bare"}])
+    assert records == [{field: "bare" if field == "path" else "" for field in build.BINARY_CATALOG_FIELDS}]
+
+
+def test_long_strings_are_truncated_at_a_character_boundary(tmp_path, capsys):
+    description = "ї" * 40000  # 2 bytes each
+    [read] = write_catalog(tmp_path / "catalog.bin", [record("long", short_description=description, name="ok")])
+    assert read["short_description"] == description[:build.BINARY_CATALOG_MAX_STRING // 2]
+    assert read["name"] == "ok"
+    assert "short_description of long" in capsys.readouterr().out
+
+
+def test_wrong_icon_size_is_rejected(tmp_path):
+    writer = build.BinaryCatalogWriter(str(tmp_path / "catalog.bin"), ICON_SIZE)
+    with pytest.raises(ValueError, match="snake"):
+        writer.add(record("snake", icon=b"\x00" * 10))
+
+
+def test_reader_rejects_other_and_truncated_files(tmp_path):
+    path = tmp_path / "catalog.bin"
+    write_catalog(path, [record("snake")])
+    data = path.read_bytes()
+    path.write_bytes(data[:-1])
+    with pytest.raises(ValueError, match="Truncated"):
+        build.read_binary_catalog(str(path))
+    path.write_bytes(b"XXXX" + data[4:])
+    with pytest.raises(ValueError, match="Not a version"):
+        build.read_binary_catalog(str(path))
@@ -0,0 +1,82 @@
+"""stream_download resuming interrupted downloads"""
+
+import hashlib
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import build
+
+BODY = bytes(range(256)) * 64
+ETAG = '"v1"'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves BODY with Range support, 416 for ranges starting past its end like GitHub"""
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("Range"))
+        status, body, headers = 200, BODY, {"ETag": ETAG}
+        if self.headers.get("Range", "").startswith("bytes="):
+            start = int(self.headers["Range"][len("bytes="):].split("-")[0])
+            if start >= len(BODY):
+                status, body, headers = 416, b"", {"Content-Range": f"bytes */{len(BODY)}"}
+            else:
+                status, body = 206, BODY[start:]
+                headers["Content-Range"] = f"bytes {start}-{len(BODY) - 1}/{len(BODY)}"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def url():
+    RangeHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/file.bin"
+    server.shutdown()
+
+
+def leave_part(output_path, url, data):
+    with open(output_path + ".part", 'wb') as f:
+        f.write(data)
+    with open(output_path + ".part.json", 'w') as f:
+        json.dump({"url": url, "etag": ETAG, "last_modified": None}, f)
+
+
+@pytest.mark.parametrize("part", [BODY[:1000], BODY, BODY + b"extra"], ids=["partial", "complete", "longer"])
+def test_interrupted_download_is_finished(tmp_path, url, part):
+    output_path = str(tmp_path / "file.bin")
+    leave_part(output_path, url, part)
+    info = build.stream_download(url, output_path)
+    with open(output_path, 'rb') as f:
+        assert f.read() == BODY
+    assert info["sha256"] == hashlib.sha256(BODY).hexdigest() and info["size"] == len(BODY)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["file.bin"]
+    assert RangeHandler.requests[0] == f"bytes={len(part)}-"
+
+
+def test_partial_downloads_are_not_published(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    static = tmp_path / "build" / "apps" / "snake" / "static"
+    static.mkdir(parents=True)
+    for name in ("snake.bin", "game.bin.part", "game.bin.part.json"):
+        (static / name).write_bytes(b"x")
+    (tmp_path / "build" / "apps" / "snake" / "index.json").write_text("{}")
+    blobs = tmp_path / "build" / "blobs"
+    blobs.mkdir()
+    (blobs / "2d711642.bin").write_bytes(b"x")
+    # Keira OS downloads from static/, the blob is an extra copy
+    assert sorted(build.published_files()) == ["apps/snake/index.json", "apps/snake/static/snake.bin",
+                                               "blobs/2d711642.bin"]
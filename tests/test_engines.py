@@ -0,0 +1,29 @@
+"""Cold and warm builds on both engines build the same files, see scripts/compare_engines.py"""
+
+import os
+import sys
+
+import pytest
+
+from conftest import PROJECT_DIR
+
+sys.path.insert(0, os.path.join(PROJECT_DIR, "scripts"))
+
+import benchmark_build  # noqa: E402
+import compare_engines  # noqa: E402
+
+# Local and remote icons and screenshots, an executable file and mod files
+ITEMS = ("apps/arp-scan-lilka", "apps/lilweather", "apps/snake", "mods/hat-caps")
+
+
+@pytest.fixture
+def origin():
+    server = benchmark_build.start_mock_origin(0.0)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_engines_build_the_same_files_cold_and_warm(tmp_path, origin):
+    differences, files = compare_engines.check_engines(str(tmp_path), origin, jobs=2, items=ITEMS, log=lambda _: None)
+    assert files > 0
+    assert differences == []
@@ -0,0 +1,64 @@
+"""Manifests parsed on the process pool are checked the same as parsed inline"""
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import build
+
+MANIFEST = """name: App {i}
+keira_version: 1.0.0
+short_description: Test app {i}
+author: tester
+sources:
+  type: git
+  location:
+    origin: https://github.com/test/app{i}.git
+"""
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    for i in range(build.MANIFEST_BATCH_SIZE + 10):
+        os.makedirs(tmp_path / "apps" / f"app{i}")
+        text = MANIFEST.format(i=i)
+        if i == 3:
+            text = text.replace("name: App 3\n", "")
+        elif i == 5:
+            text = "name: [unclosed\n"
+        elif i == 7:
+            # Dates don't survive a round trip through JSON, they are not cached
+            text += "released: 2024-01-01\n"
+        (tmp_path / "apps" / f"app{i}" / "manifest.yml").write_text(text)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(build, "manifest_cache", {"version": build.MANIFEST_CACHE_VERSION, "manifests": {}})
+    monkeypatch.setattr(build, "validation_cache", {"version": build.VALIDATION_CACHE_VERSION, "manifests": {}})
+    return [(item, "app") for item in sorted(os.listdir("apps"))]
+
+
+def test_pool_parses_like_inline(tree, monkeypatch, capsys):
+    assert build.check_manifest_structures(tree) == 2
+    inline = capsys.readouterr().out.splitlines()[1:]
+    inline_cached = build.manifest_cache["manifests"]
+
+    monkeypatch.setattr(build, "manifest_cache", {"version": build.MANIFEST_CACHE_VERSION, "manifests": {}})
+    monkeypatch.setattr(build, "validation_cache", {"version": build.VALIDATION_CACHE_VERSION, "manifests": {}})
+    monkeypatch.setattr(build, "process_pool_workers", lambda: 2)
+    # Spawned workers import build.py, which parses the command line
+    monkeypatch.setattr(sys, "argv", [build.__file__])
+    pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+    monkeypatch.setattr(build, "image_pool", pool)
+    try:
+        assert build.check_manifest_structures(tree) == 2
+    finally:
+        pool.shutdown()
+    assert capsys.readouterr().out.splitlines()[1:] == inline
+
+    cached = build.manifest_cache["manifests"]
+    assert cached == inline_cached
+    assert len(cached) == len(tree) - 2
+    assert os.path.join("apps", "app5", "manifest.yml") not in cached
+    assert os.path.join("apps", "app7", "manifest.yml") not in cached
@@ -0,0 +1,52 @@
+"""Items that are deleted or stop building between two builds leave build/ and assets.json"""
+
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+from conftest import PROJECT_DIR
+
+sys.path.insert(0, os.path.join(PROJECT_DIR, "scripts"))
+
+import benchmark_build  # noqa: E402
+import compare_engines  # noqa: E402
+
+ITEMS = ("apps/lilweather", "apps/snake", "mods/hat-caps")
+
+
+@pytest.fixture
+def origin():
+    server = benchmark_build.start_mock_origin(0.0)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def published_keys(tree_dir):
+    with open(os.path.join(tree_dir, "build", "assets.json"), 'r', encoding='utf-8') as f:
+        return set(json.load(f)["files"])
+
+
+@pytest.mark.parametrize("engine_args", [[], ["--async"], ["--stream"]], ids=["default", "async", "stream"])
+def test_removed_items_are_pruned(tmp_path, origin, engine_args):
+    tree_dir = str(tmp_path)
+    compare_engines.copy_sources(tree_dir, origin, ITEMS)
+    compare_engines.run_build(tree_dir, engine_args)
+    keys = published_keys(tree_dir)
+    assert "apps/lilweather/index.json" in keys
+    assert "mods/hat-caps/index.json" in keys
+
+    shutil.rmtree(os.path.join(tree_dir, "apps", "lilweather"))
+    # Not a mapping, validation skips the item
+    with open(os.path.join(tree_dir, "mods", "hat-caps", "manifest.yml"), 'w', encoding='utf-8') as f:
+        f.write("- broken\n")
+    compare_engines.run_build(tree_dir, engine_args)
+
+    keys = published_keys(tree_dir)
+    assert not any(key.startswith(("apps/lilweather/", "mods/hat-caps/")) for key in keys)
+    assert not os.path.exists(os.path.join(tree_dir, "build", "apps", "lilweather"))
+    assert not os.path.exists(os.path.join(tree_dir, "build", "mods", "hat-caps"))
+    assert "apps/snake/index.json" in keys
+    assert os.path.isdir(os.path.join(tree_dir, "build", "apps", "pages"))
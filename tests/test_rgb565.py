@@ -0,0 +1,70 @@
+"""The vectorized RGB565 icon encoder against the per-pixel loop it replaced"""
+
+import random
+
+import pytest
+from PIL import Image
+
+import build
+
+
+def reference_min_icon(img, size):
+    """The original generate_min_icon: flatten onto white, resize, then encode pixel by pixel"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        if img.mode in ('RGBA', 'LA'):
+            background.paste(img, mask=img.split()[-1])
+        else:
+            background.paste(img)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    img_resized = img.resize((size, size), Image.Resampling.LANCZOS)
+    pixels = img_resized.load()
+    rgb565_data = bytearray()
+    for y in range(size):
+        for x in range(size):
+            r, g, b = pixels[x, y]
+            rgb565 = (((r >> 3) & 0x1F) << 11) | (((g >> 2) & 0x3F) << 5) | ((b >> 3) & 0x1F)
+            rgb565_data.append(rgb565 & 0xFF)
+            rgb565_data.append((rgb565 >> 8) & 0xFF)
+    return bytes(rgb565_data)
+
+
+def noise_image(mode, size=(97, 83), seed=0):
+    """An image of mode with every channel value and partial transparency present"""
+    rng = random.Random(seed)
+    rgba = Image.frombytes('RGBA', size, bytes(rng.randrange(256) for _ in range(size[0] * size[1] * 4)))
+    if mode == 'P':
+        return rgba.convert('RGB').quantize(colors=200)
+    return rgba.convert(mode)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "P", "LA"])
+@pytest.mark.parametrize("size", [build.MIN_ICON_SIZE, 32, 128])
+def test_encode_min_icons_matches_per_pixel_loop(mode, size):
+    img = noise_image(mode)
+    assert build.encode_min_icons([img], size)[0] == reference_min_icon(img, size)
+
+
+def test_batch_encodes_each_icon_like_alone():
+    images = [noise_image(mode, seed=i) for i, mode in enumerate(["RGB", "RGBA", "L", "P", "LA"])]
+    assert build.encode_min_icons(images) == [build.encode_min_icons([img])[0] for img in images]
+
+
+def test_encode_min_icons_reads_paths(tmp_path):
+    img = noise_image("RGBA")
+    path = tmp_path / "icon.png"
+    img.save(path)
+    assert build.encode_min_icons([str(path)])[0] == reference_min_icon(img, build.MIN_ICON_SIZE)
+
+
+def test_every_rgb565_value_round_trips():
+    # One pixel per RGB565 value, expanded to RGB888 the way the device does
+    values = range(1 << 16)
+    rgb = bytes(channel for v in values for channel in ((v >> 11) << 3, ((v >> 5) & 0x3F) << 2, (v & 0x1F) << 3))
+    img = Image.frombytes('RGB', (256, 256), rgb)
+    assert build.rgb_to_rgb565(img) == b"".join(v.to_bytes(2, 'little') for v in values)
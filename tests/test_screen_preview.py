@@ -0,0 +1,98 @@
+"""LKS1 screenshot previews encoded in every mode and decoded by the reference decoder"""
+
+import random
+
+import pytest
+from PIL import Image
+
+import build
+
+SCREEN = (build.SCREEN_WIDTH, build.SCREEN_HEIGHT)
+
+
+def write_and_read(tmp_path, img, encoding):
+    path = tmp_path / f"{encoding}_screen.bin"
+    info = build.write_screen_preview(img, str(path), encoding)
+    assert info["bytes"] == path.stat().st_size
+    assert tuple(info) == build.SCREEN_PREVIEW_KEYS
+    width, height, pixels = build.read_screen_preview(str(path))
+    assert (width, height) == SCREEN
+    return pixels
+
+
+def photo(size=SCREEN, seed=0):
+    """Smooth gradients with noise: long runs, short runs and far more than 256 colors"""
+    rng = random.Random(seed)
+    img = Image.merge("RGB", (Image.linear_gradient("L").resize(size), Image.radial_gradient("L").resize(size),
+                              Image.effect_noise(size, 64)))
+    for _ in range(200):
+        x, y = rng.randrange(size[0] - 20), rng.randrange(size[1] - 20)
+        img.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)), (x, y, x + rng.randrange(1, 20), y + 3))
+    return img
+
+
+def few_colors(size=SCREEN):
+    """At most 256 distinct RGB565 colors, which the palette mode stores exactly"""
+    return photo(size).quantize(200).convert("RGB")
+
+
+@pytest.mark.parametrize("encoding", ["raw", "rle"])
+def test_lossless_modes_decode_to_the_source_pixels(tmp_path, encoding):
+    img = photo()
+    assert write_and_read(tmp_path, img, encoding) == build.rgb_to_rgb565(img)
+
+
+def test_palette_mode_is_exact_with_up_to_256_colors(tmp_path):
+    img = few_colors()
+    assert write_and_read(tmp_path, img, "palette") == build.rgb_to_rgb565(img)
+
+
+def test_palette_mode_quantizes_more_colors(tmp_path):
+    img = photo()
+    pixels = write_and_read(tmp_path, img, "palette")
+    assert len(set(pixels[i:i + 2] for i in range(0, len(pixels), 2))) <= 256
+    # Every channel stays close to the source
+    decoded = build.rgb565_to_rgb(pixels, *SCREEN)
+    source = build.rgb565_to_rgb(build.rgb_to_rgb565(img), *SCREEN)
+    errors = [abs(a - b) for a, b in zip(decoded.tobytes(), source.tobytes())]
+    assert sum(errors) / len(errors) < 16
+
+
+@pytest.mark.parametrize("encoding", ["raw", "rle", "palette"])
+def test_smaller_images_are_letterboxed_in_black(tmp_path, encoding):
+    img = few_colors((100, 60))
+    screen = Image.new("RGB", SCREEN)
+    screen.paste(img, ((SCREEN[0] - 100) // 2, (SCREEN[1] - 60) // 2))
+    assert write_and_read(tmp_path, img, encoding) == build.rgb_to_rgb565(screen)
+
+
+@pytest.mark.parametrize("encoding", ["raw", "rle", "palette"])
+def test_transparency_is_flattened_onto_white(tmp_path, encoding):
+    img = Image.new("RGBA", SCREEN, (0, 0, 0, 0))
+    img.paste((255, 0, 0, 255), (0, 0, 140, 240))
+    expected = Image.new("RGB", SCREEN, (255, 255, 255))
+    expected.paste((255, 0, 0), (0, 0, 140, 240))
+    assert write_and_read(tmp_path, img, encoding) == build.rgb_to_rgb565(expected)
+
+
+@pytest.mark.parametrize("runs", [
+    [1], [2], [128], [129], [130], [300], [1] * 300, [1, 2] * 100, [129, 1, 1, 258, 3],
+])
+def test_rle_round_trip(runs):
+    pixels = b"".join(value.to_bytes(2, 'little') * count for value, count in enumerate(runs, 1))
+    encoded = build.rle_encode_rgb565(pixels)
+    assert build.rle_decode_rgb565(encoded) == pixels
+    # A literal run costs 1 byte per 128 pixels at most
+    assert len(encoded) <= len(pixels) + -(-len(pixels) // 256)
+
+
+def test_reader_rejects_other_and_truncated_files(tmp_path):
+    path = tmp_path / "screen.bin"
+    build.write_screen_preview(photo(), str(path), "rle")
+    data = path.read_bytes()
+    path.write_bytes(data[:-1])
+    with pytest.raises(ValueError, match="Truncated"):
+        build.read_screen_preview(str(path))
+    path.write_bytes(b"XXXX" + data[4:])
+    with pytest.raises(ValueError, match="Not a screenshot preview"):
+        build.read_screen_preview(str(path))
@@ -0,0 +1,105 @@
+"""--watch updates the index files and assets.json in place, with the same result
+as writing them all again"""
+
+import copy
+import json
+import os
+import sys
+
+import pytest
+
+from conftest import PROJECT_DIR
+
+sys.path.insert(0, os.path.join(PROJECT_DIR, "scripts"))
+
+import build  # noqa: E402
+import benchmark_build  # noqa: E402
+import compare_engines  # noqa: E402
+
+ITEMS = ("apps/arp-scan-lilka", "apps/lilweather", "apps/snake", "apps/tic-tac-toe")
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    server = benchmark_build.start_mock_origin(0.0)
+    compare_engines.copy_sources(str(tmp_path), f"http://127.0.0.1:{server.server_address[1]}", ITEMS)
+    compare_engines.run_build(str(tmp_path), [])
+    server.shutdown()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(build, "_item_update_times", None)
+    # Several pages per ordering
+    monkeypatch.setitem(build.INDEX_PAGE_SIZES, "web", 2)
+    monkeypatch.setitem(build.INDEX_PAGE_SIZES, "device", 1)
+    return tmp_path
+
+
+def index_files():
+    files = {}
+    for root, _, names in os.walk(os.path.join("build", "apps")):
+        for name in names:
+            path = os.path.join(root, name)
+            if os.path.dirname(path) == os.path.join("build", "apps") or root.startswith(
+                    (os.path.join("build", "apps", "pages"), os.path.join("build", "apps", "search"))):
+                with open(path, 'rb') as f:
+                    files[path] = f.read()
+    return files
+
+
+def built_items():
+    items = []
+    for item in sorted(os.listdir("apps")):
+        with open(os.path.join("build", "apps", item, "index.json"), 'r', encoding='utf-8') as f:
+            items.append((item, json.load(f)))
+    return items
+
+
+def renamed(items, item, name):
+    items = copy.deepcopy(items)
+    dict(items)[item]["name"] = name
+    return items
+
+
+def test_updates_match_a_full_write(tree):
+    items = built_items()
+    build.gen_item_indexes(items, "app")
+    updater = build.ItemIndexUpdater("app", items)
+    moved = renamed(items, "snake", "A Snake")
+    tokens = renamed(moved, "lilweather", "Погода")
+    steps = [
+        ("moved in every ordering", moved, ["snake"]),
+        ("new search tokens", tokens, ["lilweather"]),
+        ("removed", [entry for entry in tokens if entry[0] != "tic-tac-toe"], ["tic-tac-toe"]),
+        ("added back", tokens, ["tic-tac-toe"]),
+        ("unchanged", tokens, ["snake"]),
+    ]
+    for step, step_items, rebuilt in steps:
+        paths = updater.update(step_items, rebuilt)
+        updated = index_files()
+        build.gen_item_indexes(step_items, "app")
+        assert updated == index_files(), step
+        if step == "unchanged":
+            assert paths == []
+        elif step.startswith("moved"):
+            # Names and positions didn't change
+            assert not any(os.path.basename(path).startswith("index_") for path in paths)
+
+
+def test_assets_update_matches_a_full_walk(tree):
+    build.gen_assets()
+    changed = [os.path.join("build", "apps", "snake", "index.json"), os.path.join("build", "apps", "snake", "gone.json"),
+               os.path.join("build", "apps", "lilweather")]
+    with open(changed[0], 'a', encoding='utf-8') as f:
+        f.write(" " * 200)
+    with open(os.path.join(changed[2], "new.json"), 'w', encoding='utf-8') as f:
+        f.write("[" + "1," * 100 + "1]")
+    os.remove(os.path.join("build", "apps", "lilweather", "index_short.json"))
+
+    build.gen_assets([os.path.join(".", path) for path in changed])
+    with open(build.ASSETS_PATH, 'r', encoding='utf-8') as f:
+        updated = json.load(f)
+    build.gen_assets()
+    with open(build.ASSETS_PATH, 'r', encoding='utf-8') as f:
+        assert updated == json.load(f)
+    assert "apps/lilweather/new.json" in updated["files"]
+    assert "apps/lilweather/index_short.json" not in updated["files"]
+    assert not os.path.exists(os.path.join("build", "apps", "lilweather", "index_short.json.gz"))